@@ -0,0 +1,380 @@
+from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import psycopg
+from psycopg.types.json import Jsonb
+
+from app.db import execute_query_async, execute_update_async
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with optional per-entry expiry.
+
+    Args:
+        maxsize: Maximum number of entries kept before the least recently used entry is evicted.
+        ttl_s: Seconds an entry stays valid for, or None to keep entries until evicted.
+    """
+    def __init__(self, maxsize: int, ttl_s: Optional[float] = None):
+        if maxsize <= 0:
+            raise ValueError("Cache size must be a positive integer.")
+
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()  # key -> (expiry, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Look up an entry without counting a hit or miss or marking it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl_s: Optional[float] = None):
+        ttl_s = self.ttl_s if ttl_s is None else ttl_s
+        expiry = time.monotonic() + ttl_s if ttl_s is not None else None
+
+        with self._lock:
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
+
+
+class CacheBackend(ABC):
+    """Interface for response caches shared by request handlers."""
+    name = 'base'
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for a key, or None if it is missing or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any):
+        """Cache a value under a key."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Return hit, miss and size counters."""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process cache backend. Fastest, but every worker process keeps its own entries."""
+    name = 'memory'
+
+    def __init__(self, maxsize: int, ttl_s: float):
+        self._cache = LRUCache(maxsize=maxsize, ttl_s=ttl_s)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any):
+        self._cache.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, **self._cache.stats()}
+
+
+class PostgresCacheBackend(CacheBackend):
+    """
+    Cache backend stored in an unlogged Postgres table, shared by every worker and replica.
+    Values must be JSON-serialisable. The table is trimmed to `maxsize` least recently used entries
+    every `trim_every` writes.
+    """
+    name = 'postgres'
+
+    def __init__(self, table: str, maxsize: int, ttl_s: float, trim_every: int = 100):
+        self.table = table
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.trim_every = trim_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    async def setup(self):
+        """Create the cache table if it does not exist yet."""
+        await execute_update_async(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value JSONB NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL,
+                accessed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        await execute_update_async(f"""
+            CREATE INDEX IF NOT EXISTS {self.table}_accessed_at_idx ON {self.table} (accessed_at);
+        """)
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            result = await execute_query_async(f"""
+                UPDATE {self.table}
+                SET accessed_at = now()
+                WHERE key = %s AND expires_at > now()
+                RETURNING value;
+            """, (key,))
+        except psycopg.Error as e:  # Treat an unavailable cache as a miss
+            logger.warning(f"Failed to read from {self.table}: {e}")
+            result = None
+
+        if not result:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return result[0]['value']
+
+    async def set(self, key: str, value: Any):
+        try:
+            await execute_update_async(f"""
+                INSERT INTO {self.table} (key, value, expires_at)
+                VALUES (%s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (key)
+                DO UPDATE SET
+                    value = EXCLUDED.value,
+                    expires_at = EXCLUDED.expires_at,
+                    accessed_at = now();
+            """, (key, Jsonb(value), self.ttl_s))
+
+            self._writes += 1
+            if self._writes % self.trim_every == 0:
+                await self._trim()
+        except psycopg.Error as e:
+            logger.warning(f"Failed to write to {self.table}: {e}")
+
+    async def _trim(self):
+        await execute_update_async(f"""
+            DELETE FROM {self.table}
+            WHERE expires_at <= now()
+            OR key IN (
+                SELECT key FROM {self.table}
+                ORDER BY accessed_at DESC
+                OFFSET %s
+            );
+        """, (self.maxsize,))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'hits': self.hits, 'misses': self.misses, 'maxsize': self.maxsize}
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key, so identical in-flight requests share one computation.
+
+    The computation runs in its own task, so a caller disconnecting does not cancel it for the others.
+    Exceptions are raised to every caller, and nothing is kept once the computation finishes.
+    """
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `func()`, or the call already in flight for `key`.
+
+        Args:
+            key: Identifies calls that produce the same result.
+            func: Zero-argument coroutine function computing the result.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved in case every caller went away
+
+    def stats(self) -> Dict[str, int]:
+        return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._inflight)}
+
+
+class SearchCache:
+    """
+    Caches OneMap search responses per normalised query and page.
+
+    With `prefix_reuse`, a first page missing from the cache can be answered from a cached broader
+    query (a prefix of it, e.g. `orchard` for `orchard rd`) whose results fit on a single page,
+    by keeping the results that contain every word of the refined query. This suits type-ahead
+    search, but only approximates OneMap's own matching, so it is off by default.
+    """
+    def __init__(self, maxsize: int, ttl_s: float, prefix_reuse: bool = False):
+        self._cache = LRUCache(maxsize=maxsize, ttl_s=ttl_s)
+        self.prefix_reuse = prefix_reuse
+        self.prefix_hits = 0
+
+    @staticmethod
+    def normalise_query(query: str) -> str:
+        return ' '.join(query.split()).lower()
+
+    def get(self, query: str, page: int) -> Optional[Dict[str, Any]]:
+        query = self.normalise_query(query)
+        data = self._cache.get((query, page))
+        if data is not None or not self.prefix_reuse or page != 1:
+            return data
+
+        return self._get_from_prefix(query)
+
+    def _get_from_prefix(self, query: str) -> Optional[Dict[str, Any]]:
+        # Longest prefix first, as it has the fewest results to filter
+        for end in range(len(query) - 1, 0, -1):
+            broader = self._cache.peek((query[:end].rstrip(), 1))
+            if broader is None:
+                continue
+            if broader.get('totalNumPages', 1) > 1:  # Shorter prefixes only have more pages
+                return None
+
+            words = query.split()
+            results = [
+                result for result in broader.get('results', [])
+                if all(word in f"{result.get('SEARCHVAL', '')} {result.get('ADDRESS', '')}".lower() for word in words)
+            ]
+            self.prefix_hits += 1
+            return {'found': len(results), 'totalNumPages': 1, 'pageNum': 1, 'results': results}
+
+        return None
+
+    def set(self, query: str, page: int, data: Dict[str, Any]):
+        self._cache.set((self.normalise_query(query), page), data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), 'prefix_hits': self.prefix_hits}
+
+
+def snap_coordinates(value: str, grid_deg: float) -> str:
+    """
+    Snap a `latitude,longitude` string to the nearest point on a grid.
+
+    Args:
+        value: Coordinates in `latitude,longitude` format.
+        grid_deg: Grid spacing in degrees.
+
+    Returns:
+        Snapped coordinates in `latitude,longitude` format, or the stripped input if it cannot be parsed
+    """
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except ValueError:
+        return value.strip()
+
+    return f"{round(lat / grid_deg) * grid_deg:.6f},{round(lon / grid_deg) * grid_deg:.6f}"
+
+
+_route_cache: Optional[CacheBackend] = None
+_search_cache: Optional[SearchCache] = None
+
+
+async def initialize_route_cache(backend: str = 'memory', maxsize: int = 1024, ttl_s: float = 3600):
+    """
+    Create the cache for route responses.
+
+    Args:
+        backend: `memory` for a per-process cache, or `postgres` for a cache shared by every worker.
+        maxsize: Maximum number of cached responses.
+        ttl_s: Seconds a cached response stays valid for.
+    """
+    global _route_cache
+
+    if backend == 'memory':
+        _route_cache = MemoryCacheBackend(maxsize=maxsize, ttl_s=ttl_s)
+    elif backend == 'postgres':
+        cache = PostgresCacheBackend(table='route_cache', maxsize=maxsize, ttl_s=ttl_s)
+        await cache.setup()
+        _route_cache = cache
+    else:
+        raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def close_route_cache():
+    global _route_cache
+    _route_cache = None
+
+
+def get_route_cache() -> CacheBackend:
+    global _route_cache
+
+    if _route_cache is None:
+        _route_cache = MemoryCacheBackend(maxsize=1024, ttl_s=3600)
+    return _route_cache
+
+
+def initialize_search_cache(maxsize: int = 4096, ttl_s: float = 86400, prefix_reuse: bool = False):
+    """
+    Create the per-process cache for search responses.
+
+    Args:
+        maxsize: Maximum number of cached pages.
+        ttl_s: Seconds a cached page stays valid for.
+        prefix_reuse: Whether to answer refined queries from cached broader ones.
+    """
+    global _search_cache
+    _search_cache = SearchCache(maxsize=maxsize, ttl_s=ttl_s, prefix_reuse=prefix_reuse)
+
+
+def close_search_cache():
+    global _search_cache
+    _search_cache = None
+
+
+def get_search_cache() -> SearchCache:
+    global _search_cache
+
+    if _search_cache is None:
+        _search_cache = SearchCache(maxsize=4096, ttl_s=86400)
+    return _search_cache
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,12 +13,53 @@ class Settings(BaseSettings):
     ONEMAP_BASE_URL: str
     ONEMAP_EMAIL: str
     ONEMAP_PASSWORD: str
+    ONEMAP_TOKEN_REFRESH_ENABLED: bool = True  # Renew the OneMap token in the background, before it expires
+    ONEMAP_TOKEN_REFRESH_JITTER_S: int = 60  # Up to this many seconds are taken off each renewal time at random
+    ONEMAP_TOKEN_STORE_PATH: Optional[str] = None  # Share one token across the workers of a host through this file
 
     POSTGRES_HOST: str
     POSTGRES_PORT: str = '5432'
     POSTGRES_DATABASE: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
+    DB_POOL_MIN_SIZE: int = 2  # Per pool, per worker; each worker has a sync and an async pool
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_TIMEOUT_S: float = 5.0  # Requests waiting longer for a connection fail with 503
+    DB_POOL_MAX_WAITING: int = 0  # Requests queued for a connection before new ones fail with 503, or 0 for no limit
+    DB_POOL_MAX_IDLE_S: float = 600.0  # Idle connections above the minimum are closed after this long
+    DB_POOL_MAX_LIFETIME_S: float = 3600.0  # Connections are replaced after this long
+    DB_POOL_CHECK_ENABLED: bool = True  # Check connections are alive before handing them out
+    DB_POOL_WARMUP_TIMEOUT_S: Optional[float] = 10.0  # Wait on startup for the minimum connections to open
+    DB_PREPARED_STATEMENTS_ENABLED: bool = True  # Disable behind a transaction-pooling PgBouncer
+    DB_PREPARE_THRESHOLD: int = 5  # Executions of a query on a connection before it is prepared server side
+
+    PARKING_INDEX_ENABLED: bool = False  # Serve parking spot lookups from an in-memory index
+    PARKING_INDEX_REFRESH_S: int = 300  # Seconds between checks for parking spots table changes
+
+    INGEST_ENABLED: bool = True  # Refresh parking spots data in the background; disable when running `python -m app.ingest`
+    INGEST_INTERVAL_S: int = 86400
+    INGEST_JITTER_S: int = 900  # Up to this many seconds are added to each interval at random
+
+    RESPONSE_COMPRESSION_ENABLED: bool = True  # Brotli (when installed) or gzip, as accepted by the client
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024  # Smaller responses are sent uncompressed
+
+    SERVER_TIMING_ENABLED: bool = False  # Add a per-stage `Server-Timing` breakdown to every response
+    SENTRY_DSN: Optional[str] = None  # Send errors and traces to Sentry when set
+    SENTRY_TRACES_SAMPLE_RATE: float = 0.0
+
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_ENTRIES: int = 4096
+    SEARCH_CACHE_TTL_S: int = 86400
+    SEARCH_CACHE_PREFIX_REUSE: bool = False  # Answer refined type-ahead queries from cached broader ones
+
+    ROUTING_BACKEND: str = 'onemap'  # `onemap` (OneMap routing service) or `local` (A* over ROUTING_GRAPH_PATH)
+    ROUTING_GRAPH_PATH: str = 'data/cycling_network_sample.json'
+
+    ROUTE_CACHE_ENABLED: bool = True
+    ROUTE_CACHE_BACKEND: str = 'memory'  # `memory` (per worker) or `postgres` (shared by all workers)
+    ROUTE_CACHE_MAX_ENTRIES: int = 1024
+    ROUTE_CACHE_TTL_S: int = 3600
+    ROUTE_CACHE_GRID_DEG: float = 0.0005  # Start and end points are snapped to a ~55 m grid
 
     model_config = SettingsConfigDict(env_file=".env")
 
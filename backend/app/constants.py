@@ -2,3 +2,5 @@ AVG_SPEED_M_PER_MIN = 167
 DEFAULT_INTERVAL_MINS = 30
 DEFAULT_SEARCH_RADIUS_M = 500
 EXPANDED_SEARCH_RADIUS_M = 1000
+EARTH_RADIUS_M = 6_371_000
+GEOMETRY_CACHE_MAX_ENTRIES = 256
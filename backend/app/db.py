@@ -1,34 +1,199 @@
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
+import logging
 import os
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 
-from psycopg_pool import ConnectionPool
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
 from dotenv import load_dotenv
 
+from app.metrics import (
+    DB_POOL_WAIT,
+    DB_QUERIES,
+    DB_QUERY_DURATION,
+    REGISTRY,
+    CollectedCounter,
+    Gauge,
+    add_request_timing
+)
+
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 _connection_pool: Optional[ConnectionPool] = None
+_async_connection_pool: Optional[AsyncConnectionPool] = None
 
+# Executions of a query on a connection before psycopg prepares it server side, or None to never prepare
+_prepare_threshold: Optional[int] = 5
 
-def initialize_connection_pool(min_size: int = 2, max_size: int = 10):
-    global _connection_pool
+# Hot queries prepared on their first execution, mapped to the parameters used to warm them up on new connections
+_prepared_statements: Dict[str, Optional[tuple]] = {}
 
-    if _connection_pool is None:
-        connection_string = (
-            f"host={os.getenv('POSTGRES_HOST')} "
-            f"port={os.getenv('POSTGRES_PORT', '5432')} "
-            f"dbname={os.getenv('POSTGRES_DATABASE')} "
-            f"user={os.getenv('POSTGRES_USER')} "
-            f"password={os.getenv('POSTGRES_PASSWORD')}"
+
+class PoolConfig(NamedTuple):
+    """
+    Connection pool settings, shared by the sync and async pools.
+
+    Attributes:
+        min_size: Connections kept open.
+        max_size: Most connections opened at once.
+        timeout_s: Seconds a request waits for a connection before failing with `PoolTimeout`.
+        max_waiting: Most requests queued for a connection before new ones are rejected, or 0 for no limit.
+        max_idle_s: Seconds an idle connection above `min_size` is kept before being closed.
+        max_lifetime_s: Seconds before a connection is replaced, so server-side memory is released.
+        check: Check that a connection is alive before handing it out.
+        warmup_timeout_s: Seconds to wait on startup for `min_size` connections to open, or None to not wait.
+        prepare_threshold: Executions of a query on a connection before it is prepared server side,
+            or None to never prepare (e.g. behind a transaction-pooling PgBouncer).
+    """
+    min_size: int = 2
+    max_size: int = 10
+    timeout_s: float = 5.0
+    max_waiting: int = 0
+    max_idle_s: float = 600.0
+    max_lifetime_s: float = 3600.0
+    check: bool = True
+    warmup_timeout_s: Optional[float] = None
+    prepare_threshold: Optional[int] = 5
+
+    @classmethod
+    def from_settings(cls, settings) -> 'PoolConfig':
+        return cls(
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            timeout_s=settings.DB_POOL_TIMEOUT_S,
+            max_waiting=settings.DB_POOL_MAX_WAITING,
+            max_idle_s=settings.DB_POOL_MAX_IDLE_S,
+            max_lifetime_s=settings.DB_POOL_MAX_LIFETIME_S,
+            check=settings.DB_POOL_CHECK_ENABLED,
+            warmup_timeout_s=settings.DB_POOL_WARMUP_TIMEOUT_S,
+            prepare_threshold=settings.DB_PREPARE_THRESHOLD if settings.DB_PREPARED_STATEMENTS_ENABLED else None
         )
-        
+
+
+def register_prepared_statement(query: str, warmup_params: Optional[tuple] = None):
+    """
+    Prepare a hot query on its first execution on each connection, instead of after `prepare_threshold` executions.
+    Postgres then parses and plans it once per connection rather than on every call.
+
+    Args:
+        query: SQL query string, exactly as passed to `execute_query`.
+        warmup_params: Parameters to execute the query with when a pooled connection is opened,
+            so its plan is ready before traffic arrives. Should be cheap to run, e.g. empty arrays.
+    """
+    _prepared_statements[query] = warmup_params
+
+
+def _prepare(query: str) -> Optional[bool]:
+    """Return the `prepare` argument for executing a query: True if registered, None to follow the threshold."""
+    if _prepare_threshold is None:
+        return False
+    return True if query in _prepared_statements else None
+
+
+def _configure_connection(conn: psycopg.Connection):
+    """Prepare and warm up the registered statements on a new pooled connection."""
+    if _prepare_threshold is None:
+        return
+
+    for query, params in _prepared_statements.items():
+        if params is None:
+            continue
+        try:
+            conn.execute(query, params, prepare=True)
+            conn.commit()
+        except psycopg.Error as e:  # e.g. a schema migration has not run yet, the statement is prepared on first use
+            conn.rollback()
+            logger.warning(f"Failed to warm up prepared statement: {e}")
+
+
+async def _configure_async_connection(conn: psycopg.AsyncConnection):
+    """Async variant of `_configure_connection`."""
+    if _prepare_threshold is None:
+        return
+
+    for query, params in _prepared_statements.items():
+        if params is None:
+            continue
+        try:
+            await conn.execute(query, params, prepare=True)
+            await conn.commit()
+        except psycopg.Error as e:
+            await conn.rollback()
+            logger.warning(f"Failed to warm up prepared statement: {e}")
+
+
+def _get_connection_string() -> str:
+    return (
+        f"host={os.getenv('POSTGRES_HOST')} "
+        f"port={os.getenv('POSTGRES_PORT', '5432')} "
+        f"dbname={os.getenv('POSTGRES_DATABASE')} "
+        f"user={os.getenv('POSTGRES_USER')} "
+        f"password={os.getenv('POSTGRES_PASSWORD')}"
+    )
+
+
+def _pool_kwargs(config: PoolConfig) -> Dict[str, Any]:
+    return {
+        'min_size': config.min_size,
+        'max_size': config.max_size,
+        'timeout': config.timeout_s,
+        'max_waiting': config.max_waiting,
+        'max_idle': config.max_idle_s,
+        'max_lifetime': config.max_lifetime_s,
+        'kwargs': {'prepare_threshold': config.prepare_threshold}
+    }
+
+
+def initialize_connection_pool(config: PoolConfig = PoolConfig()):
+    """
+    Open the connection pool used by sync code, and wait for `config.min_size` connections
+    if `config.warmup_timeout_s` is set so the first requests do not pay for connecting.
+    """
+    global _connection_pool, _prepare_threshold
+
+    if _connection_pool is None:
+        _prepare_threshold = config.prepare_threshold
         _connection_pool = ConnectionPool(
-            connection_string,
-            min_size=min_size,
-            max_size=max_size,
+            _get_connection_string(),
+            **_pool_kwargs(config),
+            check=ConnectionPool.check_connection if config.check else None,
+            configure=_configure_connection,
+            name='sync',
             open=True
         )
 
+        if config.warmup_timeout_s is not None:
+            try:
+                _connection_pool.wait(timeout=config.warmup_timeout_s)
+            except PoolTimeout:  # Connections keep opening in the background, requests wait for them as usual
+                logger.warning(f"Sync connection pool not ready after {config.warmup_timeout_s} s")
+
+
+async def initialize_async_connection_pool(config: PoolConfig = PoolConfig()):
+    """Async variant of `initialize_connection_pool`, used by async request handlers. Must be called from a running event loop."""
+    global _async_connection_pool, _prepare_threshold
+
+    if _async_connection_pool is None:
+        _prepare_threshold = config.prepare_threshold
+        _async_connection_pool = AsyncConnectionPool(
+            _get_connection_string(),
+            **_pool_kwargs(config),
+            check=AsyncConnectionPool.check_connection if config.check else None,
+            configure=_configure_async_connection,
+            name='async',
+            open=False
+        )
+        await _async_connection_pool.open()
+
+        if config.warmup_timeout_s is not None:
+            try:
+                await _async_connection_pool.wait(timeout=config.warmup_timeout_s)
+            except PoolTimeout:
+                logger.warning(f"Async connection pool not ready after {config.warmup_timeout_s} s")
+
 
 def close_connection_pool():
     """Close all connections in the pool."""
@@ -39,11 +204,86 @@ def close_connection_pool():
         _connection_pool = None
 
 
+async def close_async_connection_pool():
+    """Close all connections in the async pool."""
+    global _async_connection_pool
+
+    if _async_connection_pool is not None:
+        await _async_connection_pool.close()
+        _async_connection_pool = None
+
+
+async def open_async_db_connection(autocommit: bool = True) -> psycopg.AsyncConnection:
+    """
+    Open a dedicated async connection outside the pool, for long-lived sessions (e.g. holding advisory locks)
+    that would otherwise tie up a pooled connection. The caller is responsible for closing it.
+    """
+    return await psycopg.AsyncConnection.connect(_get_connection_string(), autocommit=autocommit)
+
+
+def get_pool_stats() -> Dict[str, Dict[str, int]]:
+    """Current size, usage and error counters of each open pool, keyed by pool name."""
+    return {
+        pool.name: pool.get_stats()
+        for pool in (_connection_pool, _async_connection_pool)
+        if pool is not None
+    }
+
+
+def _collect_pool_stats(*keys: str) -> Dict[Tuple[str, ...], float]:
+    """Read pool statistics as metric values labelled by pool, and by statistic when several keys are given."""
+    values = {}
+    for pool, stats in get_pool_stats().items():
+        for key in keys:
+            labels = (pool, key) if len(keys) > 1 else (pool,)
+            values[labels] = stats.get(key, 0)  # Counters are left out of the stats until they are first incremented
+    return values
+
+
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    'pitstop_db_pool_connections', 'Connections in each pool: open (`pool_size`), idle (`pool_available`) and limits.',
+    ('pool', 'state'), collect=lambda: _collect_pool_stats('pool_size', 'pool_available', 'pool_min', 'pool_max')
+))
+DB_POOL_REQUESTS_WAITING = REGISTRY.register(Gauge(
+    'pitstop_db_pool_requests_waiting', 'Requests currently queued for a connection.',
+    ('pool',), collect=lambda: _collect_pool_stats('requests_waiting')
+))
+DB_POOL_REQUESTS = REGISTRY.register(CollectedCounter(
+    'pitstop_db_pool_requests_total', 'Connections requested from each pool.',
+    ('pool',), collect=lambda: _collect_pool_stats('requests_num')
+))
+DB_POOL_ERRORS = REGISTRY.register(CollectedCounter(
+    'pitstop_db_pool_errors_total',
+    'Pool errors: requests timed out or rejected (`requests_errors`), failed connection attempts and connections lost.',
+    ('pool', 'kind'), collect=lambda: _collect_pool_stats('requests_errors', 'connections_errors', 'connections_lost')
+))
+
+
+def _record_pool_wait(pool: str, start: float):
+    wait_s = time.perf_counter() - start
+    DB_POOL_WAIT.observe(wait_s, pool)
+    add_request_timing('db.pool_wait', wait_s)
+
+
+@contextmanager
+def _timed_statement(operation: str):
+    """Count and time a statement as `operation` (`query` or `update`)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_s = time.perf_counter() - start
+        DB_QUERIES.inc(operation)
+        DB_QUERY_DURATION.observe(duration_s, operation)
+        add_request_timing(f'db.{operation}', duration_s)
+
+
 @contextmanager
 def get_db_connection():
     """
     Context manager for database connections.
     Automatically returns connection to pool after use.
+    Raises `PoolTimeout` if no connection frees up within the pool timeout.
     
     Yields:
         psycopg connection object
@@ -54,9 +294,34 @@ def get_db_connection():
             cursor.execute("SELECT * FROM parking_spots")
     """
     if _connection_pool is None:
-        initialize_connection_pool()
-    
+        raise RuntimeError("Connection pool is not initialized. Call initialize_connection_pool() on startup.")
+
+    start = time.perf_counter()
     with _connection_pool.connection() as conn:
+        _record_pool_wait('sync', start)
+        yield conn
+
+
+@asynccontextmanager
+async def get_async_db_connection():
+    """
+    Async context manager for database connections.
+    Automatically returns connection to pool after use.
+    Raises `PoolTimeout` if no connection frees up within the pool timeout.
+
+    Yields:
+        psycopg async connection object
+
+    Example:
+        async with get_async_db_connection() as conn:
+            cursor = await conn.execute("SELECT * FROM parking_spots")
+    """
+    if _async_connection_pool is None:
+        raise RuntimeError("Async connection pool is not initialized. Call initialize_async_connection_pool() on startup.")
+
+    start = time.perf_counter()
+    async with _async_connection_pool.connection() as conn:
+        _record_pool_wait('async', start)
         yield conn
 
 
@@ -78,17 +343,34 @@ def execute_query(query: str, params: tuple = None) -> List[Dict[str, Any]]:
         )
     """
     with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(query, params)
-            
-            # Get column names
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            
-            # Fetch all rows and convert to dictionaries
-            rows = cursor.fetchall()
-            results = [dict(zip(columns, row)) for row in rows]
-            
-            return results
+        # Rows are built as dictionaries by psycopg as they are read, rather than converted afterwards
+        with conn.cursor(row_factory=dict_row) as cursor, _timed_statement('query'):
+            cursor.execute(query, params, prepare=_prepare(query))
+            return cursor.fetchall() if cursor.description else []
+
+
+async def execute_query_async(query: str, params: tuple = None) -> List[Dict[str, Any]]:
+    """
+    Execute a SELECT query without blocking the event loop and return results as list of dictionaries.
+
+    Args:
+        query: SQL query string
+        params: Query parameters tuple
+
+    Returns:
+        List of dictionaries with column names as keys
+
+    Example:
+        results = await execute_query_async(
+            "SELECT * FROM parking_spots WHERE id = %s",
+            (123,)
+        )
+    """
+    async with get_async_db_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            with _timed_statement('query'):
+                await cursor.execute(query, params, prepare=_prepare(query))
+                return await cursor.fetchall() if cursor.description else []
 
 
 def execute_update(query: str, params: tuple = None) -> int:
@@ -109,7 +391,26 @@ def execute_update(query: str, params: tuple = None) -> int:
         )
     """
     with get_db_connection() as conn:
-        with conn.cursor() as cursor:
+        with conn.cursor() as cursor, _timed_statement('update'):
             cursor.execute(query, params)
             conn.commit()
             return cursor.rowcount
+
+
+async def execute_update_async(query: str, params: tuple = None) -> int:
+    """
+    Execute an INSERT, UPDATE, or DELETE query without blocking the event loop.
+
+    Args:
+        query: SQL query string
+        params: Query parameters tuple
+
+    Returns:
+        Number of rows affected
+    """
+    async with get_async_db_connection() as conn:
+        async with conn.cursor() as cursor:
+            with _timed_statement('update'):
+                await cursor.execute(query, params)
+                await conn.commit()
+            return cursor.rowcount
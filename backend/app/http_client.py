@@ -0,0 +1,45 @@
+from typing import Optional
+
+import httpx
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def initialize_http_client(
+    max_connections: int = 200,
+    max_keepalive_connections: int = 50,
+    keepalive_expiry_s: float = 60.0,
+    timeout_s: float = 30.0
+):
+    """
+    Create the shared async HTTP client for upstream API calls.
+    Connections are kept alive and multiplexed over HTTP/2 where the server supports it,
+    so requests skip repeated TCP and TLS handshakes.
+    """
+    global _http_client
+
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry_s
+            ),
+            timeout=timeout_s
+        )
+
+
+async def close_http_client():
+    """Close the shared HTTP client and all of its connections."""
+    global _http_client
+
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _http_client is None:
+        initialize_http_client()
+    return _http_client
@@ -0,0 +1,171 @@
+"""
+Background ingestion of parking spots data from LTA DataMall.
+
+Runs the fetch and load scripts on a schedule, so the API serves from the existing table while
+fresh data is ingested. An advisory lock ensures only one worker or replica ingests at a time.
+
+Can also be run as a standalone worker instead of inside the API process:
+    python -m app.ingest          # Ingest on a schedule
+    python -m app.ingest --once   # Ingest once and exit
+"""
+
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+import random
+import sys
+
+import psycopg
+
+from app.config import get_settings
+from app.db import (
+    PoolConfig,
+    close_async_connection_pool,
+    execute_query_async,
+    initialize_async_connection_pool,
+    open_async_db_connection
+)
+
+logger = logging.getLogger(__name__)
+
+SCRIPTS_PATH = Path(__file__).resolve().parent.parent / 'scripts'
+INGEST_SCRIPTS = ('fetch_parking_spots.py', 'load_parking_spots.py')
+INGEST_LOCK_ID = 0x50495453  # Arbitrary key shared by every process ingesting into the same database
+
+
+async def run_ingest() -> bool:
+    """
+    Fetch and load parking spots data, unless another process is already ingesting.
+
+    Returns:
+        True if the ingest ran, False if another process holds the ingest lock
+
+    Raises:
+        RuntimeError: If a script exits with an error
+    """
+    conn = await open_async_db_connection()
+    try:
+        cursor = await conn.execute("SELECT pg_try_advisory_lock(%s);", (INGEST_LOCK_ID,))
+        if not (await cursor.fetchone())[0]:
+            logger.info("Parking spots ingest already running elsewhere, skipping")
+            return False
+
+        # The lock is released when the connection closes, even if this process dies mid-ingest
+        for script in INGEST_SCRIPTS:
+            await _run_script(script)
+        return True
+    finally:
+        await conn.close()
+
+
+async def upgrade_schema():
+    """
+    Add the columns, indexes and tables that parking spot queries rely on to databases created before them.
+    Run on API startup, as the next ingest may be a day away. Nothing is locked if the schema is up to date.
+
+    Raises:
+        RuntimeError: If the upgrade fails
+    """
+    await _run_script('load_parking_spots.py', '--schema-only')
+
+
+async def _run_script(script: str, *args: str):
+    logger.info(f"Running {script}")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        str(SCRIPTS_PATH / script),
+        *args,
+        cwd=SCRIPTS_PATH.parent
+    )
+
+    try:
+        returncode = await process.wait()
+    except asyncio.CancelledError:  # Do not leave the script running after shutdown
+        process.terminate()
+        await process.wait()
+        raise
+
+    if returncode != 0:
+        raise RuntimeError(f"{script} exited with code {returncode}")
+
+
+async def is_parking_spots_empty() -> bool:
+    result = await execute_query_async("SELECT NOT EXISTS (SELECT 1 FROM parking_spots) AS empty;")
+    return result[0]['empty']
+
+
+async def is_schema_current() -> bool:
+    """Check that the columns, index and table added since the parking spots table was first created exist."""
+    result = await execute_query_async("""
+        SELECT
+            (
+                SELECT count(*) FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'parking_spots'
+                    AND column_name IN ('fingerprint', 'geog')
+            ) = 2
+            AND to_regclass('parking_spots_geog_idx') IS NOT NULL
+            AND to_regclass('parking_spots_version') IS NOT NULL AS current;
+    """)
+    return result[0]['current']
+
+
+async def run_ingest_scheduler(interval_s: float, jitter_s: float):
+    """
+    Ingest parking spots data every `interval_s` seconds, plus up to `jitter_s` seconds of random delay
+    so replicas started together do not all contend for the lock at once.
+    Ingests immediately if the parking spots table is empty, its schema is out of date or it cannot be checked.
+
+    Args:
+        interval_s: Seconds between ingests.
+        jitter_s: Maximum random delay added to each interval in seconds.
+    """
+    try:
+        ingest_now = await is_parking_spots_empty() or not await is_schema_current()
+    except Exception as e:  # Rather than wait a full interval for data or a schema upgrade that may be missing
+        logger.warning(f"Failed to check parking spots table: {e}")
+        ingest_now = True
+
+    while True:
+        if not ingest_now:
+            await asyncio.sleep(interval_s + random.uniform(0, jitter_s))
+        ingest_now = False
+
+        try:
+            await upgrade_schema()  # Before the fetch, which may fail and keep the loader from upgrading it
+            await run_ingest()
+        except Exception:  # Retry at the next interval, an unexpected error must not stop ingests for good
+            logger.exception("Parking spots ingest failed")
+
+
+async def _run_worker(once: bool, interval_s: float, jitter_s: float, pool_config: PoolConfig):
+    # The ingest needs few connections, it mostly holds a dedicated one for its advisory lock
+    await initialize_async_connection_pool(pool_config._replace(min_size=1, max_size=2))
+    try:
+        if once:
+            await run_ingest()
+        else:
+            await run_ingest_scheduler(interval_s, jitter_s)
+    finally:
+        await close_async_connection_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest parking spots data from LTA DataMall.')
+    parser.add_argument('--once', action='store_true', help='Ingest once and exit instead of running on a schedule')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    settings = get_settings()
+
+    try:
+        asyncio.run(_run_worker(
+            args.once, settings.INGEST_INTERVAL_S, settings.INGEST_JITTER_S, PoolConfig.from_settings(settings)
+        ))
+    except (psycopg.Error, RuntimeError, OSError) as e:
+        logger.error(f"Parking spots ingest failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,111 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
+import logging
 
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+import sentry_sdk
 
+from app.cache import (
+    initialize_route_cache,
+    close_route_cache,
+    get_route_cache,
+    initialize_search_cache,
+    close_search_cache,
+    get_search_cache
+)
+from app.compression import CompressionMiddleware
 from app.config import get_settings
-from app.db import initialize_connection_pool, close_connection_pool
+from app.db import (
+    PoolConfig,
+    initialize_connection_pool,
+    close_connection_pool,
+    initialize_async_connection_pool,
+    close_async_connection_pool,
+    get_pool_stats
+)
+from app.http_client import initialize_http_client, close_http_client
+from app.ingest import run_ingest_scheduler, upgrade_schema
+from app.metrics import REGISTRY, format_server_timing, start_request_timings
+from app.onemap import initialize_api_key_manager
+from app.routing import initialize_routing_backend, close_routing_backend
+from app.utils.spatial_index import (
+    initialize_parking_spot_index,
+    close_parking_spot_index,
+    refresh_parking_spot_index
+)
 from app.versions.v1 import router as v1_router
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+if settings.SENTRY_DSN:
+    sentry_sdk.init(dsn=settings.SENTRY_DSN, traces_sample_rate=settings.SENTRY_TRACES_SAMPLE_RATE)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    initialize_connection_pool()
+    # Before the pools open, so new connections can warm up queries on the upgraded schema
+    try:
+        await upgrade_schema()
+    except (RuntimeError, OSError) as e:  # Serve anyway, every ingest upgrades the schema too
+        logger.error(f"Failed to upgrade database schema: {e}")
+
+    pool_config = PoolConfig.from_settings(settings)
+    initialize_connection_pool(pool_config)
+    await initialize_async_connection_pool(pool_config)
+    initialize_http_client()
+
+    token_task = None
+    api_key_manager = initialize_api_key_manager(token_store_path=settings.ONEMAP_TOKEN_STORE_PATH)
+    if settings.ONEMAP_TOKEN_REFRESH_ENABLED:
+        await api_key_manager.refresh_async()  # Fetched before serving, so the first requests do not wait on it
+        token_task = asyncio.create_task(api_key_manager.run_refresher(jitter_s=settings.ONEMAP_TOKEN_REFRESH_JITTER_S))
+
+    initialize_routing_backend(backend=settings.ROUTING_BACKEND, graph_path=settings.ROUTING_GRAPH_PATH)
+    await initialize_route_cache(
+        backend=settings.ROUTE_CACHE_BACKEND,
+        maxsize=settings.ROUTE_CACHE_MAX_ENTRIES,
+        ttl_s=settings.ROUTE_CACHE_TTL_S
+    )
+    initialize_search_cache(
+        maxsize=settings.SEARCH_CACHE_MAX_ENTRIES,
+        ttl_s=settings.SEARCH_CACHE_TTL_S,
+        prefix_reuse=settings.SEARCH_CACHE_PREFIX_REUSE
+    )
+
+    refresh_task = None
+    if settings.PARKING_INDEX_ENABLED:
+        initialize_parking_spot_index()
+        refresh_task = asyncio.create_task(refresh_parking_spot_index(settings.PARKING_INDEX_REFRESH_S))
+
+    ingest_task = None
+    if settings.INGEST_ENABLED:
+        ingest_task = asyncio.create_task(run_ingest_scheduler(settings.INGEST_INTERVAL_S, settings.INGEST_JITTER_S))
+
     yield
+
+    if token_task is not None:
+        token_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await token_task
+
+    if ingest_task is not None:
+        ingest_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await ingest_task
+
+    if refresh_task is not None:
+        refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresh_task
+        close_parking_spot_index()
+
+    close_search_cache()
+    close_route_cache()
+    close_routing_backend()
+    await close_http_client()
+    await close_async_connection_pool()
     close_connection_pool()
 
 app = FastAPI(
@@ -31,12 +123,49 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+if settings.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE)
+
 app.include_router(router=v1_router)
 
 
+@app.middleware('http')
+async def server_timing(request: Request, call_next):
+    timings = start_request_timings()
+    response = await call_next(request)
+
+    if settings.SERVER_TIMING_ENABLED and timings:
+        response.headers['Server-Timing'] = format_server_timing(timings)
+    return response
+
+
 @app.get('/health', tags=['Health'])
 def health_check():
     return JSONResponse(
         content={"message": f"{settings.APP_TITLE} is running"},
         status_code=status.HTTP_200_OK
     )
+
+
+@app.get('/health/cache', tags=['Health'])
+def cache_stats():
+    return JSONResponse(
+        content={'routes': get_route_cache().stats(), 'search': get_search_cache().stats()},
+        status_code=status.HTTP_200_OK
+    )
+
+
+@app.get('/health/db', tags=['Health'])
+def db_pool_stats():
+    return JSONResponse(
+        content=get_pool_stats(),
+        status_code=status.HTTP_200_OK
+    )
+
+
+@app.get('/metrics', tags=['Health'])
+def metrics():
+    return PlainTextResponse(
+        content=REGISTRY.render(),
+        media_type='text/plain; version=0.0.4'
+    )
@@ -0,0 +1,248 @@
+"""
+Minimal in-process metrics, exposed in the Prometheus text format by `/metrics`.
+
+Stages of the request hot path are timed with `timed()`, which records the duration in a histogram,
+adds it to the `Server-Timing` breakdown of the current request and, when Sentry is configured,
+wraps it in a trace span. Metrics are per worker process.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import sentry_sdk
+except ImportError:  # Tracing is optional
+    sentry_sdk = None
+
+DEFAULT_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels."""
+    type = 'counter'
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [
+                f'{self.name}{_format_labels(self.label_names, labels)} {value}'
+                for labels, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, optionally split by labels."""
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS_S
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._values: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * (len(self.buckets) + 2)
+
+            # Only the first matching bucket is counted here, buckets are accumulated on render
+            bucket = bisect_left(self.buckets, value)
+            if bucket < len(self.buckets):
+                entry[bucket] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def count(self, *label_values: str) -> int:
+        entry = self._values.get(label_values)
+        return entry[-1] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for labels, entry in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, entry):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}')
+                le = 'le="+Inf"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {entry[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {entry[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {entry[-1]}')
+        return lines
+
+
+class Gauge:
+    """
+    Value that can go up and down, optionally split by labels.
+    With `collect`, values are read from another component (e.g. a connection pool) whenever metrics are rendered.
+    """
+    type = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.collect = collect
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        if self.collect is not None:
+            values = self.collect()
+        else:
+            with self._lock:
+                values = dict(self._values)
+
+        return [
+            f'{self.name}{_format_labels(self.label_names, labels)} {value}'
+            for labels, value in sorted(values.items())
+        ]
+
+
+class CollectedCounter(Gauge):
+    """Running total kept by another component, read whenever metrics are rendered."""
+    type = 'counter'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.register(Histogram(
+    'pitstop_stage_duration_seconds', 'Time spent in each stage of request handling.', ('stage',)
+))
+DB_QUERIES = REGISTRY.register(Counter(
+    'pitstop_db_queries_total', 'Database statements executed.', ('operation',)
+))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    'pitstop_db_query_duration_seconds', 'Time spent executing database statements.', ('operation',)
+))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    'pitstop_db_pool_wait_seconds', 'Time spent waiting for a connection from the pool.', ('pool',)
+))
+
+# Durations recorded during the current request, as (stage, seconds) pairs
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_timings', default=None)
+
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    """Start collecting stage durations for the current request. Must be called before any stage runs."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def add_request_timing(stage: str, duration_s: float):
+    """
+    Add a duration to the current request's `Server-Timing` breakdown, if one is being collected.
+
+    Args:
+        stage: Name of the stage shown in the header.
+        duration_s: Duration in seconds.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, duration_s))  # list.append is atomic, so threadpool stages can record safely
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Time a stage of request handling.
+
+    Example:
+        with timed('onemap.route'):
+            response = await client.get(url)
+    """
+    tracing = sentry_sdk is not None and sentry_sdk.is_initialized()
+    start = time.perf_counter()
+    try:
+        if tracing:
+            with sentry_sdk.start_span(op=stage):
+                yield
+        else:
+            yield
+    finally:
+        duration_s = time.perf_counter() - start
+        STAGE_DURATION.observe(duration_s, stage)
+        add_request_timing(stage, duration_s)
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    Format request timings as a `Server-Timing` header value.
+    Stages that ran several times (e.g. once per route) are summed, with the number of runs in the description.
+    """
+    totals: Dict[str, List[float]] = {}
+    for stage, duration_s in timings:
+        total = totals.setdefault(stage, [0.0, 0])
+        total[0] += duration_s
+        total[1] += 1
+
+    return ', '.join(
+        f'{stage};dur={duration_s * 1000:.2f}' + (f';desc="{count}x"' if count > 1 else '')
+        for stage, (duration_s, count) in totals.items()
+    )
@@ -1,41 +1,185 @@
+"""
+OneMap API token, renewed in the background so requests never wait on a token fetch.
+
+`ApiKeyManager.run_refresher` renews the token `REFRESH_BUFFER_S` seconds before it expires, less a random
+jitter, and retries failed fetches with exponential backoff. With a `FileTokenStore`, the workers of a host
+share one token: the first worker to take the file lock fetches it, the others read it from the file.
+"""
+
+import asyncio
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import json
+import logging
+import os
+from pathlib import Path
+import random
 import threading
-from typing import Optional
+from typing import Iterator, Optional, Tuple
 
-from fastapi import HTTPException, status
 import requests
+from starlette.concurrency import run_in_threadpool
 
 from app.config import get_settings
+from app.metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where the token cannot be shared across workers
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUnavailableError(Exception):
+    """Raised when no valid OneMap token is cached and a new one cannot be fetched."""
+
+
+class FileTokenStore:
+    """Token shared by the workers of a host through a JSON file, written under an exclusive file lock."""
+
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise RuntimeError("Sharing the OneMap token through a file requires fcntl")
+
+        self.path = Path(path)
+        self._lock_path = self.path.with_name(self.path.name + '.lock')
+
+    def read(self) -> Optional[Tuple[str, datetime]]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data['access_token'], datetime.fromtimestamp(int(data['expiry_timestamp']))
+        except (OSError, ValueError, KeyError):  # Not written yet, or by an older version
+            return None
+
+    def write(self, key: str, expiry_datetime: datetime):
+        # Written to a temporary file and renamed, so readers never see a partial token
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'access_token': key, 'expiry_timestamp': int(expiry_datetime.timestamp())}, f)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the store's lock, blocking until other workers release it."""
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 class ApiKeyManager:
-    def __init__(self):
+    def __init__(self, store: Optional[FileTokenStore] = None):
         self._key: Optional[str] = None
         self._expiry_datetime: Optional[datetime] = None
         self._lock = threading.Lock()
-        self.REFRESH_BUFFER_S = 300
+        self._store = store
+        self.REFRESH_BUFFER_S = 300  # Renewed in the background this long before expiry
+        self.EXPIRY_MARGIN_S = 30  # Requests treat the token as expired this long before expiry
+
+    def _is_fresh(self, buffer_s: float) -> bool:
+        return bool(
+            self._key and self._expiry_datetime
+            and datetime.now() < (self._expiry_datetime - timedelta(seconds=buffer_s))
+        )
 
     def get_api_key(self) -> str:
-        current_datetime = datetime.now()
+        """
+        Return the cached key, renewing it first if it is about to expire.
 
-        # Check if current key is valid
-        if self._key and self._expiry_datetime:
-            if current_datetime < (self._expiry_datetime - timedelta(seconds=self.REFRESH_BUFFER_S)):
-                return self._key
+        Raises:
+            TokenUnavailableError: If the key had to be renewed and the fetch failed.
+        """
+        if self._is_fresh(self.EXPIRY_MARGIN_S):
+            return self._key
 
-        # Refresh with lock
+        # Only reached if the background refresher is not running or has been failing. Renewed like the
+        # refresher does, so workers sharing a store still fetch one token between them
         with self._lock:
-            if self._key and self._expiry_datetime:
-                if current_datetime < (self._expiry_datetime):
-                    return self._key
-            self._refresh_api_key()
+            try:
+                self.refresh_if_needed()
+            except (requests.RequestException, KeyError, ValueError, OSError) as e:
+                raise TokenUnavailableError(f"Failed to fetch OneMap token: {e}") from e
+            return self._key
+
+    async def get_api_key_async(self) -> str:
+        """Return the cached key, refreshing it in a worker thread so the event loop is never blocked."""
+        if self._is_fresh(self.EXPIRY_MARGIN_S):
             return self._key
 
+        return await run_in_threadpool(self.get_api_key)
 
-    def _refresh_api_key(self):
-        settings = get_settings()
+    def refresh_if_needed(self):
+        """
+        Renew the token if it is within `REFRESH_BUFFER_S` of expiry.
+        With a store, a token already renewed by another worker is used instead of fetching a new one.
+        """
+        self._load_from_store()
+        if self._is_fresh(self.REFRESH_BUFFER_S):
+            return
 
+        if self._store is None:
+            self._set_api_key(*self._fetch_api_key())
+            return
+
+        with self._store.locked():
+            self._load_from_store()  # Another worker may have renewed it while this one waited for the lock
+            if not self._is_fresh(self.REFRESH_BUFFER_S):
+                key, expiry_datetime = self._fetch_api_key()
+                self._store.write(key, expiry_datetime)
+                self._set_api_key(key, expiry_datetime)
+
+    async def refresh_async(self) -> bool:
+        """Renew the token if needed in a worker thread. Returns False, after logging the error, if the fetch failed."""
         try:
+            await run_in_threadpool(self.refresh_if_needed)
+            return True
+        except (requests.RequestException, KeyError, ValueError, OSError) as e:
+            logger.warning(f"OneMap token refresh failed: {e}")
+            return False
+
+    async def run_refresher(self, jitter_s: float = 60, min_backoff_s: float = 5, max_backoff_s: float = 300):
+        """
+        Keep the token renewed until cancelled.
+
+        Args:
+            jitter_s: Up to this many seconds are taken off each renewal time at random,
+                so workers sharing a store do not all wake at once.
+            min_backoff_s: Delay before retrying the first failed fetch, doubled after each further failure.
+            max_backoff_s: Longest delay between retries.
+        """
+        backoff_s = min_backoff_s
+        while True:
+            if await self.refresh_async():
+                backoff_s = min_backoff_s
+                refresh_datetime = self._expiry_datetime - timedelta(seconds=self.REFRESH_BUFFER_S)
+                delay_s = (refresh_datetime - datetime.now()).total_seconds() - random.uniform(0, jitter_s)
+            else:
+                delay_s = backoff_s + random.uniform(0, backoff_s)
+                backoff_s = min(backoff_s * 2, max_backoff_s)
+
+            await asyncio.sleep(max(delay_s, 1))
+
+    def _load_from_store(self):
+        if self._store is None:
+            return
+
+        stored = self._store.read()
+        if stored is not None and (self._expiry_datetime is None or stored[1] > self._expiry_datetime):
+            self._set_api_key(*stored)
+
+    def _set_api_key(self, key: str, expiry_datetime: datetime):
+        self._key = key
+        self._expiry_datetime = expiry_datetime
+
+    def _fetch_api_key(self) -> Tuple[str, datetime]:
+        settings = get_settings()
+
+        with timed('onemap.token_refresh'):
             response = requests.post(
                 'https://www.onemap.gov.sg/api/auth/post/getToken',
                 json={
@@ -44,20 +188,29 @@ class ApiKeyManager:
                 },
                 timeout=10
             )
-            response.raise_for_status()
-            data = response.json()
+        response.raise_for_status()
+        data = response.json()
 
-            self._key = data['access_token']
-            expiry_s = int(data['expiry_timestamp'])
-            self._expiry_datetime = datetime.fromtimestamp(expiry_s)
-        except requests.RequestException as e:
-            self._key = None
-            self._expiry_datetime = None
-            raise HTTPException(status_code=status.HTTP_503, detail=e)
+        return data['access_token'], datetime.fromtimestamp(int(data['expiry_timestamp']))
 
 
 _api_key_manager: Optional[ApiKeyManager] = None
 
+
+def initialize_api_key_manager(token_store_path: Optional[str] = None) -> ApiKeyManager:
+    """
+    Create the OneMap token manager.
+
+    Args:
+        token_store_path: File through which the workers of a host share one token, or None for a token per worker.
+    """
+    global _api_key_manager
+
+    store = FileTokenStore(token_store_path) if token_store_path else None
+    _api_key_manager = ApiKeyManager(store=store)
+    return _api_key_manager
+
+
 def get_api_key_manager() -> ApiKeyManager:
     global _api_key_manager
     if _api_key_manager is None:
@@ -0,0 +1,101 @@
+"""
+Response encodings negotiated from the request's `Accept` header.
+
+- `application/json` (default), encoded with orjson when it is installed
+- `application/msgpack`, a compact binary encoding for clients on slow networks, when msgpack is installed
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request, status
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is only offered when installed
+    msgpack = None
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+def encode_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    """Parse an `Accept` header into (media type, quality) pairs, most preferred first."""
+    media_ranges = []
+    for part in accept.split(','):
+        media_type, *params = (token.strip() for token in part.split(';'))
+        if not media_type:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_ranges.append((media_type.lower(), quality))
+
+    return sorted(media_ranges, key=lambda media_range: -media_range[1])  # Stable, so ties keep header order
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """
+    Choose the response media type for an `Accept` header.
+
+    Returns:
+        `application/msgpack` if the client prefers it and msgpack is installed, otherwise `application/json`
+    """
+    for media_type, quality in _parse_accept(accept or ''):
+        if quality <= 0:
+            continue
+        if media_type in MSGPACK_MEDIA_TYPES and msgpack is not None:
+            return MSGPACK_MEDIA_TYPE
+        if media_type in (JSON_MEDIA_TYPE, 'application/*', '*/*'):
+            return JSON_MEDIA_TYPE
+
+    return JSON_MEDIA_TYPE
+
+
+def negotiated_response(
+    request: Request,
+    content: Any,
+    status_code: int = status.HTTP_200_OK,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Encode content in the format preferred by the client.
+
+    Args:
+        request: Incoming request, whose `Accept` header selects the encoding.
+        content: JSON-compatible content.
+        status_code: Response status code.
+        headers: Additional response headers.
+    """
+    media_type = negotiate_media_type(request.headers.get('accept'))
+    body = encode_msgpack(content) if media_type == MSGPACK_MEDIA_TYPE else encode_json(content)
+
+    return Response(
+        content=body,
+        status_code=status_code,
+        headers={**(headers or {}), 'Vary': 'Accept'},
+        media_type=media_type
+    )
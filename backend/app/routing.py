@@ -0,0 +1,307 @@
+"""
+Routing backends producing cycling routes in OneMap's response format, as consumed by `transform_route_data`.
+
+- `OneMapRoutingBackend` calls OneMap's routing service.
+- `LocalRoutingBackend` runs A* over a cycling network graph loaded into memory, so routes can be
+  served without OneMap's latency, rate limits or outages.
+"""
+
+from abc import ABC, abstractmethod
+import heapq
+import json
+import logging
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import polyline
+from starlette.concurrency import run_in_threadpool
+
+from app.config import get_settings
+from app.constants import AVG_SPEED_M_PER_MIN
+from app.http_client import get_http_client
+from app.metrics import timed
+from app.onemap import ApiKeyManager, get_api_key_manager
+from app.utils.geometry import haversine_m
+
+logger = logging.getLogger(__name__)
+
+MAX_SNAP_DISTANCE_M = 500  # Start and end points further than this from the network have no route
+
+
+class RouteNotFoundError(Exception):
+    """Raised when a routing backend cannot connect the start and end points."""
+
+
+class InvalidCoordinatesError(ValueError):
+    """Raised when coordinates are not in `latitude,longitude` format or are out of range."""
+
+
+class RoutingBackend(ABC):
+    """Interface for services that find cycling routes."""
+    name = 'base'
+
+    @abstractmethod
+    async def route(self, start: str, end: str) -> Dict:
+        """
+        Find a cycling route.
+
+        Args:
+            start: Starting coordinates in `latitude,longitude` format.
+            end: Ending coordinates in `latitude,longitude` format.
+
+        Returns:
+            Route in OneMap's response format, with any alternatives under `alternativeroute`
+        """
+
+
+class OneMapRoutingBackend(RoutingBackend):
+    name = 'onemap'
+
+    def __init__(self, base_url: str, api_key_manager: ApiKeyManager):
+        self.base_url = base_url
+        self.api_key_manager = api_key_manager
+
+    async def route(self, start: str, end: str) -> Dict:
+        with timed('onemap.token'):
+            token = await self.api_key_manager.get_api_key_async()
+        with timed('onemap.route'):
+            response = await get_http_client().get(
+                f'{self.base_url}/api/public/routingsvc/route?start={start}&end={end}&routeType=cycle',
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            response.raise_for_status()
+            return response.json()
+
+
+class RoadGraph:
+    """
+    Cycling network held as compressed sparse row (CSR) adjacency arrays.
+    The edges leaving node `i` are `indices[indptr[i]:indptr[i + 1]]`, with lengths and street names
+    at the same positions in `lengths_m` and `name_ids`.
+
+    Graph files are JSON objects with:
+    - `nodes`: list of `[lon, lat]` coordinates
+    - `edges`: list of `[from, to]` or `[from, to, name]` node index pairs, traversable in both directions
+      unless the edge is listed under `oneway` instead
+    """
+
+    def __init__(self, coords: Sequence, edges: Sequence[Sequence], oneway: Sequence[Sequence] = ()):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.names: List[str] = []
+        name_lookup: Dict[str, int] = {}
+
+        src, dst, name_ids = [], [], []
+        for edge, bidirectional in [(edge, True) for edge in edges] + [(edge, False) for edge in oneway]:
+            u, v = int(edge[0]), int(edge[1])
+            name = edge[2] if len(edge) > 2 and edge[2] else ''
+            name_id = name_lookup.get(name)
+            if name_id is None:
+                name_id = name_lookup[name] = len(self.names)
+                self.names.append(name)
+
+            src.append(u)
+            dst.append(v)
+            name_ids.append(name_id)
+            if bidirectional:
+                src.append(v)
+                dst.append(u)
+                name_ids.append(name_id)
+
+        src = np.array(src, dtype=np.int32)
+        dst = np.array(dst, dtype=np.int32)
+        if len(src) and (max(src.max(), dst.max()) >= len(self.coords) or min(src.min(), dst.min()) < 0):
+            raise ValueError("Edges must reference existing nodes.")
+
+        order = np.argsort(src, kind='stable')
+        self.indices = dst[order]
+        self.name_ids = np.array(name_ids, dtype=np.int32)[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=len(self.coords))))).astype(np.int64)
+
+        # Edges are straight segments, so lengths never undercut the A* heuristic
+        self._coords_rad = np.radians(self.coords)
+        self.lengths_m = haversine_m(self._coords_rad[src[order]], self._coords_rad[self.indices])
+
+        # Plain lists are much faster than NumPy scalars to index in the A* loop
+        self._search_arrays = (self.indptr.tolist(), self.indices.tolist(), self.lengths_m.tolist())
+
+    @classmethod
+    def load(cls, path: Path) -> 'RoadGraph':
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(data['nodes'], data.get('edges', []), data.get('oneway', []))
+
+    @property
+    def node_count(self) -> int:
+        return len(self.coords)
+
+    def nearest_node(self, lon: float, lat: float) -> Tuple[int, float]:
+        """
+        Find the node closest to a point.
+
+        Returns:
+            Tuple of (node index, distance in meters)
+        """
+        distances = haversine_m(self._coords_rad, np.radians([[lon, lat]]))
+        node = int(np.argmin(distances))
+        return node, float(distances[node])
+
+    def shortest_path(self, source: int, target: int) -> Optional[List[int]]:
+        """
+        Find the shortest path between two nodes with A*, using the great-circle distance to the
+        target as the heuristic.
+
+        Returns:
+            List of node indices from source to target, or None if they are not connected
+        """
+        indptr, indices, lengths_m = self._search_arrays
+        heuristic_m = haversine_m(self._coords_rad, self._coords_rad[target][None, :]).tolist()
+
+        best_m = {source: 0.0}
+        previous = {}
+        queue = [(heuristic_m[source], 0.0, source)]
+        visited = set()
+
+        while queue:
+            _, distance_m, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                return path[::-1]
+
+            if node in visited:
+                continue
+            visited.add(node)
+
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate_m = distance_m + lengths_m[edge]
+                if candidate_m < best_m.get(neighbour, float('inf')):
+                    best_m[neighbour] = candidate_m
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (candidate_m + heuristic_m[neighbour], candidate_m, neighbour))
+
+        return None
+
+    def edge_between(self, u: int, v: int) -> int:
+        """Return the index of the shortest edge from `u` to `v`."""
+        edges = np.arange(self.indptr[u], self.indptr[u + 1])
+        edges = edges[self.indices[edges] == v]
+        return int(edges[np.argmin(self.lengths_m[edges])])
+
+
+class LocalRoutingBackend(RoutingBackend):
+    """Routes over an in-memory cycling network graph, without calling OneMap."""
+    name = 'local'
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+
+    async def route(self, start: str, end: str) -> Dict:
+        with timed('local.route'):
+            return await run_in_threadpool(self.route_sync, start, end)
+
+    def route_sync(self, start: str, end: str) -> Dict:
+        start_lat, start_lon = parse_coordinates(start)
+        end_lat, end_lon = parse_coordinates(end)
+
+        source, source_offset_m = self.graph.nearest_node(start_lon, start_lat)
+        target, target_offset_m = self.graph.nearest_node(end_lon, end_lat)
+        if max(source_offset_m, target_offset_m) > MAX_SNAP_DISTANCE_M:
+            raise RouteNotFoundError("Start or end point is too far from the cycling network.")
+
+        path = self.graph.shortest_path(source, target)
+        if path is None:
+            raise RouteNotFoundError("No cycling route connects the start and end points.")
+
+        return self._build_route(path)
+
+    def _build_route(self, path: List[int]) -> Dict:
+        graph = self.graph
+        edges = [graph.edge_between(u, v) for u, v in zip(path[:-1], path[1:])]
+        total_distance_m = float(sum(graph.lengths_m[edge] for edge in edges))
+
+        # One instruction for every run of edges along the same street
+        instructions = []
+        for i, edge in enumerate(edges):
+            name = graph.names[graph.name_ids[edge]] or 'UNNAMED PATH'
+            if instructions and instructions[-1][1] == name:
+                instructions[-1][2] += float(graph.lengths_m[edge])
+                continue
+
+            lon, lat = graph.coords[path[i]]
+            action = 'Head' if not instructions else 'Turn'
+            text = f'Head along {name}' if not instructions else f'Turn onto {name}'
+            instructions.append([action, name, float(graph.lengths_m[edge]), f'{lat},{lon}', 0, text])
+
+        for instruction in instructions:
+            instruction[2] = round(instruction[2])
+            instruction[4] = round(instruction[2] / AVG_SPEED_M_PER_MIN * 60)
+
+        start_name = instructions[0][1] if instructions else 'N/A'
+        end_name = instructions[-1][1] if instructions else 'N/A'
+        return {
+            'route_geometry': polyline.encode([tuple(coord) for coord in graph.coords[path]], geojson=True),
+            'route_instructions': instructions,
+            'route_summary': {
+                'start_point': start_name,
+                'end_point': end_name,
+                'total_time': round(total_distance_m / AVG_SPEED_M_PER_MIN * 60),
+                'total_distance': round(total_distance_m)
+            }
+        }
+
+
+def parse_coordinates(value: str) -> Tuple[float, float]:
+    """Parse a `latitude,longitude` string, raising `InvalidCoordinatesError` if it is malformed or out of range."""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except ValueError:
+        raise InvalidCoordinatesError(f"Coordinates must be in `latitude,longitude` format: {value}")
+
+    # float() also accepts `nan` and `inf`, which fail both range checks
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidCoordinatesError(f"Latitude must be within [-90, 90] and longitude within [-180, 180]: {value}")
+    return lat, lon
+
+
+_routing_backend: Optional[RoutingBackend] = None
+
+
+def initialize_routing_backend(backend: str = 'onemap', graph_path: Optional[str] = None):
+    """
+    Create the routing backend used by route requests.
+
+    Args:
+        backend: `onemap` to call OneMap's routing service, or `local` to route over the graph at `graph_path`.
+        graph_path: Cycling network graph file, relative to the backend directory.
+    """
+    global _routing_backend
+
+    if backend == 'onemap':
+        _routing_backend = OneMapRoutingBackend(get_settings().ONEMAP_BASE_URL, get_api_key_manager())
+    elif backend == 'local':
+        path = Path(graph_path)
+        if not path.is_absolute():
+            path = Path(__file__).resolve().parent.parent / path
+        graph = RoadGraph.load(path)
+        logger.info(f"Loaded cycling network with {graph.node_count} nodes and {len(graph.indices)} edges from {path}")
+        _routing_backend = LocalRoutingBackend(graph)
+    else:
+        raise ValueError(f"Unknown routing backend: {backend}")
+
+
+def close_routing_backend():
+    global _routing_backend
+    _routing_backend = None
+
+
+def get_routing_backend() -> RoutingBackend:
+    global _routing_backend
+
+    if _routing_backend is None:
+        initialize_routing_backend('onemap')
+    return _routing_backend
@@ -0,0 +1,179 @@
+import hashlib
+from typing import NamedTuple, Tuple
+
+import numpy as np
+import polyline
+
+from app.cache import LRUCache
+from app.constants import EARTH_RADIUS_M, GEOMETRY_CACHE_MAX_ENTRIES
+from app.metrics import timed
+
+
+class RouteGeometry(NamedTuple):
+    coords: np.ndarray  # (n, 2) read-only array of (lon, lat) vertices
+    distances: np.ndarray  # (n,) read-only array of cumulative distances in meters at each vertex
+
+
+# Keyed on a digest of the encoded geometry so long polylines are not kept alive as keys
+_geometry_cache = LRUCache(maxsize=GEOMETRY_CACHE_MAX_ENTRIES)
+
+
+def decode_route_geometry(route_geometry: str) -> RouteGeometry:
+    """
+    Decode an encoded polyline into vertex coordinates and cumulative distances.
+    Results are cached, so routes requested again (e.g. with a different interval) skip decoding entirely.
+
+    Args:
+        route_geometry: Encoded polyline as returned by OneMap.
+
+    Returns:
+        RouteGeometry with read-only arrays shared between callers
+    """
+    key = hashlib.blake2b(route_geometry.encode(), digest_size=16).digest()
+
+    geometry = _geometry_cache.get(key)
+    if geometry is not None:
+        return geometry
+
+    with timed('geometry.decode'):
+        coords = np.array(polyline.decode(route_geometry, geojson=True), dtype=np.float64).reshape(-1, 2)
+    if len(coords) == 0:
+        raise ValueError("Route geometry must contain at least one coordinate.")
+
+    with timed('geometry.distances'):
+        distances = compute_cumsum_distances(coords)
+
+    coords.setflags(write=False)
+    distances.setflags(write=False)
+    geometry = RouteGeometry(coords=coords, distances=distances)
+
+    _geometry_cache.set(key, geometry)
+    return geometry
+
+
+def compute_cumsum_distances(coords: np.ndarray) -> np.ndarray:
+    """
+    Compute cumulative haversine distances along an array of coordinates.
+
+    Args:
+        coords: (n, 2) array of (lon, lat) coordinates in degrees.
+
+    Returns:
+        (n,) array of cumulative distances for every coordinate in meters.
+    """
+    coords_rad = np.radians(coords)
+
+    # Shift array to compare i-th point with i+1-th point
+    lon1, lat1 = coords_rad[:-1, 0], coords_rad[:-1, 1]
+    lon2, lat2 = coords_rad[1:, 0], coords_rad[1:, 1]
+
+    # Haversine Formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+
+    segment_dists = EARTH_RADIUS_M * c
+
+    return np.concatenate(([0.0], np.cumsum(segment_dists)))
+
+
+def haversine_m(a_rad: np.ndarray, b_rad: np.ndarray) -> np.ndarray:
+    """Element-wise haversine distance in meters between (n, 2) arrays of (lon, lat) radians."""
+    dlon = b_rad[:, 0] - a_rad[:, 0]
+    dlat = b_rad[:, 1] - a_rad[:, 1]
+    a = np.sin(dlat / 2)**2 + np.cos(a_rad[:, 1]) * np.cos(b_rad[:, 1]) * np.sin(dlon / 2)**2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def interpolate_along_route(coords: np.ndarray, distances: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    Locate points at given distances along a route, interpolating within the segment each one falls on.
+
+    Args:
+        coords: (n, 2) array of (lon, lat) route vertices.
+        distances: (n,) monotonic array of cumulative distances at each vertex in meters.
+        positions: Distances along the route in meters, clipped to the length of the route.
+
+    Returns:
+        (m, 2) array of (lon, lat) coordinates, one for each position.
+    """
+    positions = np.clip(np.asarray(positions, dtype=np.float64), 0.0, distances[-1])
+    if len(coords) == 1:
+        return np.repeat(coords, len(positions), axis=0)
+
+    # Index of the vertex ending the segment each position falls on
+    idx = np.searchsorted(distances, positions, side='right').clip(1, len(distances) - 1)
+
+    seg_start_m = distances[idx - 1]
+    seg_length_m = distances[idx] - seg_start_m
+    fraction = np.divide(
+        positions - seg_start_m,
+        seg_length_m,
+        out=np.zeros_like(positions),
+        where=seg_length_m > 0  # Repeated vertices form zero-length segments
+    )
+
+    return coords[idx - 1] + fraction[:, None] * (coords[idx] - coords[idx - 1])
+
+
+def project_onto_route(
+    coords: np.ndarray,
+    distances: np.ndarray,
+    points: np.ndarray,
+    chunk_size: int = 256
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Project points onto the closest segment of a route.
+
+    Uses an equirectangular projection centred on the route, accurate to well under a metre across Singapore.
+
+    Args:
+        coords: (n, 2) array of (lon, lat) route vertices.
+        distances: (n,) monotonic array of cumulative distances at each vertex in meters.
+        points: (m, 2) array of (lon, lat) points to project.
+        chunk_size: Points projected per vectorized pass, bounding memory use to `chunk_size` x `n`.
+
+    Returns:
+        Tuple of (m,) arrays: distance along the route of each projected point in meters,
+        and the distance between each point and the route in meters.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    cos_lat0 = np.cos(np.radians(coords[:, 1].mean()))
+    scale = np.radians(EARTH_RADIUS_M) * np.array([cos_lat0, 1.0])
+    route_xy = coords * scale
+    points_xy = points * scale
+
+    if len(coords) == 1:
+        return np.zeros(len(points)), np.linalg.norm(points_xy - route_xy[0], axis=1)
+
+    seg_start = route_xy[:-1]
+    seg_vector = route_xy[1:] - seg_start
+    seg_length2 = (seg_vector ** 2).sum(axis=1)
+
+    along_m = np.empty(len(points))
+    deviation_m = np.empty(len(points))
+    for chunk_start in range(0, len(points), chunk_size):
+        chunk = points_xy[chunk_start:chunk_start + chunk_size]
+        offset = chunk[:, None, :] - seg_start[None, :, :]
+
+        # Fraction along every segment of each point's foot, clamped to the segment
+        fraction = np.divide(
+            (offset * seg_vector[None, :, :]).sum(axis=2),
+            seg_length2[None, :],
+            out=np.zeros(offset.shape[:2]),
+            where=seg_length2[None, :] > 0  # Repeated vertices form zero-length segments
+        ).clip(0.0, 1.0)
+        gap2 = ((offset - fraction[:, :, None] * seg_vector[None, :, :]) ** 2).sum(axis=2)
+
+        closest = np.argmin(gap2, axis=1)
+        rows = np.arange(len(chunk))
+        chunk_fraction = fraction[rows, closest]
+        along_m[chunk_start:chunk_start + len(chunk)] = (
+            distances[closest] + chunk_fraction * (distances[closest + 1] - distances[closest])
+        )
+        deviation_m[chunk_start:chunk_start + len(chunk)] = np.sqrt(gap2[rows, closest])
+
+    return along_m, deviation_m
+
@@ -1,61 +1,234 @@
-import re
-from typing import List, Dict, Tuple
+from typing import List, Dict, Literal, Optional, Tuple
 
-import polyline
 import numpy as np
+import polyline
+from starlette.concurrency import run_in_threadpool
 
 from app.constants import AVG_SPEED_M_PER_MIN, DEFAULT_SEARCH_RADIUS_M, EXPANDED_SEARCH_RADIUS_M
-from app.db import execute_query
+from app.db import execute_query, execute_query_async, register_prepared_statement
+from app.metrics import timed
+from app.utils.geometry import (
+    compute_cumsum_distances,
+    decode_route_geometry,
+    interpolate_along_route,
+    project_onto_route
+)
+from app.utils.spatial_index import get_parking_spot_index
+
+ParkingMode = Literal['fixed', 'optimal']
+ParkingObjective = Literal['deviation', 'stops']
+
+CORRIDOR_SAMPLE_SPACING_M = 100  # Spacing of the route samples used to gather corridor candidates from the index
+STOP_WEIGHT = 1e9  # Outweighs any achievable total deviation, so the `stops` objective minimises stops first
+STOP_TIE_BREAK = 1e-3  # Prefers fewer stops between plans with equal total deviation
+
+
+def find_parking_spots_along_route(
+    route,
+    interval_mins: int,
+    mode: ParkingMode = 'fixed',
+    objective: ParkingObjective = 'deviation'
+) -> List[Dict]:
+    """
+    Find parking spots spots along a given route within the specified interval distance.
 
+    In `fixed` mode, the nearest spot to a checkpoint every interval along the route is chosen.
+    In `optimal` mode, stops are chosen from every spot in a corridor along the route so that no leg
+    exceeds the interval, minimising the `objective`. If no such plan exists, `fixed` mode is used.
 
-def find_parking_spots_along_route(route, interval_mins: int) -> List[Dict]:
+    Args:
+        route: Route object with geometry and summary.
+        interval_mins (int): Time interval in minutes (default 30 mins).
+        mode: `fixed` or `optimal`.
+        objective: In `optimal` mode, minimise total `deviation` or number of `stops`.
+
+    Returns:
+        List of parking spots with their positions along the route.
     """
-    Find parking spots spots along a given route within the specified interval distance.
+    if mode == 'optimal':
+        interval_m = _convert_time_interval_to_distance(interval_mins)
+        with timed('parking.corridor'):
+            candidates = _query_corridor_parking_spots(route, EXPANDED_SEARCH_RADIUS_M)
+        with timed('parking.optimise'):
+            stops = _plan_parking_stops(candidates, _route_length_m(route), interval_m, objective)
+        if stops is not None:
+            return stops
+    elif mode != 'fixed':
+        raise ValueError(f"Unknown parking mode: {mode}")
+
+    with timed('parking.checkpoints'):
+        ckpt_coords = _compute_checkpoint_coords(route, interval_mins)
+
+    # Single round trip for every checkpoint, skipping checkpoints with no spot within the expanded radius
+    with timed('parking.query'):
+        return [spot for spot in _query_nearest_parking_spots(ckpt_coords) if spot]
+
+
+async def find_parking_spots_along_route_async(
+    route,
+    interval_mins: int,
+    mode: ParkingMode = 'fixed',
+    objective: ParkingObjective = 'deviation'
+) -> List[Dict]:
+    """
+    Async variant of `find_parking_spots_along_route` that does not block the event loop.
+    Geometry processing runs in the threadpool and parking lookups use the async connection pool,
+    so several routes can be processed concurrently.
 
     Args:
         route: Route object with geometry and summary.
         interval_mins (int): Time interval in minutes (default 30 mins).
+        mode: `fixed` or `optimal`.
+        objective: In `optimal` mode, minimise total `deviation` or number of `stops`.
 
     Returns:
         List of parking spots with their positions along the route.
     """
+    if mode == 'optimal':
+        interval_m = _convert_time_interval_to_distance(interval_mins)
+        with timed('parking.corridor'):
+            candidates = await _query_corridor_parking_spots_async(route, EXPANDED_SEARCH_RADIUS_M)
+        with timed('parking.optimise'):
+            stops = await run_in_threadpool(
+                _plan_parking_stops, candidates, _route_length_m(route), interval_m, objective
+            )
+        if stops is not None:
+            return stops
+    elif mode != 'fixed':
+        raise ValueError(f"Unknown parking mode: {mode}")
+
+    with timed('parking.checkpoints'):
+        ckpt_coords = await run_in_threadpool(_compute_checkpoint_coords, route, interval_mins)
+
+    with timed('parking.query'):
+        return [spot for spot in await _query_nearest_parking_spots_async(ckpt_coords) if spot]
+
+
+def find_parking_spots_in_corridor(route, buffer_m: float = DEFAULT_SEARCH_RADIUS_M) -> List[Dict]:
+    """
+    Find every parking spot within a buffer of a route, e.g. to offer backup stops along the ride.
+
+    Args:
+        route: Route object with geometry and summary.
+        buffer_m (float): Largest distance between a spot and the route in meters (default 500 m).
+
+    Returns:
+        List of parking spots sorted by their distance along the route, as `along_route_m`.
+    """
+    _validate_buffer(buffer_m)
+    with timed('parking.corridor'):
+        return _query_corridor_parking_spots(route, buffer_m)
+
+
+async def find_parking_spots_in_corridor_async(route, buffer_m: float = DEFAULT_SEARCH_RADIUS_M) -> List[Dict]:
+    """
+    Async variant of `find_parking_spots_in_corridor`.
+
+    Args:
+        route: Route object with geometry and summary.
+        buffer_m (float): Largest distance between a spot and the route in meters (default 500 m).
+
+    Returns:
+        List of parking spots sorted by their distance along the route, as `along_route_m`.
+    """
+    _validate_buffer(buffer_m)
+    with timed('parking.corridor'):
+        return await _query_corridor_parking_spots_async(route, buffer_m)
+
+
+def _compute_checkpoint_coords(route, interval_mins: int) -> List[Tuple[float, float]]:
+    """
+    Compute the coordinates along a route at which to look for parking spots.
+
+    Args:
+        route: Route object with geometry and summary.
+        interval_mins (int): Time interval in minutes.
+
+    Returns:
+        List of (lon, lat) tuples, one for each checkpoint.
+    """
     interval_m = _convert_time_interval_to_distance(interval_mins)
     total_distance_m = route['route_summary']['total_distance']
     route_geometry = route['route_geometry']
 
-    coords = polyline.decode(route_geometry, geojson=True)  # List of (lon, lat) tuples representing the route
-    distances = _compute_cumsum_distances(coords)  # List of cumulative distances at each coordinate along the route
+    # Decoded (lon, lat) vertices and cumulative distances at each vertex, cached per geometry
+    coords, distances = decode_route_geometry(route_geometry)
+
+    # Checkpoints every interval_m along the route, plus one at the endpoint
+    ckpts = np.append(np.arange(interval_m, total_distance_m, interval_m), total_distance_m)
+    ckpt_coords = interpolate_along_route(coords, distances, ckpts)
 
-    ckpts = []
-    cur_distance_m = interval_m
+    return [tuple(coord) for coord in ckpt_coords.tolist()]
 
-    while True:
-        ckpts.append(cur_distance_m)  # First checkpoint at interval_m
-        cur_distance_m += interval_m
-        if cur_distance_m > total_distance_m:
-            break
 
-    if ckpts[-1] < total_distance_m:  # Add checkpoint at endpoint if not already included
-        ckpts.append(total_distance_m)
+def _plan_parking_stops(
+    candidates: List[Dict],
+    route_length_m: float,
+    interval_m: float,
+    objective: ParkingObjective = 'deviation'
+) -> Optional[List[Dict]]:
+    """
+    Choose parking stops along a route with dynamic programming.
 
-    parking_spots = []
-    for ckpt in ckpts:
-        idx = (np.abs(distances - ckpt)).argmin()
-        coord = coords[idx]
+    A leg between consecutive stops is ridden from one spot back to the route, along the route, and off to the
+    next spot, so its length is the sum of both deviations and the distance between the spots along the route.
+    Every leg, starting from the start of the route, must be no longer than the interval, and the last stop
+    must be within the expanded search radius of the end of the route.
 
-        nearest_spot = _query_nearest_parking_spot(coord)
+    Args:
+        candidates: Parking spots with `along_route_m` and `deviation`, sorted by `along_route_m`.
+        route_length_m: Length of the route in meters.
+        interval_m: Longest allowed leg in meters.
+        objective: Minimise the total `deviation` of the stops, or the number of `stops` with deviation as tie-break.
 
-        if nearest_spot:
-            parking_spots.append(nearest_spot)
-        else:
-            nearest_spot = _query_nearest_parking_spot(coord, search_radius_m=EXPANDED_SEARCH_RADIUS_M)  # Expand search radius to 1km
+    Returns:
+        List of chosen parking spots in route order, or None if no plan satisfies the interval
+    """
+    if objective not in ('deviation', 'stops'):
+        raise ValueError(f"Unknown parking objective: {objective}")
+    if not candidates:
+        return None
 
-            if nearest_spot:
-                parking_spots.append(nearest_spot)
+    # Position 0 is the start of the route, a zero-deviation stop every plan begins from
+    along_m = np.array([0.0] + [spot['along_route_m'] for spot in candidates])
+    deviation_m = np.array([0.0] + [spot['deviation'] for spot in candidates])
+    stop_cost = deviation_m + (STOP_WEIGHT if objective == 'stops' else STOP_TIE_BREAK)
+
+    cost = np.full(len(along_m), np.inf)
+    cost[0] = 0.0
+    previous = np.full(len(along_m), -1)
+
+    first = 0  # Earliest position that can still reach the current one along the route
+    for j in range(1, len(along_m)):
+        while along_m[j] - along_m[first] > interval_m:
+            first += 1
+        if first == j:
+            continue
+
+        leg_m = (along_m[j] - along_m[first:j]) + deviation_m[first:j] + deviation_m[j]
+        reachable_cost = np.where(leg_m <= interval_m, cost[first:j], np.inf)
+        best = int(np.argmin(reachable_cost))
+        if np.isfinite(reachable_cost[best]):
+            cost[j] = reachable_cost[best] + stop_cost[j]
+            previous[j] = first + best
+
+    finishing = ((route_length_m - along_m) + deviation_m <= EXPANDED_SEARCH_RADIUS_M) & np.isfinite(cost)
+    finishing[0] = False
+    if not finishing.any():
+        return None
+
+    position = int(np.argmin(np.where(finishing, cost, np.inf)))
+    stops = []
+    while position > 0:
+        stops.append(candidates[position - 1])
+        position = int(previous[position])
 
-            # If still no parking spot found, skip this checkpoint
+    return stops[::-1]
 
-    return parking_spots
+
+def _route_length_m(route) -> float:
+    _, distances = decode_route_geometry(route['route_geometry'])
+    return float(distances[-1])
 
 
 def _convert_time_interval_to_distance(interval_mins: int = 30) -> int:
@@ -92,26 +265,29 @@ def _compute_cumsum_distances(coords: List[Tuple]) -> List[float]:
     elif len(coords) == 0:
         raise ValueError("Coordinates list must not be empty.")
 
-    coords_rad = np.radians(coords)
-
-    # Shift array to compare i-th point with i+1-th point
-    lon1, lat1 = coords_rad[:-1, 0], coords_rad[:-1, 1]
-    lon2, lat2 = coords_rad[1:, 0], coords_rad[1:, 1]
+    return compute_cumsum_distances(coords)
 
-    # Haversine Formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
 
-    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
-    c = 2 * np.arcsin(np.sqrt(a))
+# `geog` is a stored geography copy of `coordinates` with its own GiST index, so both the radius filter and
+# the `<->` nearest-neighbour ordering are answered from the index without casting every row
+_NEAREST_PARKING_SPOT_QUERY = """
+    SELECT
+        id,
+        description,
+        ST_X(coordinates) AS lon,
+        ST_Y(coordinates) AS lat,
+        rack_type,
+        rack_count,
+        shelter_indicator,
+        ST_Distance(geog, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS deviation
+    FROM parking_spots
+    WHERE ST_DWithin(geog, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
+    ORDER BY geog <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
+    LIMIT 1;
+"""
 
-    EARTH_RADIUS_M = 6_371_000
 
-    segment_dists = EARTH_RADIUS_M * c
-
-    cumulative_dists = np.concatenate(([0], np.cumsum(segment_dists)))
-
-    return cumulative_dists
+register_prepared_statement(_NEAREST_PARKING_SPOT_QUERY, warmup_params=(0.0, 0.0, 0.0, 0.0, 0, 0.0, 0.0))
 
 
 def _query_nearest_parking_spot(coord: Tuple[float, float], search_radius_m: int = DEFAULT_SEARCH_RADIUS_M) -> Dict:
@@ -132,38 +308,250 @@ def _query_nearest_parking_spot(coord: Tuple[float, float], search_radius_m: int
     elif type(coord[0]) is not float or type(coord[1]) is not float:
         raise TypeError("Coordinate values must be a float.")
 
+    index = get_parking_spot_index()
+    if index is not None:
+        return index.query_nearest([coord], search_radius_m)[0]
+
     lon, lat = coord
-    query = """
+    result = execute_query(_NEAREST_PARKING_SPOT_QUERY, (lon, lat, lon, lat, search_radius_m, lon, lat))
+    if not result:
+        return None
+
+    return _pop_coord(result[0])
+
+
+# The nearest spot within the default radius is also the nearest spot within the expanded radius,
+# so the fallback collapses into a single lateral lookup bounded by the expanded radius.
+# Every lookup walks the `geog` index in distance order and stops at the first spot.
+_NEAREST_PARKING_SPOTS_QUERY = """
+    WITH checkpoints AS (
+        SELECT
+            ckpt.idx,
+            ST_SetSRID(ST_MakePoint(ckpt.lon, ckpt.lat), 4326)::geography AS geog
+        FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS ckpt(lon, lat, idx)
+    )
+    SELECT
+        checkpoints.idx,
+        nearest.id,
+        nearest.description,
+        nearest.lon,
+        nearest.lat,
+        nearest.rack_type,
+        nearest.rack_count,
+        nearest.shelter_indicator,
+        nearest.deviation
+    FROM checkpoints
+    CROSS JOIN LATERAL (
         SELECT
             id,
             description,
-            ST_AsText(coordinates) AS coord,
+            ST_X(coordinates) AS lon,
+            ST_Y(coordinates) AS lat,
             rack_type,
             rack_count,
             shelter_indicator,
-            ST_Distance(
-                coordinates::geography,
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-            ) AS deviation  -- Casting to `geography` type converts distance from degrees to meters
+            ST_Distance(parking_spots.geog, checkpoints.geog) AS deviation
         FROM parking_spots
-        WHERE ST_DWithin(
-            coordinates::geography,
-            ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography,
-            %s
-            )
-        ORDER BY deviation ASC
-        LIMIT 1;
+        WHERE ST_DWithin(parking_spots.geog, checkpoints.geog, %s)
+        ORDER BY parking_spots.geog <-> checkpoints.geog
+        LIMIT 1
+    ) AS nearest
+    ORDER BY checkpoints.idx;
+"""
+
+
+register_prepared_statement(_NEAREST_PARKING_SPOTS_QUERY, warmup_params=([], [], EXPANDED_SEARCH_RADIUS_M))
+
+
+def _query_nearest_parking_spots(coords: List[Tuple[float, float]]) -> List[Optional[Dict]]:
     """
-    result = execute_query(query, (lon, lat, lon, lat, search_radius_m))
-    if not result:
-        return None
+    Query database for the nearest parking spot to each coordinate in a single statement.
 
-    # Preprocess returned coordinates
-    # Query returns: "POINT(123.456, 1.2345)"
-    # Extract the coordinates and return as floats in (lon, lat) order
-    pattern = r'POINT\(([-+]?[0-9]*\.?[0-9]+) ([-+]?[0-9]*\.?[0-9]+)\)'
-    lon = float(re.search(pattern, result[0]["coord"]).group(1))
-    lat = float(re.search(pattern, result[0]["coord"]).group(2))
+    Each coordinate is looked up within the default search radius first and, failing that,
+    within the expanded search radius. Both passes are resolved on the database server.
 
-    result[0]["coord"] = (lon, lat)
-    return result[0]
+    Args:
+        coords (list): List of (lon, lat) tuples.
+
+    Returns:
+        List of the same length as `coords`, containing parking spot info or None for each coordinate
+    """
+    _validate_coords(coords)
+    if len(coords) == 0:
+        return []
+
+    index = get_parking_spot_index()
+    if index is not None:
+        return index.query_nearest(coords, EXPANDED_SEARCH_RADIUS_M)
+
+    rows = execute_query(_NEAREST_PARKING_SPOTS_QUERY, _nearest_parking_spots_params(coords))
+    return _collect_nearest_parking_spots(rows, len(coords))
+
+
+async def _query_nearest_parking_spots_async(coords: List[Tuple[float, float]]) -> List[Optional[Dict]]:
+    """
+    Async variant of `_query_nearest_parking_spots`.
+
+    Args:
+        coords (list): List of (lon, lat) tuples.
+
+    Returns:
+        List of the same length as `coords`, containing parking spot info or None for each coordinate
+    """
+    _validate_coords(coords)
+    if len(coords) == 0:
+        return []
+
+    index = get_parking_spot_index()
+    if index is not None:
+        return index.query_nearest(coords, EXPANDED_SEARCH_RADIUS_M)
+
+    rows = await execute_query_async(_NEAREST_PARKING_SPOTS_QUERY, _nearest_parking_spots_params(coords))
+    return _collect_nearest_parking_spots(rows, len(coords))
+
+
+_CORRIDOR_PARKING_SPOTS_QUERY = """
+    SELECT
+        id,
+        description,
+        ST_X(coordinates) AS lon,
+        ST_Y(coordinates) AS lat,
+        rack_type,
+        rack_count,
+        shelter_indicator
+    FROM parking_spots
+    WHERE ST_DWithin(
+        geog,
+        ST_LineFromEncodedPolyline(%s)::geography,
+        %s
+    );
+"""
+
+
+register_prepared_statement(_CORRIDOR_PARKING_SPOTS_QUERY)
+
+
+def _query_corridor_parking_spots(route, buffer_m: float) -> List[Dict]:
+    """
+    Query every parking spot within a buffer of a route in a single pass.
+
+    Args:
+        route: Route object with geometry and summary.
+        buffer_m (float): Largest distance between a spot and the route in meters.
+
+    Returns:
+        List of parking spot info with the distance along the route of the closest point on the route
+        as `along_route_m` and the distance from it as `deviation`, sorted by `along_route_m`
+    """
+    coords, distances = decode_route_geometry(route['route_geometry'])
+
+    index = get_parking_spot_index()
+    if index is not None:
+        # Every point of the route is within half the sample spacing of a sample
+        samples = np.append(np.arange(0, distances[-1], CORRIDOR_SAMPLE_SPACING_M), distances[-1])
+        sample_coords = interpolate_along_route(coords, distances, samples)
+        spots = index.query_within(sample_coords, buffer_m + CORRIDOR_SAMPLE_SPACING_M / 2)
+    else:
+        spots = execute_query(
+            _CORRIDOR_PARKING_SPOTS_QUERY, _corridor_parking_spots_params(route['route_geometry'], coords, buffer_m)
+        )
+        for spot in spots:
+            _pop_coord(spot)
+
+    return _locate_along_route(spots, coords, distances, buffer_m)
+
+
+async def _query_corridor_parking_spots_async(route, buffer_m: float) -> List[Dict]:
+    """
+    Async variant of `_query_corridor_parking_spots`.
+
+    Args:
+        route: Route object with geometry and summary.
+        buffer_m (float): Largest distance between a spot and the route in meters.
+
+    Returns:
+        List of parking spot info with `along_route_m` and `deviation`, sorted by `along_route_m`
+    """
+    if get_parking_spot_index() is not None:
+        return await run_in_threadpool(_query_corridor_parking_spots, route, buffer_m)
+
+    coords, distances = await run_in_threadpool(decode_route_geometry, route['route_geometry'])
+    spots = await execute_query_async(
+        _CORRIDOR_PARKING_SPOTS_QUERY, _corridor_parking_spots_params(route['route_geometry'], coords, buffer_m)
+    )
+    for spot in spots:
+        _pop_coord(spot)
+
+    return await run_in_threadpool(_locate_along_route, spots, coords, distances, buffer_m)
+
+
+def _corridor_parking_spots_params(route_geometry: str, coords: np.ndarray, buffer_m: float) -> Tuple:
+    # The route's own polyline is passed through, so the corridor follows exactly the decoded route
+    if len(coords) > 1:
+        return (route_geometry, buffer_m)
+
+    # A linestring needs at least two vertices, so a route that never leaves its start is doubled up
+    return (polyline.encode([tuple(coords[0])] * 2, geojson=True), buffer_m)
+
+
+def _locate_along_route(spots: List[Dict], coords: np.ndarray, distances: np.ndarray, buffer_m: float) -> List[Dict]:
+    if not spots:
+        return []
+
+    along_m, deviation_m = project_onto_route(coords, distances, np.array([spot["coord"] for spot in spots]))
+
+    located = []
+    for spot, along, deviation in zip(spots, along_m.tolist(), deviation_m.tolist()):
+        if deviation <= buffer_m:
+            located.append({**spot, "along_route_m": along, "deviation": deviation})
+
+    return sorted(located, key=lambda spot: spot["along_route_m"])
+
+
+def _validate_coords(coords: List[Tuple[float, float]]):
+    if type(coords) is not list:
+        raise TypeError("Coordinates must be a list.")
+
+    for coord in coords:
+        if type(coord) is not tuple:
+            raise TypeError("Coordinate must be a tuple.")
+        elif len(coord) != 2:
+            raise ValueError("Coordinate must contain only two values.")
+        elif type(coord[0]) is not float or type(coord[1]) is not float:
+            raise TypeError("Coordinate values must be a float.")
+
+
+def _validate_buffer(buffer_m: float):
+    if type(buffer_m) not in (int, float):
+        raise TypeError("Buffer must be a number.")
+    elif buffer_m <= 0:
+        raise ValueError("Buffer must be positive.")
+
+
+def _nearest_parking_spots_params(coords: List[Tuple[float, float]]) -> Tuple:
+    lons = [coord[0] for coord in coords]
+    lats = [coord[1] for coord in coords]
+    return (lons, lats, EXPANDED_SEARCH_RADIUS_M)
+
+
+def _collect_nearest_parking_spots(rows: List[Dict], n_coords: int) -> List[Optional[Dict]]:
+    results = [None] * n_coords
+    for row in rows:
+        idx = row.pop("idx") - 1  # Ordinality is 1-based
+        results[idx] = _pop_coord(row)
+
+    return results
+
+
+def _pop_coord(row: Dict) -> Dict:
+    """
+    Replace the `lon` and `lat` columns of a parking spot row with a (lon, lat) `coord` tuple.
+
+    Args:
+        row (dict): Row with `lon` and `lat` returned as floats by `ST_X` and `ST_Y`.
+
+    Returns:
+        The same row, updated in place
+    """
+    row["coord"] = (row.pop("lon"), row.pop("lat"))
+    return row
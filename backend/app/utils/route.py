@@ -1,13 +1,21 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+from urllib.parse import unquote
 
+from app.cache import snap_coordinates
 
-def transform_route_data(route_data: Dict, parking_spots: List[Dict]) -> Dict:
+
+def transform_route_data(
+    route_data: Dict,
+    parking_spots: List[Dict],
+    corridor_parking_spots: Optional[List[Dict]] = None
+) -> Dict:
     """
     Transform OneMap route response data to application format.
     
     Args:
         route_data: Raw route data from OneMap API.
         parking_spots: List of parking spots along the route.
+        corridor_parking_spots: List of every parking spot within a buffer of the route, if requested.
     """
     # Keep only top-level instructions
     route_instructions = route_data.get('route_instructions', [])
@@ -15,7 +23,7 @@ def transform_route_data(route_data: Dict, parking_spots: List[Dict]) -> Dict:
 
     route_summary = route_data.get('route_summary', {})
 
-    return {
+    transformed = {
         'route_geometry': route_data.get('route_geometry', ''),
         'route_instructions': filtered_instructions,
         'route_summary': {
@@ -24,19 +32,97 @@ def transform_route_data(route_data: Dict, parking_spots: List[Dict]) -> Dict:
             'total_time_s': route_summary.get('total_time', 0),
             'total_distance_m': route_summary.get('total_distance', 0),
         },
-        'parking_spots': [
-            {
-                'id': spot.get('id', 'N/A'),
-                'description': spot.get('description', 'N/A'),
-                'coordinates': {
-                    'lat': spot.get('coord', (0.0, 0.0))[1],
-                    'lon': spot.get('coord', (0.0, 0.0))[0]
-                },
-                'rack_type': spot.get('rack_type', 'N/A'),
-                'rack_count': spot.get('rack_count', 0),
-                'shelter_indicator': spot.get('shelter_indicator', 'N/A'),
-                'deviation_m': spot.get('deviation', 0.0)
-            }
-            for spot in parking_spots
-        ]
-    }
\ No newline at end of file
+        'parking_spots': [_transform_parking_spot(spot) for spot in parking_spots]
+    }
+    if corridor_parking_spots is not None:
+        transformed['corridor_parking_spots'] = [_transform_parking_spot(spot) for spot in corridor_parking_spots]
+
+    return transformed
+
+
+def _transform_parking_spot(spot: Dict) -> Dict:
+    transformed = {
+        'id': spot.get('id', 'N/A'),
+        'description': spot.get('description', 'N/A'),
+        'coordinates': {
+            'lat': spot.get('coord', (0.0, 0.0))[1],
+            'lon': spot.get('coord', (0.0, 0.0))[0]
+        },
+        'rack_type': spot.get('rack_type', 'N/A'),
+        'rack_count': spot.get('rack_count', 0),
+        'shelter_indicator': spot.get('shelter_indicator', 'N/A'),
+        'deviation_m': spot.get('deviation', 0.0)
+    }
+
+    # Spots found along a corridor know where they sit along the route
+    if 'along_route_m' in spot:
+        transformed['along_route_m'] = spot['along_route_m']
+
+    return transformed
+
+
+def to_columnar_parking_spots(route: Dict) -> Dict:
+    """
+    Convert the parking spots of a transformed route into columnar arrays, one per field.
+    Compact clients skip repeating the field names of every spot.
+
+    Args:
+        route: Route in the format returned by `transform_route_data`.
+
+    Returns:
+        Copy of the route with every list of parking spots replaced by a dict of equal length arrays
+    """
+    columnar = dict(route)
+    for key in ('parking_spots', 'corridor_parking_spots'):
+        if key not in route:
+            continue
+
+        spots = route[key]
+        columns = {
+            'id': [spot['id'] for spot in spots],
+            'description': [spot['description'] for spot in spots],
+            'lat': [spot['coordinates']['lat'] for spot in spots],
+            'lon': [spot['coordinates']['lon'] for spot in spots],
+            'rack_type': [spot['rack_type'] for spot in spots],
+            'rack_count': [spot['rack_count'] for spot in spots],
+            'shelter_indicator': [spot['shelter_indicator'] for spot in spots],
+            'deviation_m': [spot['deviation_m'] for spot in spots]
+        }
+        if spots and all('along_route_m' in spot for spot in spots):
+            columns['along_route_m'] = [spot['along_route_m'] for spot in spots]
+        columnar[key] = columns
+
+    return columnar
+
+
+def build_route_cache_key(
+    start: str,
+    end: str,
+    interval_mins: int,
+    grid_deg: float,
+    parking_mode: str = 'fixed',
+    parking_objective: str = 'deviation',
+    corridor_m: Optional[int] = None
+) -> str:
+    """
+    Build the cache key for a route request, snapping start and end to a grid so nearby requests share results.
+
+    Args:
+        start: Starting coordinates in `latitude,longitude` format.
+        end: Ending coordinates in `latitude,longitude` format.
+        interval_mins: Time interval in minutes for parking spot placement.
+        grid_deg: Grid spacing in degrees.
+        parking_mode: Parking spot placement mode.
+        parking_objective: Objective minimised by the `optimal` parking mode.
+        corridor_m: Buffer in meters within which every parking spot along the route is also returned.
+    """
+    snapped_start = snap_coordinates(unquote(start), grid_deg)
+    snapped_end = snap_coordinates(unquote(end), grid_deg)
+    key = f"routes:{snapped_start}:{snapped_end}:{interval_mins}"
+
+    # Keys for the default mode are unchanged so existing cache entries stay valid
+    if parking_mode != 'fixed':
+        key += f":{parking_mode}:{parking_objective}"
+    if corridor_m is not None:
+        key += f":corridor{corridor_m}"
+    return key
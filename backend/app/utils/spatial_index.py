@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from app.constants import EARTH_RADIUS_M, EXPANDED_SEARCH_RADIUS_M
+from app.db import execute_query
+from app.utils.geometry import haversine_m as _haversine_m
+
+logger = logging.getLogger(__name__)
+
+_GRID_OFFSET = 1 << 20  # Keeps cell indices positive for points outside the indexed extent
+_GRID_STRIDE = 1 << 21
+
+
+class _Snapshot(NamedTuple):
+    version: Optional[int]
+    rows: List[Tuple]  # (id, description, lon, lat, rack_type, rack_count, shelter_indicator)
+    lon_lat_rad: np.ndarray  # (n, 2) spot coordinates in radians
+    keys: np.ndarray  # Sorted grid cell key of every spot
+    order: np.ndarray  # Spot index for every entry in `keys`
+    cos_lat0: float
+
+
+class ParkingSpotIndex:
+    """
+    In-memory grid index of parking spots for radius-bounded nearest neighbour queries.
+
+    Spots are bucketed into square cells over an equirectangular projection centred on the dataset,
+    which is accurate to well under a metre across Singapore. Candidates are gathered from the cells
+    surrounding every query point and ranked by haversine distance, all in vectorized passes.
+    """
+    COLUMNS = ('id', 'description', 'lon', 'lat', 'rack_type', 'rack_count', 'shelter_indicator')
+
+    # Slightly wider than the largest search radius so a 3x3 block of cells always covers it
+    DEFAULT_CELL_SIZE_M = EXPANDED_SEARCH_RADIUS_M + 10
+
+    def __init__(self, cell_size_m: float = DEFAULT_CELL_SIZE_M):
+        self.cell_size_m = cell_size_m
+        self._snapshot: Optional[_Snapshot] = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._snapshot.version if self._snapshot else None
+
+    @property
+    def size(self) -> int:
+        return len(self._snapshot.rows) if self._snapshot else 0
+
+    def build(self, rows: Sequence[Tuple], version: Optional[int] = None):
+        """
+        Build the index from parking spot rows and swap it in atomically.
+
+        Args:
+            rows: Sequence of tuples ordered as per `COLUMNS`.
+            version: Version of the parking spots table the rows were read at.
+        """
+        rows = list(rows)
+        lon_lat = np.array([(row[2], row[3]) for row in rows], dtype=np.float64).reshape(-1, 2)
+        lon_lat_rad = np.radians(lon_lat)
+        cos_lat0 = float(np.cos(lon_lat_rad[:, 1].mean())) if len(rows) else 1.0
+
+        keys = self._cell_keys(lon_lat_rad, cos_lat0)
+        order = np.argsort(keys, kind='stable')
+
+        self._snapshot = _Snapshot(
+            version=version,
+            rows=rows,
+            lon_lat_rad=lon_lat_rad,
+            keys=keys[order],
+            order=order,
+            cos_lat0=cos_lat0
+        )
+
+    def load(self):
+        """Load every parking spot from the database into the index."""
+        with self._reload_lock:
+            version = fetch_parking_spots_version()
+            results = execute_query("""
+                SELECT
+                    id,
+                    description,
+                    ST_X(coordinates) AS lon,
+                    ST_Y(coordinates) AS lat,
+                    rack_type,
+                    rack_count,
+                    shelter_indicator
+                FROM parking_spots;
+            """)
+            self.build([tuple(row[column] for column in self.COLUMNS) for row in results], version=version)
+
+        logger.info(f"Loaded {self.size} parking spots into in-memory index (version {version})")
+
+    def reload_if_stale(self) -> bool:
+        """
+        Reload the index if the parking spots table changed since it was loaded.
+
+        Returns:
+            True if the index was reloaded, False otherwise
+        """
+        if self.loaded and fetch_parking_spots_version() == self.version:
+            return False
+
+        self.load()
+        return True
+
+    def query_nearest(self, coords: Sequence[Tuple[float, float]], search_radius_m: float) -> List[Optional[Dict[str, Any]]]:
+        """
+        Find the nearest parking spot to each coordinate within the search radius.
+
+        Args:
+            coords: Sequence of (lon, lat) tuples.
+            search_radius_m: Search radius in meters.
+
+        Returns:
+            List of the same length as `coords`, containing parking spot info or None for each coordinate
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError("Parking spot index has not been loaded.")
+
+        n_queries = len(coords)
+        results: List[Optional[Dict[str, Any]]] = [None] * n_queries
+        if n_queries == 0 or not snapshot.rows:
+            return results
+
+        query_rad = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        query_idx, spot_idx, deviations = self._gather_candidates(snapshot, query_rad, search_radius_m)
+
+        # Keep the closest candidate for every query point
+        ranking = np.lexsort((deviations, query_idx))
+        query_idx, spot_idx, deviations = query_idx[ranking], spot_idx[ranking], deviations[ranking]
+        _, first = np.unique(query_idx, return_index=True)
+
+        for q, s, d in zip(query_idx[first], spot_idx[first], deviations[first]):
+            results[q] = _spot_info(snapshot.rows[s], d)
+
+        return results
+
+    def query_within(self, coords: Sequence[Tuple[float, float]], search_radius_m: float) -> List[Dict[str, Any]]:
+        """
+        Find every parking spot within the search radius of any coordinate, e.g. densely sampled points along a route.
+
+        Args:
+            coords: Sequence of (lon, lat) tuples.
+            search_radius_m: Search radius in meters.
+
+        Returns:
+            List of parking spot info, each spot once with its distance to the closest coordinate as `deviation`
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError("Parking spot index has not been loaded.")
+
+        if len(coords) == 0 or not snapshot.rows:
+            return []
+
+        query_rad = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        _, spot_idx, deviations = self._gather_candidates(snapshot, query_rad, search_radius_m)
+
+        # Keep the closest query point for every spot
+        ranking = np.lexsort((deviations, spot_idx))
+        spot_idx, deviations = spot_idx[ranking], deviations[ranking]
+        _, first = np.unique(spot_idx, return_index=True)
+
+        return [_spot_info(snapshot.rows[s], d) for s, d in zip(spot_idx[first], deviations[first])]
+
+    def _gather_candidates(
+        self,
+        snapshot: _Snapshot,
+        query_rad: np.ndarray,
+        search_radius_m: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pair every query point with every spot within the search radius.
+
+        Returns:
+            Tuple of equal length arrays: query point index, spot index and distance in meters
+        """
+        # Gather the grid cells within `reach` cells of every query point
+        reach = int(np.ceil(search_radius_m / self.cell_size_m))
+        offsets = np.arange(-reach, reach + 1)
+        dx, dy = np.meshgrid(offsets, offsets, indexing='ij')
+        neighbour_offsets = (dx * _GRID_STRIDE + dy).ravel()
+
+        query_keys = self._cell_keys(query_rad, snapshot.cos_lat0)
+        neighbour_keys = (query_keys[:, None] + neighbour_offsets[None, :]).ravel()
+
+        starts = np.searchsorted(snapshot.keys, neighbour_keys, side='left')
+        ends = np.searchsorted(snapshot.keys, neighbour_keys, side='right')
+        counts = ends - starts
+        n_candidates = int(counts.sum())
+
+        # Expand every [start, end) range of sorted keys into flat candidate positions
+        query_idx = np.repeat(np.arange(len(neighbour_keys)) // len(neighbour_offsets), counts)
+        run_offsets = np.arange(n_candidates) - np.repeat(np.cumsum(counts) - counts, counts)
+        spot_idx = snapshot.order[np.repeat(starts, counts) + run_offsets]
+
+        deviations = _haversine_m(query_rad[query_idx], snapshot.lon_lat_rad[spot_idx])
+        within = deviations <= search_radius_m
+        return query_idx[within], spot_idx[within], deviations[within]
+
+    def _cell_keys(self, lon_lat_rad: np.ndarray, cos_lat0: float) -> np.ndarray:
+        x = EARTH_RADIUS_M * lon_lat_rad[:, 0] * cos_lat0
+        y = EARTH_RADIUS_M * lon_lat_rad[:, 1]
+        cx = np.floor(x / self.cell_size_m).astype(np.int64) + _GRID_OFFSET
+        cy = np.floor(y / self.cell_size_m).astype(np.int64) + _GRID_OFFSET
+        return cx * _GRID_STRIDE + cy
+
+
+def _spot_info(row: Tuple, deviation: float) -> Dict[str, Any]:
+    spot_id, description, lon, lat, rack_type, rack_count, shelter_indicator = row
+    return {
+        'id': spot_id,
+        'description': description,
+        'coord': (lon, lat),
+        'rack_type': rack_type,
+        'rack_count': rack_count,
+        'shelter_indicator': shelter_indicator,
+        'deviation': float(deviation)
+    }
+
+
+def fetch_parking_spots_version() -> Optional[int]:
+    """
+    Fetch the version of the parking spots data.
+
+    The loader bumps the version whenever it inserts, updates or deletes parking spots,
+    and leaves it alone when a reload finds nothing changed.
+
+    Returns:
+        Version number or None if the data has not been loaded yet
+    """
+    result = execute_query("SELECT version FROM parking_spots_version;")
+    return result[0]['version'] if result else None
+
+
+_parking_spot_index: Optional[ParkingSpotIndex] = None
+
+
+def initialize_parking_spot_index():
+    """
+    Load the in-memory parking spot index, replacing database lookups on the routing hot path.
+    If loading fails, lookups fall back to the database until the next successful refresh.
+    """
+    global _parking_spot_index
+
+    if _parking_spot_index is None:
+        _parking_spot_index = ParkingSpotIndex()
+
+        try:
+            _parking_spot_index.load()
+        except Exception as e:
+            logger.warning(f"Failed to load parking spot index, falling back to database lookups: {e}")
+
+
+def close_parking_spot_index():
+    """Drop the in-memory parking spot index, falling back to database lookups."""
+    global _parking_spot_index
+    _parking_spot_index = None
+
+
+def get_parking_spot_index() -> Optional[ParkingSpotIndex]:
+    """Return the in-memory parking spot index if it is enabled and loaded, otherwise None."""
+    if _parking_spot_index is not None and _parking_spot_index.loaded:
+        return _parking_spot_index
+    return None
+
+
+async def refresh_parking_spot_index(interval_s: float):
+    """
+    Periodically reload the in-memory parking spot index whenever the parking spots table changes.
+
+    Args:
+        interval_s: Seconds between version checks.
+    """
+    while True:
+        await asyncio.sleep(interval_s)
+
+        if _parking_spot_index is None:
+            continue
+
+        try:
+            await run_in_threadpool(_parking_spot_index.reload_if_stale)
+        except Exception as e:  # Keep serving the current snapshot if the database is unavailable
+            logger.warning(f"Failed to refresh parking spot index: {e}")
@@ -1,19 +1,34 @@
-from typing import Annotated
+import asyncio
+from typing import Annotated, Dict, List, Optional
+from urllib.parse import unquote
 
 from dotenv import load_dotenv
 from fastapi import (
     APIRouter,
     Depends,
+    Query,
+    Request,
     status
 )
-from fastapi.responses import JSONResponse
-import requests
+from fastapi.responses import JSONResponse, Response
+import httpx
+from psycopg_pool import PoolTimeout, TooManyRequests
 
+from app.cache import CacheBackend, SearchCache, SingleFlight, get_route_cache, get_search_cache
 from app.config import Settings, get_settings
-from app.constants import DEFAULT_INTERVAL_MINS
-from app.onemap import ApiKeyManager, get_api_key_manager
-from app.utils.parking import find_parking_spots_along_route
-from app.utils.route import transform_route_data
+from app.constants import DEFAULT_INTERVAL_MINS, EXPANDED_SEARCH_RADIUS_M
+from app.http_client import get_http_client
+from app.metrics import timed
+from app.onemap import ApiKeyManager, TokenUnavailableError, get_api_key_manager
+from app.responses import negotiated_response
+from app.routing import InvalidCoordinatesError, RouteNotFoundError, get_routing_backend, parse_coordinates
+from app.utils.parking import (
+    ParkingMode,
+    ParkingObjective,
+    find_parking_spots_along_route_async,
+    find_parking_spots_in_corridor_async
+)
+from app.utils.route import build_route_cache_key, to_columnar_parking_spots, transform_route_data
 
 load_dotenv()
 router = APIRouter(
@@ -23,9 +38,12 @@ router = APIRouter(
 ApiDep = Annotated[ApiKeyManager, Depends(get_api_key_manager)]
 SettingsDep = Annotated[Settings, Depends(get_settings)]
 
+_search_flight = SingleFlight()
+_routes_flight = SingleFlight()
+
 
 @router.get('/search')
-def search(
+async def search(
     api_dep: ApiDep,
     settings_dep: SettingsDep,
     searchVal: str,
@@ -39,19 +57,29 @@ def search(
     - `pageNum` (integer, optional): Page number of results to return (default: 1)
     """
     try:
-        token = api_dep.get_api_key()
-        response = requests.get(
-            f'{settings_dep.ONEMAP_BASE_URL}/api/common/elastic/search?searchVal={searchVal}&returnGeom=Y&getAddrDetails=Y&pageNum={pageNum}',
-            headers={'Authorization': f'Bearer {token}'}
+        cache = get_search_cache() if settings_dep.SEARCH_CACHE_ENABLED else None
+        if cache is not None:
+            with timed('cache.get'):
+                cached_data = cache.get(searchVal, pageNum)
+            if cached_data is not None:
+                return JSONResponse(
+                    content=cached_data.get('results', []),
+                    status_code=status.HTTP_200_OK,
+                    headers={'X-Cache': 'HIT'}
+                )
+
+        # Identical queries typed by several users at once share one OneMap call
+        flight_key = (SearchCache.normalise_query(searchVal), pageNum)
+        data = await _search_flight.do(
+            flight_key, lambda: _fetch_search(api_dep, settings_dep, cache, searchVal, pageNum)
         )
-        response.raise_for_status()
-        data = response.json()
-        results = data.get('results', [])
+
         return JSONResponse(
-            content=results,
-            status_code=status.HTTP_200_OK
+            content=data.get('results', []),
+            status_code=status.HTTP_200_OK,
+            headers={'X-Cache': 'MISS'} if cache is not None else None
         )
-    except requests.RequestException as e:  # Error with OneMap API request
+    except (httpx.HTTPError, TokenUnavailableError) as e:  # Error with OneMap API request
         return JSONResponse(
             content={'error': str(e)},
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE
@@ -63,14 +91,46 @@ def search(
         )
 
 
+async def _fetch_search(
+    api_dep: ApiKeyManager,
+    settings_dep: Settings,
+    cache: Optional[SearchCache],
+    search_val: str,
+    page_num: int
+) -> Dict:
+    with timed('onemap.token'):
+        token = await api_dep.get_api_key_async()
+    with timed('onemap.search'):
+        response = await get_http_client().get(
+            f'{settings_dep.ONEMAP_BASE_URL}/api/common/elastic/search',
+            params={'searchVal': search_val, 'returnGeom': 'Y', 'getAddrDetails': 'Y', 'pageNum': page_num},
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        response.raise_for_status()
+        data = response.json()
+
+    # Keep only what is needed to serve the page again
+    data = {key: data[key] for key in ('found', 'totalNumPages', 'pageNum', 'results') if key in data}
+
+    # Cached once per OneMap call, not by every request waiting on it
+    if cache is not None:
+        cache.set(search_val, page_num, data)
+
+    return data
+
+
 @router.get('/routes')
-def get_routes(
-    api_dep: ApiDep,
+async def get_routes(
+    request: Request,
     settings_dep: SettingsDep,
     start: str,
     end: str,
-    intervalMins: int = DEFAULT_INTERVAL_MINS
-) -> JSONResponse:
+    intervalMins: int = DEFAULT_INTERVAL_MINS,
+    mode: ParkingMode = 'fixed',
+    objective: ParkingObjective = 'deviation',
+    corridorM: Annotated[Optional[int], Query(gt=0, le=EXPANDED_SEARCH_RADIUS_M)] = None,
+    columnar: bool = False
+) -> Response:
     """
     Find cycling routes with intermediate parking spots based on user-defined time intervals.
 
@@ -79,44 +139,123 @@ def get_routes(
     - `end` (string, required): Ending coordinates in `latitude,longitude` format
 
     - `intervalMins` (integer, optional): Time interval in minutes for parking spot placement (default: 30)
-    """
-    ONEMAP_ALT_ROUTES_KEY = 'alternativeroute'
 
-    try:
-        token = api_dep.get_api_key()
-        response = requests.get(
-            f'{settings_dep.ONEMAP_BASE_URL}/api/public/routingsvc/route?start={start}&end={end}&routeType=cycle',
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        response.raise_for_status()
-        route_data = response.json()
+    - `mode` (string, optional): `fixed` to pick the nearest spot every interval along the route, or `optimal`
+      to pick stops that keep every leg within the interval while minimising the `objective` (default: `fixed`)
+
+    - `objective` (string, optional): In `optimal` mode, minimise total `deviation` or number of `stops` (default: `deviation`)
 
-        routes_with_parking = []  # For returning
+    - `corridorM` (integer, optional): Also return every parking spot within this many meters of each route,
+      with its distance along the route, as `corridor_parking_spots` (max: 1000)
 
-        # Find parking spots along the main route
-        spots = find_parking_spots_along_route(route_data, interval_mins=intervalMins)
-        routes_with_parking.append(transform_route_data(route_data, spots))
+    - `columnar` (boolean, optional): Return parking spots as arrays of each field instead of one object per spot (default: false)
 
-        # Handle any alternative routes
-        alt_routes = route_data.get(ONEMAP_ALT_ROUTES_KEY, [])
-        for alt_route in alt_routes:
-            alt_spots = find_parking_spots_along_route(alt_route, interval_mins=intervalMins)
-            routes_with_parking.append(transform_route_data(alt_route, alt_spots))
+    Responses are JSON, or MessagePack if requested with `Accept: application/msgpack`.
+    """
+    try:
+        # Rejected before the cache or any routing backend sees them
+        start_coords = parse_coordinates(unquote(start))
+        end_coords = parse_coordinates(unquote(end))
 
-        routes_with_parking.sort(key=lambda x: x['route_summary']['total_time_s'])  # Sort by total time in ascending order
+        cache_key = build_route_cache_key(
+            start, end, intervalMins, settings_dep.ROUTE_CACHE_GRID_DEG, mode, objective, corridorM
+        )
+        cache = get_route_cache() if settings_dep.ROUTE_CACHE_ENABLED else None
+        if cache is not None:
+            with timed('cache.get'):
+                cached_routes = await cache.get(cache_key)
+            if cached_routes is not None:
+                return _routes_response(request, cached_routes, columnar, headers={'X-Cache': 'HIT'})
 
+        # Identical requests arriving together wait on one computation instead of each calling OneMap.
+        # Keyed on the exact points rather than the snapped cache key, as nearby points have different routes
+        flight_key = (start_coords, end_coords, intervalMins, mode, objective, corridorM)
+        routes_with_parking = await _routes_flight.do(
+            flight_key,
+            lambda: _compute_routes(cache, cache_key, start, end, intervalMins, mode, objective, corridorM)
+        )
+
+        return _routes_response(
+            request, routes_with_parking, columnar, headers={'X-Cache': 'MISS'} if cache is not None else None
+        )
+    except RouteNotFoundError as e:
         return JSONResponse(
-            content=routes_with_parking,
-            status_code=status.HTTP_200_OK
+            content={'error': str(e)},
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+    except InvalidCoordinatesError as e:
+        return JSONResponse(
+            content={'error': str(e)},
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT
         )
-    except requests.RequestException as e:  # Error with OneMap API request
+    except (httpx.HTTPError, TokenUnavailableError) as e:  # Error with OneMap API request
         return JSONResponse(
             content={'error': str(e)},
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE
         )
+    except (PoolTimeout, TooManyRequests) as e:  # Every database connection is busy, fail fast rather than queue
+        return JSONResponse(
+            content={'error': str(e)},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': '1'}
+        )
     except Exception as e:
         import traceback
         return JSONResponse(
             content={'error': str(e), 'trace': traceback.format_exc()},
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+def _routes_response(request: Request, routes: List[Dict], columnar: bool, headers: Optional[Dict] = None) -> Response:
+    with timed('serialise'):
+        if columnar:
+            routes = [to_columnar_parking_spots(route) for route in routes]
+        return negotiated_response(request, routes, headers=headers)
+
+
+async def _compute_routes(
+    cache: Optional[CacheBackend],
+    cache_key: str,
+    start: str,
+    end: str,
+    interval_mins: int,
+    mode: ParkingMode = 'fixed',
+    objective: ParkingObjective = 'deviation',
+    corridor_m: Optional[int] = None
+) -> List[Dict]:
+    ONEMAP_ALT_ROUTES_KEY = 'alternativeroute'
+
+    route_data = await get_routing_backend().route(start, end)
+
+    # Find parking spots along the main route and any alternative routes concurrently
+    routes = [route_data, *route_data.get(ONEMAP_ALT_ROUTES_KEY, [])]
+    routes_with_parking = await asyncio.gather(
+        *(_find_route_with_parking_spots(route, interval_mins, mode, objective, corridor_m) for route in routes)
+    )
+
+    routes_with_parking.sort(key=lambda x: x['route_summary']['total_time_s'])  # Sort by total time in ascending order
+
+    if cache is not None:
+        with timed('cache.set'):
+            await cache.set(cache_key, routes_with_parking)
+
+    return routes_with_parking
+
+
+async def _find_route_with_parking_spots(
+    route: Dict,
+    interval_mins: int,
+    mode: ParkingMode = 'fixed',
+    objective: ParkingObjective = 'deviation',
+    corridor_m: Optional[int] = None
+) -> Dict:
+    with timed('parking'):
+        spots = await find_parking_spots_along_route_async(
+            route, interval_mins=interval_mins, mode=mode, objective=objective
+        )
+        corridor_spots = (
+            await find_parking_spots_in_corridor_async(route, corridor_m) if corridor_m is not None else None
+        )
+    with timed('transform'):
+        return transform_route_data(route, spots, corridor_spots)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the route -> parking spots pipeline.
+Generates synthetic routes and parking spots across Singapore, times each stage of the pipeline
+and the full /api/v1/routes handler (with OneMap stubbed), and writes the results as JSON.
+
+Parking spots are served from the in-memory index by default, or from the database configured
+in .env with --postgres. Use --seed-db to insert the synthetic spots into that database first
+(they are removed afterwards). Never point --seed-db at a production database. With --explain,
+the query plans of the parking spot lookups are recorded too, showing which indexes they use.
+
+Usage:
+    python benchmarks/bench_route_pipeline.py --output bench.json
+"""
+
+import argparse
+from contextlib import asynccontextmanager
+import gzip
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import polyline
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+# OneMap is stubbed, so placeholder credentials are enough to import the app
+for key in ('DATAMALL_ACCOUNT_KEY', 'ONEMAP_EMAIL', 'ONEMAP_PASSWORD',
+            'POSTGRES_HOST', 'POSTGRES_DATABASE', 'POSTGRES_USER', 'POSTGRES_PASSWORD'):
+    os.environ.setdefault(key, 'benchmark')
+os.environ.setdefault('ONEMAP_BASE_URL', 'https://onemap.invalid')
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.config import get_settings  # noqa: E402
+from app.constants import DEFAULT_SEARCH_RADIUS_M  # noqa: E402
+from app.main import app  # noqa: E402
+from app.responses import encode_json, encode_msgpack, msgpack, orjson  # noqa: E402
+from app.utils import geometry  # noqa: E402
+from app.utils.parking import _compute_cumsum_distances, find_parking_spots_along_route  # noqa: E402
+from app.utils.route import to_columnar_parking_spots, transform_route_data  # noqa: E402
+from app.utils.spatial_index import ParkingSpotIndex  # noqa: E402
+
+# Constants
+SG_BOUNDS = {'lon': (103.62, 104.0), 'lat': (1.24, 1.46)}  # Rough bounding box of mainland Singapore
+ROUTE_LENGTHS_KM = [5, 20, 60]
+VERTEX_SPACINGS_M = [10, 50]
+INTERVAL_MINS = [10, 30]
+PARKING_SPOT_COUNT = 5000
+BENCH_DESCRIPTION_PREFIX = 'BENCHMARK SPOT'
+M_PER_DEG_LAT = 111_195
+
+
+def generate_route(length_km, vertex_spacing_m, rng):
+    """
+    Generate a meandering route that stays within Singapore.
+
+    Args:
+        length_km: Approximate route length in kilometers
+        vertex_spacing_m: Distance between consecutive vertices in meters
+        rng: NumPy random generator
+
+    Returns:
+        Route dictionary in OneMap's response format
+    """
+    n_vertices = max(2, int(length_km * 1000 / vertex_spacing_m) + 1)
+    lon = rng.uniform(*SG_BOUNDS['lon'])
+    lat = rng.uniform(*SG_BOUNDS['lat'])
+    heading = rng.uniform(0, 2 * math.pi)
+
+    coords = []
+    for _ in range(n_vertices):
+        coords.append((lon, lat))
+        heading += rng.normal(0, 0.2)
+        next_lon = lon + math.cos(heading) * vertex_spacing_m / (M_PER_DEG_LAT * math.cos(math.radians(lat)))
+        next_lat = lat + math.sin(heading) * vertex_spacing_m / M_PER_DEG_LAT
+
+        # Turn back when about to leave the island
+        if not (SG_BOUNDS['lon'][0] < next_lon < SG_BOUNDS['lon'][1] and SG_BOUNDS['lat'][0] < next_lat < SG_BOUNDS['lat'][1]):
+            heading += math.pi
+            continue
+        lon, lat = next_lon, next_lat
+
+    total_distance_m = float(_compute_cumsum_distances(coords)[-1])
+    return {
+        'route_geometry': polyline.encode(coords, geojson=True),
+        'route_instructions': [['Head', 'SYNTHETIC ROAD', 0, f'{lat},{lon}', 0, 'Head along SYNTHETIC ROAD']] * 20,
+        'route_summary': {
+            'start_point': 'SYNTHETIC START',
+            'end_point': 'SYNTHETIC END',
+            'total_time': int(total_distance_m / 4),
+            'total_distance': total_distance_m
+        },
+        '_coords': coords
+    }
+
+
+def generate_parking_spots(count, rng):
+    """Generate parking spot rows ordered as per `ParkingSpotIndex.COLUMNS`."""
+    lons = rng.uniform(*SG_BOUNDS['lon'], count)
+    lats = rng.uniform(*SG_BOUNDS['lat'], count)
+    return [
+        (i, f'{BENCH_DESCRIPTION_PREFIX} {i}', float(lon), float(lat), 'Racks', int(rng.integers(2, 40)), 'Y')
+        for i, (lon, lat) in enumerate(zip(lons, lats), 1)
+    ]
+
+
+def seed_database(rows):
+    from app.db import execute_update
+
+    for _, description, lon, lat, rack_type, rack_count, shelter_indicator in rows:
+        execute_update("""
+            INSERT INTO parking_spots (description, coordinates, rack_type, rack_count, shelter_indicator)
+            VALUES (%s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s, %s)
+            ON CONFLICT (description) DO NOTHING;
+        """, (description, lon, lat, rack_type, rack_count, shelter_indicator))
+
+    execute_update("ANALYZE parking_spots;")  # Fresh statistics, so the planner costs the indexes realistically
+
+
+def clean_database():
+    from app.db import execute_update
+
+    execute_update("DELETE FROM parking_spots WHERE description LIKE %s;", (f'{BENCH_DESCRIPTION_PREFIX} %',))
+
+
+def measure(func, repeat, setup=None):
+    """
+    Time a function over several runs.
+
+    Returns:
+        Dictionary of timing statistics in milliseconds
+    """
+    timings_ms = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings_ms.append((time.perf_counter() - start) * 1000)
+
+    timings_ms.sort()
+    return {
+        'runs': repeat,
+        'min_ms': round(timings_ms[0], 4),
+        'median_ms': round(statistics.median(timings_ms), 4),
+        'p95_ms': round(timings_ms[min(len(timings_ms) - 1, int(0.95 * len(timings_ms)))], 4),
+        'mean_ms': round(statistics.fmean(timings_ms), 4)
+    }
+
+
+@asynccontextmanager
+async def _handler_lifespan(app, postgres):
+    """Open only the async connection pool when querying the database, instead of running the app's full startup."""
+    if not postgres:
+        yield
+        return
+
+    from app.db import close_async_connection_pool, initialize_async_connection_pool
+    await initialize_async_connection_pool()
+    try:
+        yield
+    finally:
+        await close_async_connection_pool()
+
+
+def benchmark_handler(route, interval_mins, repeat, postgres=False):
+    """Time the full /api/v1/routes handler with OneMap and the route cache stubbed out."""
+    onemap_route = {key: value for key, value in route.items() if key != '_coords'}
+
+    mock_response = MagicMock()
+    mock_response.json = MagicMock(return_value=onemap_route)
+    mock_client = MagicMock()
+    mock_client.get = AsyncMock(return_value=mock_response)
+
+    app.dependency_overrides[get_settings] = lambda: get_settings().model_copy(update={'ROUTE_CACHE_ENABLED': False})
+    params = {'start': '1.3,103.8', 'end': '1.35,103.9', 'intervalMins': interval_mins}
+
+    try:
+        # Requests run on one event loop while the client is open, so the async pool can serve them all
+        with (
+            patch.object(app.router, 'lifespan_context', lambda app: _handler_lifespan(app, postgres)),
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            TestClient(app) as client
+        ):
+            def call():
+                response = client.get('/api/v1/routes', params=params)
+                assert response.status_code == 200, response.text
+
+            return measure(call, repeat)
+    finally:
+        app.dependency_overrides.pop(get_settings, None)
+
+
+def benchmark_encodings(routes, repeat):
+    """
+    Time every response encoding of transformed routes and record the payload size, raw and gzipped.
+
+    Returns:
+        List of results, one for each encoding and layout
+    """
+    encoders = {'json': lambda content: json.dumps(content).encode('utf-8')}
+    if orjson is not None:
+        encoders['orjson'] = encode_json
+    if msgpack is not None:
+        encoders['msgpack'] = encode_msgpack
+
+    layouts = {'objects': routes, 'columnar': [to_columnar_parking_spots(route) for route in routes]}
+
+    results = []
+    for layout, content in layouts.items():
+        for encoding, encode in encoders.items():
+            body = encode(content)
+            results.append({
+                'name': 'encode_routes',
+                'params': {'encoding': encoding, 'layout': layout},
+                'bytes': len(body),
+                'gzip_bytes': len(gzip.compress(body, compresslevel=6)),
+                **measure(lambda: encode(content), repeat)
+            })
+    return results
+
+
+def explain_query(query, params):
+    """
+    Run a query under EXPLAIN ANALYZE.
+
+    Returns:
+        Dictionary with the planning and execution times in milliseconds, the plan node types and the indexes scanned
+    """
+    from app.db import execute_query
+
+    rows = execute_query(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}', params)
+    plan = rows[0]['QUERY PLAN'][0]
+
+    node_types, indexes = [], set()
+    nodes = [plan['Plan']]
+    while nodes:
+        node = nodes.pop()
+        node_types.append(node['Node Type'])
+        if 'Index Name' in node:
+            indexes.add(node['Index Name'])
+        nodes.extend(node.get('Plans', []))
+
+    return {
+        'planning_ms': plan['Planning Time'],
+        'execution_ms': plan['Execution Time'],
+        'node_types': node_types,
+        'indexes': sorted(indexes)
+    }
+
+
+def benchmark_query_plans(route, interval_mins):
+    """Explain the single and batched nearest parking spot queries for the checkpoints of a route."""
+    from app.utils.parking import (
+        _NEAREST_PARKING_SPOT_QUERY,
+        _NEAREST_PARKING_SPOTS_QUERY,
+        _compute_checkpoint_coords,
+        _nearest_parking_spots_params
+    )
+
+    ckpt_coords = _compute_checkpoint_coords(route, interval_mins)
+    lon, lat = ckpt_coords[0]
+    return [
+        {
+            'name': 'explain.nearest_parking_spot',
+            'params': {'interval_mins': interval_mins},
+            **explain_query(_NEAREST_PARKING_SPOT_QUERY, (lon, lat, lon, lat, DEFAULT_SEARCH_RADIUS_M, lon, lat))
+        },
+        {
+            'name': 'explain.nearest_parking_spots',
+            'params': {'interval_mins': interval_mins, 'checkpoints': len(ckpt_coords)},
+            **explain_query(_NEAREST_PARKING_SPOTS_QUERY, _nearest_parking_spots_params(ckpt_coords))
+        }
+    ]
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', type=Path, help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per benchmark (default: 20)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for synthetic data (default: 42)')
+    parser.add_argument('--spots', type=int, default=PARKING_SPOT_COUNT, help='Number of synthetic parking spots')
+    parser.add_argument('--postgres', action='store_true', help='Query the database in .env instead of the in-memory index')
+    parser.add_argument('--seed-db', action='store_true', help='Insert the synthetic parking spots into the database')
+    parser.add_argument('--explain', action='store_true', help='Record the query plans of parking spot lookups (requires --postgres)')
+    args = parser.parse_args()
+
+    if args.explain and not args.postgres:
+        parser.error('--explain requires --postgres')
+
+    rng = np.random.default_rng(args.seed)
+    rows = generate_parking_spots(args.spots, rng)
+
+    if args.postgres:
+        from app.db import close_connection_pool, initialize_connection_pool
+        initialize_connection_pool()
+        if args.seed_db:
+            seed_database(rows)
+        index = None
+    else:
+        index = ParkingSpotIndex()
+        index.build(rows)
+
+    results = []
+    try:
+        with patch('app.utils.parking.get_parking_spot_index', return_value=index):
+            for length_km in ROUTE_LENGTHS_KM:
+                for spacing_m in VERTEX_SPACINGS_M:
+                    route = generate_route(length_km, spacing_m, rng)
+                    params = {'length_km': length_km, 'vertex_spacing_m': spacing_m, 'vertices': len(route['_coords'])}
+
+                    results.append({
+                        'name': 'compute_cumsum_distances',
+                        'params': params,
+                        **measure(lambda: _compute_cumsum_distances(route['_coords']), args.repeat)
+                    })
+
+                    for interval_mins in INTERVAL_MINS:
+                        interval_params = {**params, 'interval_mins': interval_mins}
+                        spots = find_parking_spots_along_route(route, interval_mins)
+
+                        results.append({
+                            'name': 'find_parking_spots_along_route.cold',
+                            'params': interval_params,
+                            **measure(
+                                lambda: find_parking_spots_along_route(route, interval_mins),
+                                args.repeat,
+                                setup=geometry._geometry_cache.clear
+                            )
+                        })
+                        results.append({
+                            'name': 'find_parking_spots_along_route.warm',
+                            'params': interval_params,
+                            **measure(lambda: find_parking_spots_along_route(route, interval_mins), args.repeat)
+                        })
+                        results.append({
+                            'name': 'transform_route_data',
+                            'params': {**interval_params, 'spots': len(spots)},
+                            **measure(lambda: transform_route_data(route, spots), args.repeat)
+                        })
+                        results.append({
+                            'name': 'routes_handler',
+                            'params': interval_params,
+                            **benchmark_handler(route, interval_mins, args.repeat, postgres=args.postgres)
+                        })
+
+                        if args.explain:
+                            for result in benchmark_query_plans(route, interval_mins):
+                                result['params'] = {**interval_params, **result['params']}
+                                results.append(result)
+
+                        transformed = [transform_route_data(route, spots)]
+                        for result in benchmark_encodings(transformed, args.repeat):
+                            result['params'] = {**interval_params, **result['params']}
+                            results.append(result)
+    finally:
+        if args.postgres:
+            if args.seed_db:
+                clean_database()
+            close_connection_pool()
+
+    report = {
+        'metadata': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': get_git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'parking_backend': 'postgres' if args.postgres else 'memory',
+            'parking_spots': args.spots,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + '\n')
+        print(f"Wrote {len(results)} results to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
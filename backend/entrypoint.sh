@@ -1,17 +1,12 @@
 #!/bin/hash
 set -e
 
-echo "Fetch parking spots data..."
-python scripts/fetch_parking_spots.py
-
 echo "Waiting for database at ${POSTGRES_HOST}:${POSTGRES_PORT}..."
 while ! nc -z "${POSTGRES_HOST}" "${POSTGRES_PORT}"; do
   sleep 1
 done
 echo "Database connected!"
 
-echo "Loading parking spots into database..."
-python scripts/load_parking_spots.py
-
+# Parking spots data is ingested in the background by the API, see `app/ingest.py`
 echo "Starting backend server..."
 uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 2
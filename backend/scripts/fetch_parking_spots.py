@@ -2,18 +2,31 @@
 """
 Script to fetch parking spots data from LTA DataMall API.
 Queries BicycleParkingv2 endpoint for locations defined in locations.json.
+Locations are fetched concurrently under a shared rate limit, with retries and backoff.
+Records are streamed to the NDJSON file as each location completes, and progress is
+checkpointed so an interrupted run resumes where it left off. Neighbouring locations return
+overlapping results, so records already written are dropped as they stream in.
+After each run, a manifest with per-location and snapshot fingerprints is written so the loader
+can skip reloads when nothing changed.
 """
 
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import logging
 import os
+import random
 import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from parking_records import SnapshotFingerprint, combine_fingerprints, record_fingerprint, record_key
 
 
 ROOT_PATH = Path(__file__).resolve().parent.parent
@@ -35,7 +48,183 @@ API_URL = 'https://datamall2.mytransport.sg/ltaodataservice/BicycleParkingv2'
 DIST = 5  # Distance in kilometers
 LOCATIONS_FILE = DATA_PATH / 'locations.json'
 OUTPUT_FILE = DATA_PATH / 'parking_spots_data.ndjson'
-REQUEST_DELAY_S = 1  # Seconds between requests
+CHECKPOINT_FILE = DATA_PATH / 'parking_spots_fetch_checkpoint.json'
+MANIFEST_FILE = DATA_PATH / 'parking_spots_manifest.json'
+MAX_WORKERS = 4  # Concurrent requests in flight
+REQUESTS_PER_S = 2  # Sustained request rate across all workers
+BURST_SIZE = 2  # Requests allowed back-to-back before the rate limit applies
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 1  # Doubles on every retry
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+DEDUPE_MAX_KEYS = 500_000  # Caps memory used to track written records (~70 bytes per key)
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the request rate shared by all workers."""
+
+    def __init__(self, rate_per_s, capacity):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_s)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate_per_s
+
+            time.sleep(wait_s)
+
+
+class FetchCheckpoint:
+    """
+    Tracks which locations have been written to the output file, with the fingerprint of each.
+    Saved atomically after every location so an interrupted run can resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}  # Location ID as a string (JSON object keys) -> fingerprint of its records
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load progress from a previous run. Returns True if there was one."""
+        try:
+            with open(self.path, 'r') as f:
+                completed = json.load(f).get('completed', {})
+            # Checkpoints written before fingerprinting hold a plain list of IDs
+            if not isinstance(completed, dict):
+                completed = dict.fromkeys(completed)
+            self.completed = {str(location_id): fingerprint for location_id, fingerprint in completed.items()}
+            return True
+        except FileNotFoundError:
+            return False
+        except (json.JSONDecodeError, AttributeError, TypeError) as e:
+            logging.warning(f"Ignoring invalid checkpoint file {self.path}: {e}")
+            return False
+
+    def mark_completed(self, location_id, fingerprint):
+        with self._lock:
+            self.completed[str(location_id)] = fingerprint
+            write_json_atomic(self.path, {'completed': self.completed, 'updated_at': datetime.now().isoformat()})
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+def write_json_atomic(path, data):
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_manifest():
+    """Load the manifest written by the previous fetch, or None if there is none."""
+    try:
+        with open(MANIFEST_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(writer, checkpoint, complete):
+    """
+    Write the manifest describing the output file.
+
+    Args:
+        writer: RecordWriter that produced the output file
+        checkpoint: FetchCheckpoint holding the fingerprint of every fetched location
+        complete: Whether every location was fetched, so records missing from the file were removed upstream
+    """
+    write_json_atomic(MANIFEST_FILE, {
+        'snapshot_fingerprint': writer.snapshot.hexdigest(),
+        'record_count': writer.snapshot.count,
+        'complete': complete,
+        'locations': checkpoint.completed,
+        'generated_at': datetime.now().isoformat()
+    })
+
+
+class RecordWriter:
+    """
+    Appends records to the NDJSON output file as they arrive, one location at a time.
+    Records already written by another location are skipped, and the fingerprint of every record
+    written is folded into the snapshot fingerprint of the file.
+    """
+
+    def __init__(self, path, append):
+        self._seen = set()
+        self._dedupe_full = False
+        self.snapshot = SnapshotFingerprint()
+        if append:
+            self._load_seen(path)
+
+        self._file = open(path, 'a' if append else 'w')
+        self._lock = threading.Lock()
+        self.record_count = 0
+        self.duplicate_count = 0
+
+    def _load_seen(self, path):
+        """Seed the duplicate filter and snapshot fingerprint with records written by a previous run."""
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._remember(record_key(record))
+                    self.snapshot.add(record_fingerprint(record))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, key):
+        if len(self._seen) < DEDUPE_MAX_KEYS:
+            self._seen.add(key)
+        elif not self._dedupe_full:
+            # Past the cap, duplicates are still resolved by the loader's upsert
+            self._dedupe_full = True
+            logging.warning(f"Duplicate filter reached {DEDUPE_MAX_KEYS} keys, further duplicates will be written")
+
+    def write_location(self, records):
+        """
+        Write a location's records, skipping duplicates.
+
+        Returns:
+            Tuple of (records written, duplicates skipped)
+        """
+        with self._lock:
+            written = 0
+            for record in records:
+                key = record_key(record)
+                if key in self._seen:
+                    continue
+
+                self._remember(key)
+                self.snapshot.add(record_fingerprint(record))
+                self._file.write(json.dumps(record) + '\n')
+                written += 1
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            duplicates = len(records) - written
+            self.record_count += written
+            self.duplicate_count += duplicates
+            return written, duplicates
+
+    def close(self):
+        self._file.close()
 
 
 def load_locations():
@@ -53,15 +242,25 @@ def load_locations():
         sys.exit(1)
 
 
-def fetch_parking_spots(lat, lon, account_key):
+def create_session(pool_size):
+    """Create an HTTP session that keeps connections to DataMall alive across requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_parking_spots(session, rate_limiter, lat, lon, account_key):
     """
-    Fetch parking spots data from LTA DataMall API.
-    
+    Fetch parking spots data from LTA DataMall API, retrying transient failures with exponential backoff.
+
     Args:
+        session: HTTP session shared by all workers
+        rate_limiter: Token bucket shared by all workers
         lat: Latitude coordinate
         lon: Longitude coordinate
         account_key: API account key for authentication
-        
+
     Returns:
         List of parking spots records or None on error
     """
@@ -70,28 +269,73 @@ def fetch_parking_spots(lat, lon, account_key):
         'Long': lon,
         'Dist': DIST
     }
-    
+
     headers = {
         'AccountKey': account_key
     }
-    
-    try:
-        response = requests.get(API_URL, params=params, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        return data.get('value', [])
-    
-    except requests.exceptions.RequestException as e:
-        logging.error(f"API request failed for lat={lat}, lon={lon}: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        logging.error(f"Invalid JSON response for lat={lat}, lon={lon}: {e}")
+
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+
+        try:
+            response = session.get(API_URL, params=params, headers=headers, timeout=30)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                data = response.json()
+                return data.get('value', [])
+
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.HTTPError as e:  # Client errors will not succeed on retry
+            logging.error(f"API request failed for lat={lat}, lon={lon}: {e}")
+            return None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = str(e)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"API request failed for lat={lat}, lon={lon}: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            logging.error(f"Invalid JSON response for lat={lat}, lon={lon}: {e}")
+            return None
+
+        if attempt < MAX_RETRIES:
+            backoff_s = BACKOFF_BASE_S * 2**attempt * random.uniform(0.5, 1.5)
+            logging.warning(f"Request for lat={lat}, lon={lon} failed ({error}), retrying in {backoff_s:.1f}s")
+            time.sleep(backoff_s)
+        else:
+            logging.error(f"API request failed for lat={lat}, lon={lon} after {MAX_RETRIES + 1} attempts: {error}")
+
+    return None
+
+
+def fetch_location(session, rate_limiter, writer, checkpoint, location, account_key):
+    """
+    Fetch one location and stream its new records to the output file.
+
+    Returns:
+        Tuple of (records retrieved, duplicates skipped), or None on error
+    """
+    location_id = location['ID']
+    records = fetch_parking_spots(session, rate_limiter, location['Latitude'], location['Longitude'], account_key)
+    if records is None:
         return None
 
+    _, duplicates = writer.write_location(records)
+    checkpoint.mark_completed(location_id, combine_fingerprints(map(record_fingerprint, records)))
+    return len(records), duplicates
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fetch parking spots data from LTA DataMall.')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Concurrent requests in flight')
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_S, help='Maximum requests per second')
+    parser.add_argument('--fresh', action='store_true', help='Ignore any checkpoint and fetch every location again')
+    return parser.parse_args()
+
 
 def main():
     """Main execution function."""
+    args = parse_args()
+
     logging.info("=" * 80)
     logging.info("Starting parking spots data fetch")
     start_time = datetime.now()
@@ -106,63 +350,110 @@ def main():
     
     # Load locations
     locations = load_locations()
-    
-    # Fetch data for all locations
-    all_records = []
+
+    # Resume from a previous interrupted run, appending to its partial output
+    checkpoint = FetchCheckpoint(CHECKPOINT_FILE)
+    resuming = not args.fresh and checkpoint.load()
+    pending = [location for location in locations if str(location['ID']) not in checkpoint.completed]
+    if resuming:
+        logging.info(f"Resuming from checkpoint: {len(locations) - len(pending)} locations already fetched")
+
+    try:
+        writer = RecordWriter(OUTPUT_FILE, append=resuming)
+    except IOError as e:
+        logging.error(f"Failed to open output file {OUTPUT_FILE}: {e}")
+        sys.exit(1)
+
+    # Fetch data for all pending locations
+    rate_limiter = TokenBucket(rate_per_s=args.rate, capacity=BURST_SIZE)
+    session = create_session(pool_size=args.workers)
     success_count = 0
     failure_count = 0
-    
-    for i, location in enumerate(locations, 1):
-        location_id = location['ID']
-        lat = location['Latitude']
-        lon = location['Longitude']
-        desc = location['Description']
-        
-        logging.info(f"Processing location {i}/{len(locations)}: ID={location_id}, {desc}")
-        
-        records = fetch_parking_spots(lat, lon, account_key)
-        
-        if records is not None:
-            success_count += 1
-            record_count = len(records)
-            all_records.extend(records)
-            logging.info(f"  Retrieved {record_count} parking spots records")
-        else:
-            failure_count += 1
-            logging.warning(f"  Failed to retrieve data for location {location_id}")
-        
-        # Delay between requests (except after the last one)
-        if i < len(locations):
-            time.sleep(REQUEST_DELAY_S)
-    
-    # Write results to NDJSON file
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(fetch_location, session, rate_limiter, writer, checkpoint, location, account_key): location
+            for location in pending
+        }
+
+        for i, future in enumerate(as_completed(futures), 1):
+            location = futures[future]
+            location_id = location['ID']
+            desc = location['Description']
+
+            try:
+                result = future.result()
+            except IOError as e:
+                logging.error(f"Failed to write records for location {location_id}: {e}")
+                result = None
+
+            if result is not None:
+                success_count += 1
+                record_count, duplicates = result
+                duplicate_ratio = duplicates / record_count if record_count else 0.0
+                logging.info(f"Processed location {i}/{len(pending)}: ID={location_id}, {desc}")
+                logging.info(
+                    f"  Retrieved {record_count} parking spots records, "
+                    f"{duplicates} duplicates skipped ({duplicate_ratio:.1%})"
+                )
+            else:
+                failure_count += 1
+                logging.warning(f"  Failed to retrieve data for location {location_id}")
+
+    writer.close()
+    session.close()
+
+    # Compare against the previous fetch before the manifest is replaced
+    previous_manifest = load_manifest()
+    previous_locations = previous_manifest.get('locations', {}) if previous_manifest else {}
+    changed_locations = [
+        location_id for location_id, fingerprint in checkpoint.completed.items()
+        if previous_locations.get(location_id) != fingerprint
+    ]
+
     try:
-        with open(OUTPUT_FILE, 'w') as f:
-            for record in all_records:
-                f.write(json.dumps(record) + '\n')
-        
-        logging.info(f"Successfully wrote {len(all_records)} records to {OUTPUT_FILE}")
+        write_manifest(writer, checkpoint, complete=failure_count == 0)
     except IOError as e:
-        logging.error(f"Failed to write output file {OUTPUT_FILE}: {e}")
+        logging.error(f"Failed to write manifest {MANIFEST_FILE}: {e}")
         sys.exit(1)
-    
+
+    # Keep the checkpoint after failures so the next run only retries the failed locations
+    if failure_count == 0:
+        checkpoint.clear()
+
+    logging.info(f"Successfully wrote {writer.record_count} records to {OUTPUT_FILE}")
+
     # Summary
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
+    total_retrieved = writer.record_count + writer.duplicate_count
+    duplicate_ratio = writer.duplicate_count / total_retrieved if total_retrieved else 0.0
     
     logging.info("-" * 80)
     logging.info(f"Fetch completed in {duration:.2f} seconds")
-    logging.info(f"Locations processed: {len(locations)}")
+    logging.info(f"Locations processed: {len(pending)}")
     logging.info(f"Successful requests: {success_count}")
     logging.info(f"Failed requests: {failure_count}")
-    logging.info(f"Total records retrieved: {len(all_records)}")
+    logging.info(f"Total records written: {writer.record_count}")
+    logging.info(f"Duplicate records skipped: {writer.duplicate_count} ({duplicate_ratio:.1%})")
+    logging.info(f"Locations changed since last fetch: {len(changed_locations)}")
+    logging.info(f"Snapshot fingerprint: {writer.snapshot.hexdigest()}")
     logging.info("=" * 80)
     
-    print(f"Fetch completed: {len(all_records)} records from {success_count}/{len(locations)} locations")
+    print(f"Fetch completed: {writer.record_count} records from {success_count}/{len(pending)} locations")
+    print(f"Duplicates skipped: {writer.duplicate_count} ({duplicate_ratio:.1%})")
+    print(f"Locations changed since last fetch: {len(changed_locations)}")
     print(f"Duration: {duration:.2f} seconds")
     print(f"Output: {OUTPUT_FILE}")
     print(f"Log: {LOGS_PATH / 'fetch_parking_spots.log'}")
 
+    # A complete outage must not look like a successful run to the ingest, which checks the exit status.
+    # Judged on locations fetched rather than records written, as a resumed run may only fetch records
+    # already written by the run it resumes
+    if pending and success_count == 0:
+        logging.error(f"Failed to retrieve data for all {len(pending)} locations")
+        sys.exit(1)
+
 
 if __name__ == '__main__':
     main()
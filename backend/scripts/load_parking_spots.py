@@ -2,9 +2,20 @@
 """
 Script to load parking spots data from NDJSON file into PostgreSQL database.
 Reads parking_spots_data.ndjson and populates the parking_spots table.
-Uses batch processing (1000 records) for efficiency.
+
+Two modes are available:
+- copy (default): streams the file through COPY into an unlogged staging table, then merges it into
+  parking_spots with a single set-based statement. The whole load is one transaction, so readers
+  see either the old or the new data. Use --prune to also delete spots missing from the file.
+- batch: upserts records row by row in batches of 1000, committing after each batch.
+
+Every row stores a fingerprint of its fields, so only inserted, changed and removed spots are written.
+The fingerprint of the whole file is kept in parking_spots_version, and the load is skipped entirely
+when it matches (use --force to load anyway). The version number in that table is bumped whenever rows
+change, so the API knows when to refresh its in-memory data.
 """
 
+import argparse
 import json
 import logging
 import os
@@ -15,6 +26,8 @@ from pathlib import Path
 import psycopg
 from dotenv import load_dotenv
 
+from parking_records import SnapshotFingerprint, record_fingerprint
+
 
 ROOT_PATH = Path(__file__).resolve().parent.parent
 LOGS_PATH = ROOT_PATH / 'logs'
@@ -32,7 +45,11 @@ logging.basicConfig(
 
 # Constants
 NDJSON_FILE = DATA_PATH / 'parking_spots_data.ndjson'
+MANIFEST_FILE = DATA_PATH / 'parking_spots_manifest.json'
 TABLE_NAME = 'parking_spots'
+STAGING_TABLE_NAME = 'parking_spots_staging'
+VERSION_TABLE_NAME = 'parking_spots_version'
+SCHEMA_LOCK_ID = 0x50495354  # Serialises schema upgrades by API workers starting together
 BATCH_SIZE = 1000
 
 
@@ -91,6 +108,114 @@ def verify_table_exists(conn):
         return False
 
 
+def ensure_schema(conn):
+    """
+    Add the fingerprint and geography columns and the version table to databases created before they existed.
+
+    The loader runs beside the live API, so DDL is only issued for what is actually missing: even a no-op
+    `ALTER TABLE ... ADD COLUMN IF NOT EXISTS` takes an ACCESS EXCLUSIVE lock that blocks parking lookups.
+
+    Args:
+        conn: PostgreSQL connection object
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name IN ('fingerprint', 'geog');
+        """, (TABLE_NAME,))
+        columns = {row[0] for row in cursor.fetchall()}
+
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (f'{TABLE_NAME}_geog_idx',))
+        geog_index_exists = cursor.fetchone()[0]
+
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (VERSION_TABLE_NAME,))
+        version_table_exists = cursor.fetchone()[0]
+
+        if {'fingerprint', 'geog'} <= columns and geog_index_exists and version_table_exists:
+            conn.commit()
+            return
+
+        # Held until commit, so workers upgrading at once run the DDL one at a time and later ones no-op
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_ID,))
+
+        if 'fingerprint' not in columns:
+            logging.info(f"Adding fingerprint column to '{TABLE_NAME}'")
+            cursor.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS fingerprint CHAR(32);")
+        if 'geog' not in columns:
+            logging.info(f"Adding geog column to '{TABLE_NAME}'")
+            cursor.execute(f"""
+                ALTER TABLE {TABLE_NAME}
+                ADD COLUMN IF NOT EXISTS geog GEOGRAPHY(POINT, 4326)
+                GENERATED ALWAYS AS (coordinates::geography) STORED;
+            """)
+        if not geog_index_exists:
+            logging.info(f"Creating index '{TABLE_NAME}_geog_idx'")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_geog_idx ON {TABLE_NAME} USING GIST (geog);")
+        if not version_table_exists:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {VERSION_TABLE_NAME} (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    version BIGINT NOT NULL DEFAULT 0,
+                    snapshot_fingerprint TEXT,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """)
+            cursor.execute(f"INSERT INTO {VERSION_TABLE_NAME} (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;")
+    conn.commit()
+
+
+def get_stored_snapshot_fingerprint(conn):
+    """Return the fingerprint of the last file loaded, or None if nothing was loaded yet."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT snapshot_fingerprint FROM {VERSION_TABLE_NAME};")
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def update_version(conn, snapshot_fingerprint, changed):
+    """
+    Record the fingerprint of the loaded file, bumping the version if any rows changed.
+    Runs in the caller's transaction.
+
+    Args:
+        conn: PostgreSQL connection object
+        snapshot_fingerprint: Fingerprint of the loaded file
+        changed: Whether any parking spots were inserted, updated or deleted
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {VERSION_TABLE_NAME}
+            SET version = version + %s, snapshot_fingerprint = %s, updated_at = now();
+        """, (1 if changed else 0, snapshot_fingerprint))
+
+
+def compute_snapshot_fingerprint():
+    """
+    Fingerprint the NDJSON file, matching the snapshot fingerprint computed by the fetch script.
+
+    Returns:
+        Tuple of (snapshot fingerprint, records read)
+    """
+    snapshot = SnapshotFingerprint()
+    for record in read_ndjson_file():
+        snapshot.add(record_fingerprint(record))
+    return snapshot.hexdigest(), snapshot.count
+
+
+def is_manifest_complete(snapshot_fingerprint):
+    """
+    Check whether the fetch manifest says the NDJSON file covers every location.
+    The manifest is only trusted if it describes the same file.
+    """
+    try:
+        with open(MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+    return manifest.get('complete') is True and manifest.get('snapshot_fingerprint') == snapshot_fingerprint
+
+
 def read_ndjson_file():
     """
     Read and parse the NDJSON file.
@@ -135,7 +260,8 @@ def prepare_batch_data(records):
             record.get('Latitude'),   # latitude second for POINT
             record.get('RackType'),
             record.get('RackCount'),
-            record.get('ShelterIndicator')
+            record.get('ShelterIndicator'),
+            record_fingerprint(record)
         )
         batch_data.append(data)
     return batch_data
@@ -153,14 +279,16 @@ def insert_batch(conn, batch_data):
         Number of records processed, or None on error
     """
     upsert_query = """
-        INSERT INTO parking_spots (description, coordinates, rack_type, rack_count, shelter_indicator)
-        VALUES (%s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s, %s)
+        INSERT INTO parking_spots (description, coordinates, rack_type, rack_count, shelter_indicator, fingerprint)
+        VALUES (%s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s, %s, %s)
         ON CONFLICT (description) 
         DO UPDATE SET 
             coordinates = EXCLUDED.coordinates,
             rack_type = EXCLUDED.rack_type,
             rack_count = EXCLUDED.rack_count,
-            shelter_indicator = EXCLUDED.shelter_indicator;
+            shelter_indicator = EXCLUDED.shelter_indicator,
+            fingerprint = EXCLUDED.fingerprint
+        WHERE parking_spots.fingerprint IS DISTINCT FROM EXCLUDED.fingerprint;
     """
     
     try:
@@ -176,43 +304,157 @@ def insert_batch(conn, batch_data):
         return None
 
 
-def main():
-    """Main execution function."""
-    logging.info("=" * 80)
-    logging.info("Starting database import process")
-    start_time = datetime.now()
-    
-    # Load environment variables
-    load_dotenv()
-    
-    # Verify required environment variables
-    required_vars = ['POSTGRES_HOST', 'POSTGRES_DATABASE', 'POSTGRES_USER', 'POSTGRES_PASSWORD']
-    missing_vars = [var for var in required_vars if not os.getenv(var)]
-    
-    if missing_vars:
-        logging.error(f"Missing required environment variables: {', '.join(missing_vars)}")
-        print(f"Error: Missing environment variables: {', '.join(missing_vars)}")
-        print("Please add them to your .env file")
-        sys.exit(1)
-    
-    # Connect to database
-    conn = get_db_connection()
-    if not conn:
-        print("Error: Failed to connect to database. Check logs for details.")
-        sys.exit(1)
-    
-    # Verify table exists
-    if not verify_table_exists(conn):
-        print(f"Error: Table '{TABLE_NAME}' does not exist in database")
-        conn.close()
-        sys.exit(1)
-    
-    # Process records in batches
+def create_staging_table(conn):
+    """
+    Create the unlogged staging table if needed and empty it.
+
+    Args:
+        conn: PostgreSQL connection object
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {STAGING_TABLE_NAME} (
+                description VARCHAR(100),
+                longitude DOUBLE PRECISION,
+                latitude DOUBLE PRECISION,
+                rack_type VARCHAR(20),
+                rack_count INT,
+                shelter_indicator VARCHAR(1),
+                fingerprint CHAR(32)
+            );
+        """)
+        # Staging tables created before fingerprinting lack the column
+        cursor.execute(f"ALTER TABLE {STAGING_TABLE_NAME} ADD COLUMN IF NOT EXISTS fingerprint CHAR(32);")
+        cursor.execute(f"TRUNCATE {STAGING_TABLE_NAME};")
+
+
+def copy_records_to_staging(conn, records):
+    """
+    Stream records into the staging table using COPY.
+
+    Args:
+        conn: PostgreSQL connection object
+        records: Iterable of dictionaries from NDJSON
+
+    Returns:
+        Number of records copied
+    """
+    copied = 0
+    with conn.cursor() as cursor:
+        with cursor.copy(f"""
+            COPY {STAGING_TABLE_NAME} (description, longitude, latitude, rack_type, rack_count, shelter_indicator, fingerprint)
+            FROM STDIN
+        """) as copy:
+            for record in records:
+                copy.write_row(prepare_batch_data([record])[0])
+                copied += 1
+    return copied
+
+
+def merge_staging_table(conn, prune):
+    """
+    Merge the staging table into the parking spots table with set-based statements.
+    Rows whose fingerprint is unchanged are left untouched to avoid needless writes.
+
+    Args:
+        conn: PostgreSQL connection object
+        prune: Whether to delete parking spots that are missing from the staging table
+
+    Returns:
+        Tuple of (rows inserted or updated, rows deleted)
+    """
+    with conn.cursor() as cursor:
+        # DISTINCT ON keeps a single row per description, as ON CONFLICT cannot touch a row twice.
+        # Ordering by fingerprint picks the same row on every load, so duplicates do not flip-flop.
+        cursor.execute(f"""
+            INSERT INTO {TABLE_NAME} (description, coordinates, rack_type, rack_count, shelter_indicator, fingerprint)
+            SELECT DISTINCT ON (description)
+                description,
+                ST_SetSRID(ST_MakePoint(longitude, latitude), 4326),
+                rack_type,
+                rack_count,
+                shelter_indicator,
+                fingerprint
+            FROM {STAGING_TABLE_NAME}
+            WHERE description IS NOT NULL AND longitude IS NOT NULL AND latitude IS NOT NULL
+            ORDER BY description, fingerprint
+            ON CONFLICT (description)
+            DO UPDATE SET
+                coordinates = EXCLUDED.coordinates,
+                rack_type = EXCLUDED.rack_type,
+                rack_count = EXCLUDED.rack_count,
+                shelter_indicator = EXCLUDED.shelter_indicator,
+                fingerprint = EXCLUDED.fingerprint
+            WHERE {TABLE_NAME}.fingerprint IS DISTINCT FROM EXCLUDED.fingerprint;
+        """)
+        upserted = cursor.rowcount
+
+        deleted = 0
+        if prune:
+            cursor.execute(f"""
+                DELETE FROM {TABLE_NAME} AS spots
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {STAGING_TABLE_NAME} AS staging
+                    WHERE staging.description = spots.description
+                );
+            """)
+            deleted = cursor.rowcount
+
+    return upserted, deleted
+
+
+def load_with_copy(conn, prune, snapshot_fingerprint):
+    """
+    Load the NDJSON file through the staging table in a single transaction.
+
+    Args:
+        conn: PostgreSQL connection object
+        prune: Whether to delete parking spots that are missing from the file
+        snapshot_fingerprint: Fingerprint of the NDJSON file, stored once the load commits
+
+    Returns:
+        Tuple of (records read, rows inserted or updated, rows deleted), or None on error
+    """
+    try:
+        create_staging_table(conn)
+
+        logging.info(f"Copying records from {NDJSON_FILE} into {STAGING_TABLE_NAME}")
+        total_records = copy_records_to_staging(conn, read_ndjson_file())
+
+        if total_records == 0 and prune:
+            # An empty file most likely means a failed fetch, not that every spot is gone
+            logging.warning("No records read, skipping prune")
+            prune = False
+
+        upserted, deleted = merge_staging_table(conn, prune)
+        update_version(conn, snapshot_fingerprint, changed=upserted > 0 or deleted > 0)
+        conn.commit()
+    except psycopg.Error as e:
+        logging.error(f"Database error during copy load: {e}")
+        conn.rollback()
+        return None
+
+    logging.info(f"  Merged {total_records} records: {upserted} rows inserted or updated, {deleted} rows deleted")
+    return total_records, upserted, deleted
+
+
+def load_in_batches(conn, snapshot_fingerprint):
+    """
+    Load the NDJSON file with row-by-row upserts, committing every BATCH_SIZE records.
+
+    Args:
+        conn: PostgreSQL connection object
+        snapshot_fingerprint: Fingerprint of the NDJSON file, stored if every batch succeeds
+
+    Returns:
+        Tuple of (records read, batches, successful batches, failed batches)
+    """
     batch = []
     total_records = 0
     successful_batches = 0
     failed_batches = 0
     batch_number = 0
+    rows_changed = 0
     
     logging.info(f"Reading records from {NDJSON_FILE}")
     
@@ -231,6 +473,7 @@ def main():
             
             if rows_affected is not None:
                 successful_batches += 1
+                rows_changed += rows_affected
                 logging.info(f"  Batch {batch_number} completed: {rows_affected} rows affected")
             else:
                 failed_batches += 1
@@ -250,11 +493,101 @@ def main():
         
         if rows_affected is not None:
             successful_batches += 1
+            rows_changed += rows_affected
             logging.info(f"  Final batch completed: {rows_affected} rows affected")
         else:
             failed_batches += 1
             logging.warning(f"  ✗ Final batch failed")
+
+    # Without a stored fingerprint the next run reloads the file, retrying the failed batches
+    try:
+        update_version(conn, snapshot_fingerprint if failed_batches == 0 else None, changed=rows_changed > 0)
+        conn.commit()
+    except psycopg.Error as e:
+        logging.error(f"Database error while updating version: {e}")
+        conn.rollback()
+
+    return total_records, batch_number, successful_batches, failed_batches
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load parking spots data into the database.')
+    parser.add_argument('--mode', choices=['copy', 'batch'], default='copy', help='Load strategy (default: copy)')
+    parser.add_argument(
+        '--prune',
+        action='store_true',
+        help='Delete parking spots missing from the data file even if the fetch was incomplete (copy mode only)'
+    )
+    parser.add_argument('--force', action='store_true', help='Load the data file even if it is unchanged since the last load')
+    parser.add_argument('--schema-only', action='store_true', help='Upgrade the database schema and exit without loading data')
+    return parser.parse_args()
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+
+    logging.info("=" * 80)
+    logging.info("Starting database import process")
+    start_time = datetime.now()
+    
+    # Load environment variables
+    load_dotenv()
+    
+    # Verify required environment variables
+    required_vars = ['POSTGRES_HOST', 'POSTGRES_DATABASE', 'POSTGRES_USER', 'POSTGRES_PASSWORD']
+    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    
+    if missing_vars:
+        logging.error(f"Missing required environment variables: {', '.join(missing_vars)}")
+        print(f"Error: Missing environment variables: {', '.join(missing_vars)}")
+        print("Please add them to your .env file")
+        sys.exit(1)
+    
+    # Connect to database
+    conn = get_db_connection()
+    if not conn:
+        print("Error: Failed to connect to database. Check logs for details.")
+        sys.exit(1)
     
+    # Verify table exists
+    if not verify_table_exists(conn):
+        print(f"Error: Table '{TABLE_NAME}' does not exist in database")
+        conn.close()
+        sys.exit(1)
+
+    try:
+        ensure_schema(conn)
+        stored_fingerprint = get_stored_snapshot_fingerprint(conn)
+    except psycopg.Error as e:
+        logging.error(f"Failed to prepare schema: {e}")
+        print("Error: Failed to prepare schema. Check logs for details.")
+        conn.close()
+        sys.exit(1)
+
+    if args.schema_only:
+        conn.close()
+        logging.info("Schema is up to date, skipping import")
+        logging.info("=" * 80)
+        print("Schema is up to date")
+        return
+
+    snapshot_fingerprint, record_count = compute_snapshot_fingerprint()
+    if snapshot_fingerprint == stored_fingerprint and not args.force:
+        conn.close()
+        duration = (datetime.now() - start_time).total_seconds()
+        logging.info(f"Data file unchanged since last load ({record_count} records), skipping import")
+        logging.info("=" * 80)
+        print(f"Import skipped: {NDJSON_FILE} unchanged since last load ({duration:.2f} seconds)")
+        return
+
+    if args.mode == 'copy':
+        # Spots missing from a complete fetch were removed upstream
+        prune = args.prune or is_manifest_complete(snapshot_fingerprint)
+        result = load_with_copy(conn, prune=prune, snapshot_fingerprint=snapshot_fingerprint)
+    else:
+        result = load_in_batches(conn, snapshot_fingerprint=snapshot_fingerprint)
+
     # Close database connection
     conn.close()
     logging.info("Database connection closed")
@@ -265,17 +598,36 @@ def main():
     
     logging.info("-" * 80)
     logging.info(f"Import completed in {duration:.2f} seconds")
-    logging.info(f"Total records processed: {total_records}")
-    logging.info(f"Total batches: {batch_number}")
-    logging.info(f"Successful batches: {successful_batches}")
-    logging.info(f"Failed batches: {failed_batches}")
-    logging.info("=" * 80)
-    
-    print(f"Import completed: {total_records} records processed in {batch_number} batches")
-    print(f"Duration: {duration:.2f} seconds")
-    print(f"Successful batches: {successful_batches}/{batch_number}")
-    if failed_batches > 0:
-        print(f"Failed batches: {failed_batches}")
+
+    if args.mode == 'copy':
+        if result is None:
+            logging.info("Import failed, no changes were applied")
+            logging.info("=" * 80)
+            print("Error: Import failed, no changes were applied. Check logs for details.")
+            sys.exit(1)
+
+        total_records, upserted, deleted = result
+        logging.info(f"Total records processed: {total_records}")
+        logging.info(f"Rows inserted or updated: {upserted}")
+        logging.info(f"Rows deleted: {deleted}")
+        logging.info("=" * 80)
+
+        print(f"Import completed: {total_records} records processed in a single transaction")
+        print(f"Duration: {duration:.2f} seconds")
+        print(f"Rows inserted or updated: {upserted}, rows deleted: {deleted}")
+    else:
+        total_records, batch_number, successful_batches, failed_batches = result
+        logging.info(f"Total records processed: {total_records}")
+        logging.info(f"Total batches: {batch_number}")
+        logging.info(f"Successful batches: {successful_batches}")
+        logging.info(f"Failed batches: {failed_batches}")
+        logging.info("=" * 80)
+
+        print(f"Import completed: {total_records} records processed in {batch_number} batches")
+        print(f"Duration: {duration:.2f} seconds")
+        print(f"Successful batches: {successful_batches}/{batch_number}")
+        if failed_batches > 0:
+            print(f"Failed batches: {failed_batches}")
     print(f"Log: {LOGS_PATH / 'load_parking_spots.log'}")
 
 
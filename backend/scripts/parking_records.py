@@ -0,0 +1,77 @@
+"""
+Helpers shared by the fetch and load scripts for normalising and fingerprinting parking spot records.
+"""
+
+import hashlib
+
+COORD_PRECISION = 6  # Decimal places (~0.1 m) when comparing record coordinates
+FINGERPRINT_MODULUS = 1 << 128
+
+
+def normalise_description(description):
+    """Upper-case a description and collapse its whitespace."""
+    return ' '.join(str(description or '').split()).upper()
+
+
+def normalise_coordinate(value):
+    try:
+        return round(float(value), COORD_PRECISION)
+    except (TypeError, ValueError):
+        return value
+
+
+def record_key(record):
+    """
+    Compute a compact 64-bit key identifying a parking spot record.
+    Descriptions are compared case- and whitespace-insensitively, and coordinates to COORD_PRECISION.
+    """
+    description = normalise_description(record.get('Description'))
+    lat = normalise_coordinate(record.get('Latitude'))
+    lon = normalise_coordinate(record.get('Longitude'))
+
+    digest = hashlib.blake2b(f"{description}|{lat}|{lon}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def record_fingerprint(record):
+    """
+    Compute a fingerprint of every loaded field of a parking spot record.
+
+    Returns:
+        32-character hex digest
+    """
+    fields = (
+        record.get('Description'),
+        normalise_coordinate(record.get('Longitude')),
+        normalise_coordinate(record.get('Latitude')),
+        record.get('RackType'),
+        record.get('RackCount'),
+        record.get('ShelterIndicator')
+    )
+    return hashlib.blake2b('|'.join(map(str, fields)).encode(), digest_size=16).hexdigest()
+
+
+class SnapshotFingerprint:
+    """
+    Order-independent fingerprint of a set of records, built incrementally as records stream in.
+    Record fingerprints are summed modulo 2^128, so the result does not depend on fetch order.
+    """
+
+    def __init__(self):
+        self._total = 0
+        self.count = 0
+
+    def add(self, fingerprint):
+        self._total = (self._total + int(fingerprint, 16)) % FINGERPRINT_MODULUS
+        self.count += 1
+
+    def hexdigest(self):
+        return f"{self._total:032x}-{self.count}"
+
+
+def combine_fingerprints(fingerprints):
+    """Combine record fingerprints into a single order-independent fingerprint."""
+    snapshot = SnapshotFingerprint()
+    for fingerprint in fingerprints:
+        snapshot.add(fingerprint)
+    return snapshot.hexdigest()
@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+from fastapi import status
+import psycopg
+
+from app.db import _get_connection_string
+from app.main import app
+
+prefix = '/api/v1'
+
+
+def _geog_column_exists(conn):
+    return conn.execute("""
+        SELECT EXISTS (
+            SELECT FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'parking_spots' AND column_name = 'geog'
+        );
+    """).fetchone()[0]
+
+
+class TestSchemaUpgrade:
+    def test_routes_after_upgrade_from_schema_without_geog(self):
+        with psycopg.connect(_get_connection_string(), autocommit=True) as conn:
+            # A database created before parking lookups moved to the indexed geography column
+            conn.execute("ALTER TABLE parking_spots DROP COLUMN IF EXISTS geog;")
+            assert not _geog_column_exists(conn)
+
+            # The schema is upgraded on startup, not on the next ingest
+            with TestClient(app) as client:
+                response = client.get(
+                    f'{prefix}/routes',
+                    params={
+                        'start': '1.29443776056092,103.872537189913',  # ECP Area A
+                        'end': '1.31344532512062,103.957814209908',  # ECP Area G
+                        'intervalMins': 20
+                    }
+                )
+
+            assert response.status_code == status.HTTP_200_OK
+            assert all('parking_spots' in route for route in response.json())
+            assert _geog_column_exists(conn)
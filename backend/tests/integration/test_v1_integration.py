@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 from fastapi import status
+import pytest
 
 from app.main import app
 
@@ -7,6 +8,13 @@ client = TestClient(app)
 prefix = '/api/v1'
 
 
+@pytest.fixture(scope='module', autouse=True)
+def app_lifespan():
+    # Connection pools are opened on startup, they are not created on first use
+    with client:
+        yield
+
+
 class TestSearchEndpoint:
     def test_valid_search_integration(self):
         response = client.get(
@@ -0,0 +1,179 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.cache import CacheBackend, LRUCache, MemoryCacheBackend, SearchCache, SingleFlight, snap_coordinates
+from app.utils.route import build_route_cache_key
+
+
+class TestLRUCache:
+    def test_get_and_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now the least recently used entry
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LRUCache(maxsize=2, ttl_s=10)
+
+        with patch('app.cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+        with patch('app.cache.time.monotonic', return_value=109.0):
+            assert cache.get("a") == 1
+        with patch('app.cache.time.monotonic', return_value=110.0):
+            assert cache.get("a") is None
+
+        assert len(cache) == 0
+
+
+    def test_invalid_size_raises_error(self):
+        with pytest.raises(ValueError):
+            LRUCache(maxsize=0)
+
+
+class TestMemoryCacheBackend:
+    def test_get_and_set(self):
+        cache = MemoryCacheBackend(maxsize=2, ttl_s=60)
+        asyncio.run(cache.set("a", [1, 2]))
+
+        assert asyncio.run(cache.get("a")) == [1, 2]
+        assert cache.stats()["backend"] == "memory"
+
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class GetOnlyBackend(CacheBackend):
+            async def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            GetOnlyBackend()
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+
+        assert asyncio.run(run()) == [1] * 5
+        assert calls == 1
+        assert flight.stats() == {"calls": 5, "shared": 4, "in_flight": 0}
+
+
+    def test_exception_raised_to_every_caller(self):
+        flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", compute) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+
+    def test_sequential_calls_recompute(self):
+        flight = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        async def run():
+            return [await flight.do("key", compute), await flight.do("key", compute)]
+
+        assert asyncio.run(run()) == [1, 2]
+
+
+class TestSearchCache:
+    @staticmethod
+    def _page(results, total_pages=1):
+        return {"found": len(results), "totalNumPages": total_pages, "pageNum": 1, "results": results}
+
+
+    def test_queries_are_normalised(self):
+        cache = SearchCache(maxsize=8, ttl_s=60)
+        cache.set("Orchard  Road", 1, self._page([]))
+
+        assert cache.get(" orchard road", 1) is not None
+        assert cache.get("orchard road", 2) is None
+
+
+    def test_refined_query_answered_from_prefix(self):
+        cache = SearchCache(maxsize=8, ttl_s=60, prefix_reuse=True)
+        cache.set("orch", 1, self._page([
+            {"SEARCHVAL": "ORCHARD ROAD", "ADDRESS": "ORCHARD ROAD SINGAPORE"},
+            {"SEARCHVAL": "ORCHID HOTEL", "ADDRESS": "1 TRAS LINK SINGAPORE"}
+        ]))
+
+        data = cache.get("orchard", 1)
+        assert [result["SEARCHVAL"] for result in data["results"]] == ["ORCHARD ROAD"]
+        assert data["found"] == 1
+        assert cache.stats()["prefix_hits"] == 1
+
+
+    def test_truncated_prefix_not_reused(self):
+        cache = SearchCache(maxsize=8, ttl_s=60, prefix_reuse=True)
+        cache.set("orch", 1, self._page([{"SEARCHVAL": "ORCHARD ROAD"}], total_pages=3))
+
+        assert cache.get("orchard", 1) is None
+
+
+    def test_prefix_reuse_disabled_by_default(self):
+        cache = SearchCache(maxsize=8, ttl_s=60)
+        cache.set("orch", 1, self._page([{"SEARCHVAL": "ORCHARD ROAD"}]))
+
+        assert cache.get("orchard", 1) is None
+
+
+class TestRouteCacheKey:
+    def test_snap_coordinates(self):
+        assert snap_coordinates("1.29443776056092,103.872537189913", 0.001) == "1.294000,103.873000"
+
+
+    def test_snap_invalid_coordinates(self):
+        assert snap_coordinates(" somewhere ", 0.001) == "somewhere"
+
+
+    def test_nearby_requests_share_key(self):
+        key = build_route_cache_key("1.29443,103.87253", "1.31344,103.95781", 30, 0.0005)
+        nearby_key = build_route_cache_key("1.29446%2C103.87251", "1.31341,103.95783", 30, 0.0005)
+
+        assert key == nearby_key
+
+
+    def test_interval_changes_key(self):
+        key = build_route_cache_key("1.29443,103.87253", "1.31344,103.95781", 30, 0.0005)
+        other_key = build_route_cache_key("1.29443,103.87253", "1.31344,103.95781", 20, 0.0005)
+
+        assert key != other_key
@@ -0,0 +1,156 @@
+import asyncio
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import psycopg
+from psycopg_pool import PoolTimeout
+import pytest
+
+from app import db
+from app.config import Settings
+from app.metrics import REGISTRY
+from app.utils.parking import _NEAREST_PARKING_SPOTS_QUERY
+
+
+@contextmanager
+def _registered_statements(statements, prepare_threshold=5):
+    with (
+        patch.object(db, '_prepared_statements', dict(statements)),
+        patch.object(db, '_prepare_threshold', prepare_threshold)
+    ):
+        yield
+
+
+class TestPreparedStatements:
+    def test_parking_lookup_is_registered(self):
+        assert _NEAREST_PARKING_SPOTS_QUERY in db._prepared_statements
+
+
+    def test_registered_queries_are_prepared_on_first_use(self):
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [{'id': 1}]
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        @contextmanager
+        def mock_connection():
+            yield mock_conn
+
+        with (
+            _registered_statements({'SELECT hot;': None}),
+            patch('app.db.get_db_connection', mock_connection)
+        ):
+            assert db.execute_query('SELECT hot;') == [{'id': 1}]
+            assert mock_cursor.execute.call_args.kwargs['prepare'] is True
+
+            db.execute_query('SELECT cold;')
+            assert mock_cursor.execute.call_args.kwargs['prepare'] is None  # Left to the prepare threshold
+
+        with (
+            _registered_statements({'SELECT hot;': None}, prepare_threshold=None),
+            patch('app.db.get_db_connection', mock_connection)
+        ):
+            db.execute_query('SELECT hot;')
+            assert mock_cursor.execute.call_args.kwargs['prepare'] is False
+
+
+    def test_new_connections_warm_up_statements(self):
+        mock_conn = MagicMock()
+
+        with _registered_statements({'SELECT warm;': ([],), 'SELECT lazy;': None}):
+            db._configure_connection(mock_conn)
+
+        mock_conn.execute.assert_called_once_with('SELECT warm;', ([],), prepare=True)
+        mock_conn.commit.assert_called_once()
+
+
+    def test_failed_warm_up_leaves_connection_usable(self):
+        mock_conn = MagicMock()
+        mock_conn.execute.side_effect = psycopg.errors.UndefinedColumn('column "geog" does not exist')
+
+        with _registered_statements({'SELECT warm;': ([],)}):
+            db._configure_connection(mock_conn)
+
+        mock_conn.rollback.assert_called_once()
+
+
+    def test_warm_up_skipped_when_disabled(self):
+        mock_conn = MagicMock()
+
+        with _registered_statements({'SELECT warm;': ([],)}, prepare_threshold=None):
+            db._configure_connection(mock_conn)
+
+        mock_conn.execute.assert_not_called()
+
+
+class TestConnectionPool:
+    def test_config_from_settings(self):
+        settings = Settings(DB_POOL_MAX_SIZE=4, DB_POOL_TIMEOUT_S=0.5, DB_PREPARED_STATEMENTS_ENABLED=False)
+
+        config = db.PoolConfig.from_settings(settings)
+
+        assert config.max_size == 4
+        assert config.timeout_s == 0.5
+        assert config.prepare_threshold is None
+
+
+    def test_pool_created_from_config(self):
+        config = db.PoolConfig(min_size=1, max_size=3, timeout_s=2.0, max_waiting=20, check=False)
+
+        with (
+            patch.object(db, '_connection_pool', None),
+            patch('app.db.ConnectionPool') as mock_pool
+        ):
+            db.initialize_connection_pool(config)
+
+        kwargs = mock_pool.call_args.kwargs
+        assert (kwargs['min_size'], kwargs['max_size'], kwargs['timeout'], kwargs['max_waiting']) == (1, 3, 2.0, 20)
+        assert kwargs['check'] is None
+        mock_pool.return_value.wait.assert_not_called()
+
+
+    def test_warm_up_waits_for_connections(self):
+        with (
+            patch.object(db, '_connection_pool', None),
+            patch('app.db.ConnectionPool') as mock_pool
+        ):
+            mock_pool.return_value.wait.side_effect = PoolTimeout('pool initialization incomplete after 1.0 sec')
+            db.initialize_connection_pool(db.PoolConfig(warmup_timeout_s=1.0))  # Startup continues while connections open
+
+            mock_pool.return_value.wait.assert_called_once_with(timeout=1.0)
+            assert db._connection_pool is mock_pool.return_value
+
+
+    def test_uninitialized_pool_raises(self):
+        async def query():
+            return await db.execute_query_async('SELECT 1;')
+
+        with (
+            patch.object(db, '_connection_pool', None),
+            patch.object(db, '_async_connection_pool', None)
+        ):
+            with pytest.raises(RuntimeError):
+                db.execute_query('SELECT 1;')
+            with pytest.raises(RuntimeError):
+                asyncio.run(query())
+
+
+    def test_pool_stats_exposed_as_metrics(self):
+        mock_pool = MagicMock()
+        mock_pool.name = 'async'
+        mock_pool.get_stats.return_value = {
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 10, 'pool_available': 0,
+            'requests_waiting': 7, 'requests_num': 120, 'requests_errors': 3
+        }
+
+        with (
+            patch.object(db, '_connection_pool', None),
+            patch.object(db, '_async_connection_pool', mock_pool)
+        ):
+            output = REGISTRY.render()
+
+        assert 'pitstop_db_pool_connections{pool="async",state="pool_available"} 0' in output
+        assert 'pitstop_db_pool_requests_waiting{pool="async"} 7' in output
+        assert 'pitstop_db_pool_requests_total{pool="async"} 120' in output
+        assert 'pitstop_db_pool_errors_total{pool="async",kind="requests_errors"} 3' in output
+        assert 'pitstop_db_pool_errors_total{pool="async",kind="connections_lost"} 0' in output
@@ -0,0 +1,200 @@
+import json
+from pathlib import Path
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# The fetch script runs standalone, importing its helpers from the scripts directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'scripts'))
+
+import fetch_parking_spots
+from fetch_parking_spots import FetchCheckpoint, RecordWriter, TokenBucket, load_manifest, write_manifest
+from parking_records import combine_fingerprints, record_fingerprint
+
+
+def _record(description, lat=1.3, lon=103.8):
+    return {'Description': description, 'Latitude': lat, 'Longitude': lon, 'RackType': 'Yellow Box', 'RackCount': 10}
+
+
+def _read_ndjson(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestTokenBucket:
+    def test_waits_once_burst_is_spent(self):
+        clock = [100.0]
+        sleeps = []
+
+        def sleep(delay_s):
+            sleeps.append(delay_s)
+            clock[0] += delay_s
+
+        with (
+            patch('fetch_parking_spots.time.monotonic', side_effect=lambda: clock[0]),
+            patch('fetch_parking_spots.time.sleep', side_effect=sleep)
+        ):
+            bucket = TokenBucket(rate_per_s=2, capacity=2)
+            for _ in range(3):
+                bucket.acquire()
+
+        assert sleeps == [pytest.approx(0.5)]
+
+
+    def test_tokens_refill_up_to_capacity(self):
+        clock = [100.0]
+
+        with (
+            patch('fetch_parking_spots.time.monotonic', side_effect=lambda: clock[0]),
+            patch('fetch_parking_spots.time.sleep') as mock_sleep
+        ):
+            bucket = TokenBucket(rate_per_s=2, capacity=2)
+            bucket.acquire()
+            bucket.acquire()
+            clock[0] += 60  # Idle long enough to refill far past capacity
+            bucket.acquire()
+            bucket.acquire()
+
+        mock_sleep.assert_not_called()
+        assert bucket._tokens == 0
+
+
+class TestFetchCheckpoint:
+    def test_resumes_completed_locations(self, tmp_path):
+        path = tmp_path / 'checkpoint.json'
+        FetchCheckpoint(path).mark_completed(7, 'abc')
+
+        checkpoint = FetchCheckpoint(path)
+        assert checkpoint.load() is True
+        assert checkpoint.completed == {'7': 'abc'}
+
+
+    def test_loads_checkpoint_without_fingerprints(self, tmp_path):
+        path = tmp_path / 'checkpoint.json'
+        path.write_text(json.dumps({'completed': [1, 2]}))
+
+        checkpoint = FetchCheckpoint(path)
+        assert checkpoint.load() is True
+        assert checkpoint.completed == {'1': None, '2': None}
+
+
+    def test_missing_or_invalid_checkpoint_starts_afresh(self, tmp_path):
+        path = tmp_path / 'checkpoint.json'
+        assert FetchCheckpoint(path).load() is False
+
+        path.write_text('{"completed": ')
+        assert FetchCheckpoint(path).load() is False
+
+
+    def test_clear_removes_file(self, tmp_path):
+        path = tmp_path / 'checkpoint.json'
+        checkpoint = FetchCheckpoint(path)
+        checkpoint.mark_completed(1, 'abc')
+        checkpoint.clear()
+
+        assert not path.exists()
+
+
+class TestRecordWriter:
+    def test_duplicates_across_locations_skipped(self, tmp_path):
+        path = tmp_path / 'records.ndjson'
+        writer = RecordWriter(path, append=False)
+
+        assert writer.write_location([_record('A'), _record('B')]) == (2, 0)
+        # Same spot with different case, whitespace and coordinate noise
+        assert writer.write_location([_record(' a ', lat=1.3000000001), _record('C')]) == (1, 1)
+        writer.close()
+
+        assert [record['Description'] for record in _read_ndjson(path)] == ['A', 'B', 'C']
+        assert (writer.record_count, writer.duplicate_count) == (3, 1)
+
+
+    def test_append_skips_records_from_previous_run(self, tmp_path):
+        path = tmp_path / 'records.ndjson'
+        writer = RecordWriter(path, append=False)
+        writer.write_location([_record('A')])
+        writer.close()
+
+        resumed = RecordWriter(path, append=True)
+        assert resumed.write_location([_record('A'), _record('B')]) == (1, 1)
+        resumed.close()
+
+        assert [record['Description'] for record in _read_ndjson(path)] == ['A', 'B']
+        # The snapshot covers the whole file, including records written before the resume
+        expected = combine_fingerprints(record_fingerprint(record) for record in [_record('A'), _record('B')])
+        assert resumed.snapshot.hexdigest() == expected
+
+
+class TestManifest:
+    def test_round_trip(self, tmp_path):
+        writer = RecordWriter(tmp_path / 'records.ndjson', append=False)
+        writer.write_location([_record('A')])
+        writer.close()
+        checkpoint = FetchCheckpoint(tmp_path / 'checkpoint.json')
+        checkpoint.mark_completed(1, 'abc')
+
+        with patch.object(fetch_parking_spots, 'MANIFEST_FILE', tmp_path / 'manifest.json'):
+            assert load_manifest() is None
+            write_manifest(writer, checkpoint, complete=False)
+            manifest = load_manifest()
+
+        assert manifest['snapshot_fingerprint'] == writer.snapshot.hexdigest()
+        assert manifest['record_count'] == 1
+        assert manifest['complete'] is False
+        assert manifest['locations'] == {'1': 'abc'}
+
+
+class TestMain:
+    LOCATIONS = [
+        {'ID': 1, 'Description': 'Bishan', 'Latitude': 1.35, 'Longitude': 103.85},
+        {'ID': 2, 'Description': 'Toa Payoh', 'Latitude': 1.33, 'Longitude': 103.85},
+        {'ID': 3, 'Description': 'Novena', 'Latitude': 1.32, 'Longitude': 103.84}
+    ]
+
+    def _run(self, tmp_path, monkeypatch, responses):
+        """Run the fetch with each location's latitude mapped to its records, or None for a failed request."""
+        locations_file = tmp_path / 'locations.json'
+        locations_file.write_text(json.dumps(self.LOCATIONS))
+        monkeypatch.setenv('DATAMALL_ACCOUNT_KEY', 'key')
+
+        with (
+            patch.object(fetch_parking_spots, 'LOCATIONS_FILE', locations_file),
+            patch.object(fetch_parking_spots, 'OUTPUT_FILE', tmp_path / 'records.ndjson'),
+            patch.object(fetch_parking_spots, 'CHECKPOINT_FILE', tmp_path / 'checkpoint.json'),
+            patch.object(fetch_parking_spots, 'MANIFEST_FILE', tmp_path / 'manifest.json'),
+            patch.object(fetch_parking_spots, 'load_dotenv'),
+            patch.object(fetch_parking_spots, 'fetch_parking_spots', side_effect=lambda _s, _r, lat, _l, _k: responses[lat]),
+            patch('sys.argv', ['fetch_parking_spots.py'])
+        ):
+            fetch_parking_spots.main()
+
+        return json.loads((tmp_path / 'manifest.json').read_text())
+
+
+    def test_resumed_run_with_only_duplicates_succeeds(self, tmp_path, monkeypatch):
+        # The interrupted run fetched location 1. The resumed run fetches only records location 1 already
+        # wrote, and location 3 fails, which must not fail the ingest as location 2 was fetched
+        (tmp_path / 'records.ndjson').write_text(json.dumps(_record('A')) + '\n')
+        FetchCheckpoint(tmp_path / 'checkpoint.json').mark_completed(1, 'abc')
+
+        manifest = self._run(tmp_path, monkeypatch, {1.33: [_record('A')], 1.32: None})
+
+        assert manifest['complete'] is False
+        assert set(manifest['locations']) == {'1', '2'}
+        assert len(_read_ndjson(tmp_path / 'records.ndjson')) == 1
+        assert (tmp_path / 'checkpoint.json').exists()  # Kept so the next run retries location 3
+
+
+    def test_complete_run_clears_checkpoint(self, tmp_path, monkeypatch):
+        manifest = self._run(tmp_path, monkeypatch, {1.35: [_record('A')], 1.33: [_record('A'), _record('B')], 1.32: []})
+
+        assert manifest['complete'] is True
+        assert manifest['record_count'] == 2
+        assert not (tmp_path / 'checkpoint.json').exists()
+
+
+    def test_no_location_fetched_exits_with_error(self, tmp_path, monkeypatch):
+        with pytest.raises(SystemExit) as exc_info:
+            self._run(tmp_path, monkeypatch, {1.35: None, 1.33: None, 1.32: None})
+
+        assert exc_info.value.code == 1
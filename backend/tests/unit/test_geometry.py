@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import numpy as np
+import polyline
+import pytest
+
+from app.utils.geometry import decode_route_geometry, interpolate_along_route, project_onto_route
+from app.utils.parking import _compute_cumsum_distances
+
+
+class TestDecodeRouteGeometry:
+    coords = [
+        (103.68437, 1.35489),
+        (103.69437, 1.35489),
+        (103.71437, 1.35489),
+    ]
+
+    def test_decode(self):
+        route_geometry = polyline.encode(self.coords, geojson=True)
+        geometry = decode_route_geometry(route_geometry)
+
+        assert geometry.coords.dtype == np.float64
+        assert geometry.coords.shape == (3, 2)
+        assert np.allclose(geometry.coords, self.coords)
+        assert np.allclose(geometry.distances, _compute_cumsum_distances(self.coords))
+
+
+    def test_arrays_are_read_only(self):
+        geometry = decode_route_geometry(polyline.encode(self.coords, geojson=True))
+
+        with pytest.raises(ValueError):
+            geometry.coords[0, 0] = 0.0
+        with pytest.raises(ValueError):
+            geometry.distances[0] = 1.0
+
+
+    def test_repeated_geometry_skips_decoding(self):
+        route_geometry = polyline.encode(self.coords[::-1], geojson=True)
+        first = decode_route_geometry(route_geometry)
+
+        with patch('app.utils.geometry.polyline.decode') as mock_decode:
+            second = decode_route_geometry(route_geometry)
+
+        mock_decode.assert_not_called()
+        assert second is first
+
+
+    def test_empty_geometry_raises_error(self):
+        with pytest.raises(ValueError):
+            decode_route_geometry('')
+
+
+class TestInterpolateAlongRoute:
+    coords = np.array([
+        (103.68437, 1.35489),
+        (103.69437, 1.35489),
+        (103.69437, 1.35489),  # Repeated vertex
+        (103.71437, 1.35489),
+    ])
+    distances = np.array([0.0, 1000.0, 1000.0, 3000.0])
+
+    def test_interpolates_within_segment(self):
+        result = interpolate_along_route(self.coords, self.distances, [500.0, 2000.0])
+
+        assert np.allclose(result, [(103.68937, 1.35489), (103.70437, 1.35489)])
+
+
+    def test_vertices_and_endpoints(self):
+        result = interpolate_along_route(self.coords, self.distances, [0.0, 1000.0, 3000.0])
+
+        assert np.allclose(result, [self.coords[0], self.coords[1], self.coords[3]])
+
+
+    def test_positions_are_clipped_to_route(self):
+        result = interpolate_along_route(self.coords, self.distances, [-100.0, 5000.0])
+
+        assert np.allclose(result, [self.coords[0], self.coords[3]])
+
+
+    def test_single_vertex_route(self):
+        result = interpolate_along_route(self.coords[:1], self.distances[:1], [0.0, 100.0])
+
+        assert np.allclose(result, [self.coords[0], self.coords[0]])
+
+
+class TestProjectOntoRoute:
+    # East ~1.11 km, then north ~1.11 km
+    coords = np.array([(103.80, 1.30), (103.81, 1.30), (103.81, 1.31)])
+    distances = np.array(_compute_cumsum_distances([tuple(coord) for coord in coords]))
+
+    def test_points_beside_segments(self):
+        points = np.array([(103.805, 1.301), (103.812, 1.305)])
+        along_m, deviation_m = project_onto_route(self.coords, self.distances, points)
+
+        assert along_m[0] == pytest.approx(self.distances[1] / 2, abs=1)
+        assert along_m[1] == pytest.approx((self.distances[1] + self.distances[2]) / 2, abs=1)
+        assert deviation_m == pytest.approx([111.2, 222.4], abs=1)
+
+
+    def test_points_beyond_ends_clamp_to_endpoints(self):
+        points = np.array([(103.79, 1.30), (103.81, 1.32)])
+        along_m, deviation_m = project_onto_route(self.coords, self.distances, points, chunk_size=1)
+
+        assert along_m == pytest.approx([0, self.distances[-1]])
+        assert deviation_m == pytest.approx([1111.9, 1111.9], abs=1)
+
+
+    def test_single_vertex_route(self):
+        along_m, deviation_m = project_onto_route(self.coords[:1], self.distances[:1], np.array([(103.80, 1.301)]))
+
+        assert along_m == pytest.approx([0])
+        assert deviation_m == pytest.approx([111.2], abs=1)
+
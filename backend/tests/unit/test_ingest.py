@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.ingest import INGEST_SCRIPTS, run_ingest, run_ingest_scheduler, upgrade_schema
+
+
+def _mock_connection(lock_acquired):
+    cursor = MagicMock()
+    cursor.fetchone = AsyncMock(return_value=(lock_acquired,))
+    conn = MagicMock()
+    conn.execute = AsyncMock(return_value=cursor)
+    conn.close = AsyncMock()
+    return conn
+
+
+class TestRunIngest:
+    def test_runs_scripts_in_order_when_lock_acquired(self):
+        conn = _mock_connection(lock_acquired=True)
+
+        with (
+            patch('app.ingest.open_async_db_connection', AsyncMock(return_value=conn)),
+            patch('app.ingest._run_script', AsyncMock()) as mock_run_script
+        ):
+            assert asyncio.run(run_ingest()) is True
+
+        assert [call.args[0] for call in mock_run_script.call_args_list] == list(INGEST_SCRIPTS)
+        conn.close.assert_awaited_once()
+
+    def test_skips_when_lock_held_elsewhere(self):
+        conn = _mock_connection(lock_acquired=False)
+
+        with (
+            patch('app.ingest.open_async_db_connection', AsyncMock(return_value=conn)),
+            patch('app.ingest._run_script', AsyncMock()) as mock_run_script
+        ):
+            assert asyncio.run(run_ingest()) is False
+
+        mock_run_script.assert_not_called()
+        conn.close.assert_awaited_once()
+
+    def test_failed_script_stops_ingest(self):
+        conn = _mock_connection(lock_acquired=True)
+
+        with (
+            patch('app.ingest.open_async_db_connection', AsyncMock(return_value=conn)),
+            patch('app.ingest._run_script', AsyncMock(side_effect=RuntimeError("failed"))) as mock_run_script
+        ):
+            with pytest.raises(RuntimeError):
+                asyncio.run(run_ingest())
+
+        mock_run_script.assert_awaited_once()
+        conn.close.assert_awaited_once()
+
+
+class TestUpgradeSchema:
+    def test_runs_loader_in_schema_only_mode(self):
+        process = MagicMock()
+        process.wait = AsyncMock(return_value=0)
+
+        with patch('app.ingest.asyncio.create_subprocess_exec', AsyncMock(return_value=process)) as mock_exec:
+            asyncio.run(upgrade_schema())
+
+        args = mock_exec.call_args.args
+        assert args[1].endswith('load_parking_spots.py')
+        assert args[2:] == ('--schema-only',)
+
+    def test_failed_upgrade_raises(self):
+        process = MagicMock()
+        process.wait = AsyncMock(return_value=1)
+
+        with patch('app.ingest.asyncio.create_subprocess_exec', AsyncMock(return_value=process)):
+            with pytest.raises(RuntimeError):
+                asyncio.run(upgrade_schema())
+
+
+class TestRunIngestScheduler:
+    @staticmethod
+    def _run_until_sleep(table_empty, schema_current=True, check_error=None):
+        """Run the scheduler until it first sleeps, returning the mocked ingest."""
+        async def stop(_):
+            raise asyncio.CancelledError
+
+        with (
+            patch('app.ingest.is_parking_spots_empty', AsyncMock(return_value=table_empty, side_effect=check_error)),
+            patch('app.ingest.is_schema_current', AsyncMock(return_value=schema_current)),
+            patch('app.ingest.upgrade_schema', AsyncMock()),
+            patch('app.ingest.run_ingest', AsyncMock(return_value=True)) as mock_run_ingest,
+            patch('app.ingest.asyncio.sleep', side_effect=stop) as mock_sleep
+        ):
+            with pytest.raises(asyncio.CancelledError):
+                asyncio.run(run_ingest_scheduler(interval_s=60, jitter_s=10))
+
+        delay = mock_sleep.call_args.args[0]
+        assert 60 <= delay <= 70
+        return mock_run_ingest
+
+    def test_ingests_immediately_when_table_empty(self):
+        self._run_until_sleep(table_empty=True).assert_awaited_once()
+
+    def test_waits_for_interval_when_table_populated(self):
+        self._run_until_sleep(table_empty=False).assert_not_called()
+
+    def test_ingests_immediately_when_schema_out_of_date(self):
+        self._run_until_sleep(table_empty=False, schema_current=False).assert_awaited_once()
+
+    def test_ingests_immediately_when_check_fails(self):
+        self._run_until_sleep(table_empty=False, check_error=RuntimeError('pool not ready')).assert_awaited_once()
+
+    def test_keeps_running_after_unexpected_error(self):
+        sleeps = []
+
+        async def sleep(delay):
+            sleeps.append(delay)
+            if len(sleeps) == 2:
+                raise asyncio.CancelledError
+
+        with (
+            patch('app.ingest.is_parking_spots_empty', AsyncMock(return_value=True)),
+            patch('app.ingest.upgrade_schema', AsyncMock()),
+            patch('app.ingest.run_ingest', AsyncMock(side_effect=[ValueError('bad record'), True])) as mock_run_ingest,
+            patch('app.ingest.asyncio.sleep', side_effect=sleep)
+        ):
+            with pytest.raises(asyncio.CancelledError):
+                asyncio.run(run_ingest_scheduler(interval_s=60, jitter_s=10))
+
+        assert mock_run_ingest.await_count == 2
@@ -0,0 +1,112 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app import main
+from app.cache import SearchCache
+from app.main import app
+from app.metrics import (
+    CollectedCounter,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    format_server_timing,
+    start_request_timings,
+    timed
+)
+
+client = TestClient(app)
+
+
+class TestMetricsRegistry:
+    def test_counter_render(self):
+        registry = MetricsRegistry()
+        counter = registry.register(Counter('test_total', 'Test counter.', ('operation',)))
+        counter.inc('query')
+        counter.inc('query', amount=2)
+
+        output = registry.render()
+        assert '# TYPE test_total counter' in output
+        assert 'test_total{operation="query"} 3' in output
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test histogram.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        lines = histogram.render()
+        assert 'test_seconds_bucket{le="0.1"} 2' in lines
+        assert 'test_seconds_bucket{le="1.0"} 3' in lines
+        assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+        assert 'test_seconds_count 4' in lines
+        assert histogram.count() == 4
+
+    def test_gauge_render(self):
+        gauge = Gauge('test_items', 'Test gauge.', ('pool',))
+        gauge.set(3, 'sync')
+        gauge.set(1, 'sync')
+
+        assert gauge.render() == ['test_items{pool="sync"} 1']
+
+    def test_collected_values_are_read_on_render(self):
+        values = {('sync',): 2}
+        registry = MetricsRegistry()
+        registry.register(CollectedCounter('test_errors_total', 'Test collected counter.', ('pool',), collect=lambda: values))
+
+        assert 'test_errors_total{pool="sync"} 2' in registry.render()
+        values[('sync',)] = 5
+        output = registry.render()
+        assert '# TYPE test_errors_total counter' in output
+        assert 'test_errors_total{pool="sync"} 5' in output
+
+
+class TestServerTiming:
+    def test_timed_stages_are_recorded_for_request(self):
+        timings = start_request_timings()
+        with timed('stage.a'):
+            pass
+        with timed('stage.a'):
+            pass
+        with timed('stage.b'):
+            pass
+
+        assert [stage for stage, _ in timings] == ['stage.a', 'stage.a', 'stage.b']
+
+    def test_format_sums_repeated_stages(self):
+        header = format_server_timing([('parking', 0.010), ('parking', 0.005), ('transform', 0.001)])
+        assert header == 'parking;dur=15.00;desc="2x", transform;dur=1.00'
+
+    def test_header_added_when_enabled(self):
+        mock_response = MagicMock()
+        mock_response.json = MagicMock(return_value={'results': []})
+        mock_client = MagicMock()
+        mock_client.get = AsyncMock(return_value=mock_response)
+
+        with (
+            patch.object(main.settings, 'SERVER_TIMING_ENABLED', True),
+            patch('app.versions.v1.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_search_cache', return_value=SearchCache(maxsize=8, ttl_s=60))
+        ):
+            response = client.get('/api/v1/search', params={'searchVal': 'test'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'onemap.search;dur=' in response.headers['Server-Timing']
+
+    def test_header_omitted_by_default(self):
+        response = client.get('/health')
+        assert 'Server-Timing' not in response.headers
+
+
+class TestMetricsEndpoint:
+    def test_metrics_exposed_in_prometheus_format(self):
+        with timed('test.stage'):
+            pass
+
+        response = client.get('/metrics')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'pitstop_stage_duration_seconds_count{stage="test.stage"}' in response.text
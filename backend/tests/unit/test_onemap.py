@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from app.onemap import ApiKeyManager, FileTokenStore, TokenUnavailableError
+
+
+def _expiry(hours):
+    return (datetime.now() + timedelta(hours=hours)).replace(microsecond=0)
+
+
+class TestApiKeyManager:
+    def test_fresh_key_served_without_fetching(self):
+        manager = ApiKeyManager()
+
+        with patch.object(manager, '_fetch_api_key', return_value=('token', _expiry(72))) as mock_fetch:
+            manager.refresh_if_needed()
+            assert asyncio.run(manager.get_api_key_async()) == 'token'
+            manager.refresh_if_needed()
+
+        mock_fetch.assert_called_once()
+
+
+    def test_renewed_within_refresh_buffer(self):
+        manager = ApiKeyManager()
+        manager._set_api_key('old', datetime.now() + timedelta(seconds=manager.REFRESH_BUFFER_S - 60))
+
+        with patch.object(manager, '_fetch_api_key', return_value=('new', _expiry(72))) as mock_fetch:
+            assert manager.get_api_key() == 'old'  # Still valid for requests while the refresher renews it
+            manager.refresh_if_needed()
+
+        mock_fetch.assert_called_once()
+        assert manager.get_api_key() == 'new'
+
+
+    def test_request_fetch_failure_raises(self):
+        manager = ApiKeyManager()
+
+        with patch.object(manager, '_fetch_api_key', side_effect=requests.ConnectionError('unreachable')):
+            with pytest.raises(TokenUnavailableError):
+                manager.get_api_key()
+
+
+    def test_refresher_backs_off_after_failures(self):
+        manager = ApiKeyManager()
+        delays = []
+
+        async def mock_sleep(delay_s):
+            delays.append(delay_s)
+            if len(delays) == 3:
+                raise asyncio.CancelledError
+
+        fetch_results = [requests.ConnectionError('unreachable'), requests.Timeout('timed out'), ('token', _expiry(72))]
+
+        with (
+            patch.object(manager, '_fetch_api_key', side_effect=fetch_results),
+            patch('app.onemap.asyncio.sleep', mock_sleep),
+            patch('app.onemap.random.uniform', return_value=0)
+        ):
+            with pytest.raises(asyncio.CancelledError):
+                asyncio.run(manager.run_refresher(min_backoff_s=5, max_backoff_s=300))
+
+        assert delays[:2] == [5, 10]
+        assert delays[2] == pytest.approx(72 * 3600 - manager.REFRESH_BUFFER_S, abs=5)  # Next renewal is before expiry
+
+
+class TestFileTokenStore:
+    def test_token_shared_across_workers(self, tmp_path):
+        store_path = str(tmp_path / 'onemap_token.json')
+        first_worker = ApiKeyManager(store=FileTokenStore(store_path))
+        second_worker = ApiKeyManager(store=FileTokenStore(store_path))
+
+        with patch.object(first_worker, '_fetch_api_key', return_value=('shared', _expiry(72))):
+            first_worker.refresh_if_needed()
+
+        with patch.object(second_worker, '_fetch_api_key') as mock_fetch:
+            second_worker.refresh_if_needed()
+            assert second_worker.get_api_key() == 'shared'
+
+        mock_fetch.assert_not_called()
+
+
+    def test_request_fallback_writes_shared_token(self, tmp_path):
+        store_path = str(tmp_path / 'onemap_token.json')
+        first_worker = ApiKeyManager(store=FileTokenStore(store_path))
+        second_worker = ApiKeyManager(store=FileTokenStore(store_path))
+
+        with patch.object(first_worker, '_fetch_api_key', return_value=('shared', _expiry(72))):
+            assert first_worker.get_api_key() == 'shared'
+
+        with patch.object(second_worker, '_fetch_api_key') as mock_fetch:
+            assert second_worker.get_api_key() == 'shared'
+
+        mock_fetch.assert_not_called()
+
+
+    def test_unreadable_store_is_ignored(self, tmp_path):
+        store_path = tmp_path / 'onemap_token.json'
+        store_path.write_text('{"access_token": ')
+
+        assert FileTokenStore(str(store_path)).read() is None
@@ -1,12 +1,25 @@
+import asyncio
 from unittest.mock import patch
 
+import numpy as np
+import polyline
 import pytest
 
 from app.constants import DEFAULT_INTERVAL_MINS, AVG_SPEED_M_PER_MIN
+from app.constants import EXPANDED_SEARCH_RADIUS_M
+from app.utils.geometry import project_onto_route
 from app.utils.parking import (
+    find_parking_spots_along_route,
+    find_parking_spots_in_corridor,
+    _compute_checkpoint_coords,
     _convert_time_interval_to_distance,
-    _compute_cumsum_distances
+    _compute_cumsum_distances,
+    _plan_parking_stops,
+    _query_corridor_parking_spots,
+    _query_nearest_parking_spots,
+    _query_nearest_parking_spots_async
 )
+from app.utils.spatial_index import ParkingSpotIndex
 
 
 class TestConvertTimeIntervalToDistance:
@@ -102,6 +115,43 @@ class TestComputeCumsumDistances:
             _compute_cumsum_distances(coords)
 
 
+class TestComputeCheckpointCoords:
+    # Straight route heading east along a line of latitude, ~1.11 km between vertices
+    coords = [(103.68437 + 0.01 * i, 1.35489) for i in range(11)]
+    route_geometry = polyline.encode(coords, geojson=True)
+
+    def _route(self, total_distance):
+        return {
+            'route_geometry': self.route_geometry,
+            'route_summary': {'total_distance': total_distance}
+        }
+
+
+    def test_checkpoints_at_every_interval(self):
+        total_distance_m = _compute_cumsum_distances(self.coords)[-1]
+        interval_m = 10 * AVG_SPEED_M_PER_MIN
+
+        result = _compute_checkpoint_coords(self._route(total_distance_m), interval_mins=10)
+
+        expected_count = int(np.ceil(total_distance_m / interval_m))
+        assert len(result) == expected_count
+        assert all(type(coord) is tuple and type(coord[0]) is float for coord in result)
+
+        # Checkpoints are interpolated between vertices rather than snapped to them
+        lons = np.array([coord[0] for coord in result])
+        assert np.allclose(np.diff(lons[:-1]), 0.01 * interval_m / (total_distance_m / 10), rtol=1e-3)
+        assert result[-1] == pytest.approx(self.coords[-1])
+
+
+    def test_short_route_has_single_checkpoint_at_end(self):
+        total_distance_m = _compute_cumsum_distances(self.coords)[-1]
+
+        result = _compute_checkpoint_coords(self._route(total_distance_m), interval_mins=300)
+
+        assert len(result) == 1
+        assert result[0] == pytest.approx(self.coords[-1])
+
+
 class TestQueryNearestParkingSpot:
     def test_valid_coord(self):
         coord = (103.68437, 1.35489)
@@ -113,3 +163,286 @@ class TestQueryNearestParkingSpot:
         
         with patch('app.db.execute_query') as mock_execute_query:
             mock_execute_query.return_value
+
+
+class TestQueryNearestParkingSpots:
+    def test_single_round_trip(self):
+        coords = [
+            (103.68437, 1.35489),
+            (103.69437, 1.35489),
+            (103.71437, 1.35489),
+        ]
+        mock_rows = [
+            {
+                "idx": 1,
+                "id": 1,
+                "description": "BUS STOP 12345",
+                "lon": 103.6844,
+                "lat": 1.3549,
+                "rack_type": "Yellow Box",
+                "rack_count": 10,
+                "shelter_indicator": "N",
+                "deviation": 12.5
+            },
+            {
+                "idx": 3,
+                "id": 2,
+                "description": "BUS STOP 67890",
+                "lon": 103.7144,
+                "lat": 1.3549,
+                "rack_type": "Racks",
+                "rack_count": 4,
+                "shelter_indicator": "Y",
+                "deviation": 800.0
+            }
+        ]
+
+        with patch('app.utils.parking.execute_query', return_value=mock_rows) as mock_execute_query:
+            result = _query_nearest_parking_spots(coords)
+
+        mock_execute_query.assert_called_once()
+        params = mock_execute_query.call_args[0][1]
+        assert params == (
+            [103.68437, 103.69437, 103.71437],
+            [1.35489, 1.35489, 1.35489],
+            EXPANDED_SEARCH_RADIUS_M
+        )
+
+        assert len(result) == 3
+        assert result[0]["id"] == 1
+        assert result[0]["coord"] == (103.6844, 1.3549)
+        assert "idx" not in result[0]
+        assert "lon" not in result[0] and "lat" not in result[0]
+        assert result[1] is None  # No spot found within the expanded radius
+        assert result[2]["coord"] == (103.7144, 1.3549)
+
+
+    def test_async_single_round_trip(self):
+        coords = [(103.68437, 1.35489)]
+        mock_rows = [
+            {
+                "idx": 1,
+                "id": 1,
+                "description": "BUS STOP 12345",
+                "lon": 103.6844,
+                "lat": 1.3549,
+                "rack_type": "Yellow Box",
+                "rack_count": 10,
+                "shelter_indicator": "N",
+                "deviation": 12.5
+            }
+        ]
+
+        with patch('app.utils.parking.execute_query_async', return_value=mock_rows) as mock_execute_query:
+            result = asyncio.run(_query_nearest_parking_spots_async(coords))
+
+        mock_execute_query.assert_awaited_once()
+        assert result[0]["coord"] == (103.6844, 1.3549)
+
+
+    def test_no_coords_skips_query(self):
+        with patch('app.utils.parking.execute_query') as mock_execute_query:
+            result = _query_nearest_parking_spots([])
+
+        assert result == []
+        mock_execute_query.assert_not_called()
+
+
+    def test_invalid_coord_raises_error(self):
+        with pytest.raises(TypeError):
+            _query_nearest_parking_spots([[103.68437, 1.35489]])
+
+
+    def test_invalid_input_raises_error(self):
+        with pytest.raises(TypeError):
+            _query_nearest_parking_spots((103.68437, 1.35489))
+
+
+def _candidate(spot_id, along_route_m, deviation):
+    return {"id": spot_id, "along_route_m": along_route_m, "deviation": deviation}
+
+
+class TestPlanParkingStops:
+    def test_minimises_total_deviation(self):
+        candidates = [
+            _candidate(1, 1400, 20),
+            _candidate(2, 1800, 400),  # Nearest to a fixed checkpoint, but far off the route
+            _candidate(3, 3200, 30),
+            _candidate(4, 3400, 300),
+            _candidate(5, 4900, 10)
+        ]
+
+        result = _plan_parking_stops(candidates, route_length_m=5000, interval_m=2000)
+
+        assert [spot["id"] for spot in result] == [1, 3, 5]
+
+
+    def test_stops_objective_prefers_fewer_stops(self):
+        candidates = [
+            _candidate(1, 1000, 5),
+            _candidate(2, 1900, 40),
+            _candidate(3, 2800, 5),
+            _candidate(4, 3780, 5)
+        ]
+
+        by_deviation = _plan_parking_stops(candidates, 3800, 2000, objective='deviation')
+        by_stops = _plan_parking_stops(candidates, 3800, 2000, objective='stops')
+
+        assert [spot["id"] for spot in by_deviation] == [1, 3, 4]
+        assert [spot["id"] for spot in by_stops] == [2, 4]
+
+
+    def test_infeasible_plan_returns_none(self):
+        candidates = [_candidate(1, 500, 10), _candidate(2, 2000, 10)]  # Gap longer than the interval
+
+        assert _plan_parking_stops(candidates, 2000, 1000) is None
+        assert _plan_parking_stops([], 2000, 1000) is None
+
+
+    def test_invalid_objective_raises_error(self):
+        with pytest.raises(ValueError):
+            _plan_parking_stops([_candidate(1, 500, 10)], 500, 1000, objective='distance')
+
+
+# Straight route heading east along a line of latitude, ~11.1 km long
+STRAIGHT_ROUTE_COORDS = [(103.68437 + 0.01 * i, 1.35489) for i in range(11)]
+STRAIGHT_ROUTE = {
+    'route_geometry': polyline.encode(STRAIGHT_ROUTE_COORDS, geojson=True),
+    'route_summary': {'total_distance': 11120}
+}
+
+
+def _spot_index_around_route(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    lons = rng.uniform(103.68, 103.79, n)
+    lats = 1.35489 + rng.uniform(-0.009, 0.009, n)
+    index = ParkingSpotIndex()
+    index.build([
+        (i, f"SPOT {i}", float(lon), float(lat), "Racks", 10, "Y")
+        for i, (lon, lat) in enumerate(zip(lons, lats), 1)
+    ])
+    return index
+
+
+class TestOptimalParkingMode:
+    coords = STRAIGHT_ROUTE_COORDS
+    route = STRAIGHT_ROUTE
+
+    def _route_deviations(self, spots):
+        route_coords = np.array(self.coords)
+        distances = np.array(_compute_cumsum_distances(self.coords))
+        return project_onto_route(route_coords, distances, np.array([spot["coord"] for spot in spots]))
+
+
+    def test_optimal_plan_beats_fixed_checkpoints(self):
+        interval_m = 10 * AVG_SPEED_M_PER_MIN
+
+        with patch('app.utils.parking.get_parking_spot_index', return_value=_spot_index_around_route()):
+            fixed = find_parking_spots_along_route(self.route, 10)
+            optimal = find_parking_spots_along_route(self.route, 10, mode='optimal')
+
+        _, fixed_deviation_m = self._route_deviations(fixed)
+        along_m, optimal_deviation_m = self._route_deviations(optimal)
+        assert optimal_deviation_m.sum() < fixed_deviation_m.sum()
+
+        # Every leg, including the first from the start of the route, fits within the interval
+        legs_m = np.diff(np.append(0, along_m)) + optimal_deviation_m + np.append(0, optimal_deviation_m[:-1])
+        assert np.all(legs_m <= interval_m + 1e-6)
+        assert along_m[-1] + EXPANDED_SEARCH_RADIUS_M >= _compute_cumsum_distances(self.coords)[-1]
+
+
+    def test_falls_back_to_fixed_checkpoints(self):
+        with (
+            patch('app.utils.parking._query_corridor_parking_spots', return_value=[]),
+            patch('app.utils.parking._query_nearest_parking_spots', return_value=[{"id": 1}, None]) as mock_nearest
+        ):
+            result = find_parking_spots_along_route(self.route, 60, mode='optimal')
+
+        mock_nearest.assert_called_once()
+        assert result == [{"id": 1}]
+
+
+    def test_invalid_mode_raises_error(self):
+        with pytest.raises(ValueError):
+            find_parking_spots_along_route(self.route, 10, mode='shortest')
+
+
+    def test_corridor_single_round_trip(self):
+        mock_rows = [
+            {
+                "id": 2,
+                "description": "BUS STOP 67890",
+                "lon": 103.7144,
+                "lat": 1.3559,
+                "rack_type": "Racks",
+                "rack_count": 4,
+                "shelter_indicator": "Y"
+            },
+            {
+                "id": 1,
+                "description": "BUS STOP 12345",
+                "lon": 103.6944,
+                "lat": 1.3549,
+                "rack_type": "Yellow Box",
+                "rack_count": 10,
+                "shelter_indicator": "N"
+            }
+        ]
+
+        with (
+            patch('app.utils.parking.get_parking_spot_index', return_value=None),
+            patch('app.utils.parking.execute_query', return_value=mock_rows) as mock_execute_query
+        ):
+            result = _query_corridor_parking_spots(self.route, EXPANDED_SEARCH_RADIUS_M)
+
+        mock_execute_query.assert_called_once()
+        params = mock_execute_query.call_args[0][1]
+        assert params[0] == self.route['route_geometry']  # Passed through rather than encoded again
+        assert params[1] == EXPANDED_SEARCH_RADIUS_M
+
+        assert [spot["id"] for spot in result] == [1, 2]  # Sorted along the route
+        assert result[0]["coord"] == (103.6944, 1.3549)
+        assert result[0]["along_route_m"] == pytest.approx(1115, abs=1)
+        assert result[1]["deviation"] == pytest.approx(112.3, abs=1)
+
+
+class TestFindParkingSpotsInCorridor:
+    route = STRAIGHT_ROUTE
+
+    def test_matches_database_corridor(self):
+        index = _spot_index_around_route()
+        rows = [
+            {
+                "id": row[0],
+                "description": row[1],
+                "lon": row[2],
+                "lat": row[3],
+                "rack_type": row[4],
+                "rack_count": row[5],
+                "shelter_indicator": row[6]
+            }
+            for row in index._snapshot.rows
+        ]
+
+        with patch('app.utils.parking.get_parking_spot_index', return_value=index):
+            result = find_parking_spots_in_corridor(self.route, 300)
+        with (
+            patch('app.utils.parking.get_parking_spot_index', return_value=None),
+            patch('app.utils.parking.execute_query', return_value=rows)
+        ):
+            expected = find_parking_spots_in_corridor(self.route, 300)
+
+        assert len(result) > 0
+        assert [spot["id"] for spot in result] == [spot["id"] for spot in expected]
+        assert all(spot["deviation"] <= 300 for spot in result)
+
+        along_m = [spot["along_route_m"] for spot in result]
+        assert along_m == sorted(along_m)
+
+
+    def test_invalid_buffer_raises_error(self):
+        with pytest.raises(ValueError):
+            find_parking_spots_in_corridor(self.route, 0)
+        with pytest.raises(TypeError):
+            find_parking_spots_in_corridor(self.route, "300")
+
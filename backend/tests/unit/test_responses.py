@@ -0,0 +1,222 @@
+import gzip
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from fastapi import status
+import pytest
+
+from app import compression, responses
+from app.cache import MemoryCacheBackend
+from app.compression import CompressionMiddleware, accepts_encoding
+from app.main import app
+from app.responses import JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, negotiate_media_type
+from app.utils.route import to_columnar_parking_spots, transform_route_data
+
+client = TestClient(app)
+prefix = '/api/v1'
+
+
+def _parking_spot(spot_id, along_route_m=None):
+    spot = {
+        'id': spot_id,
+        'description': f'SPOT {spot_id}',
+        'coord': (103.8 + spot_id / 1000, 1.3),
+        'rack_type': 'Racks',
+        'rack_count': 10,
+        'shelter_indicator': 'Y',
+        'deviation': 12.5
+    }
+    if along_route_m is not None:
+        spot['along_route_m'] = along_route_m
+    return spot
+
+
+class TestNegotiateMediaType:
+    def test_defaults_to_json(self):
+        assert negotiate_media_type(None) == JSON_MEDIA_TYPE
+        assert negotiate_media_type('*/*') == JSON_MEDIA_TYPE
+        assert negotiate_media_type('text/html') == JSON_MEDIA_TYPE
+
+
+    def test_msgpack_by_preference(self):
+        with patch.object(responses, 'msgpack', object()):
+            assert negotiate_media_type('application/msgpack') == MSGPACK_MEDIA_TYPE
+            assert negotiate_media_type('application/json;q=0.5, application/x-msgpack') == MSGPACK_MEDIA_TYPE
+            assert negotiate_media_type('application/json, application/msgpack;q=0.5') == JSON_MEDIA_TYPE
+            assert negotiate_media_type('application/msgpack;q=0') == JSON_MEDIA_TYPE
+
+
+    def test_msgpack_unavailable_falls_back_to_json(self):
+        with patch.object(responses, 'msgpack', None):
+            assert negotiate_media_type('application/msgpack') == JSON_MEDIA_TYPE
+
+
+class TestColumnarParkingSpots:
+    def test_columns_match_spots(self):
+        route = transform_route_data(
+            {'route_geometry': 'abc'},
+            [_parking_spot(1), _parking_spot(2)],
+            [_parking_spot(3, along_route_m=100.0)]
+        )
+
+        result = to_columnar_parking_spots(route)
+
+        assert result['route_geometry'] == 'abc'
+        assert result['parking_spots']['id'] == [1, 2]
+        assert result['parking_spots']['lon'] == pytest.approx([103.801, 103.802])
+        assert result['parking_spots']['deviation_m'] == [12.5, 12.5]
+        assert 'along_route_m' not in result['parking_spots']
+        assert result['corridor_parking_spots']['along_route_m'] == [100.0]
+        assert isinstance(route['parking_spots'], list)  # The cached route is left untouched
+
+
+class TestRoutesEncoding:
+    route = {
+        'route_geometry': '_p~iF~ps|U_ulLnnqC',
+        'route_instructions': [],
+        'route_summary': {'start_point': 'Start Point', 'end_point': 'End Point', 'total_time': 1800, 'total_distance': 5000}
+    }
+
+    def _get_routes(self, params=None, headers=None):
+        mock_response = MagicMock()
+        mock_response.json = MagicMock(return_value=self.route)
+        mock_client = MagicMock()
+        mock_client.get = AsyncMock(return_value=mock_response)
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', return_value=[_parking_spot(i) for i in range(50)])
+        ):
+            return client.get(
+                f'{prefix}/routes',
+                params={'start': '1.3,103.8', 'end': '1.31,103.9', **(params or {})},
+                headers=headers
+            )
+
+
+    def test_json_by_default(self):
+        response = self._get_routes()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == JSON_MEDIA_TYPE
+        assert response.headers['vary'].startswith('Accept')
+        assert len(response.json()[0]['parking_spots']) == 50
+
+
+    def test_msgpack_when_accepted(self):
+        msgpack = pytest.importorskip('msgpack')
+
+        response = self._get_routes(headers={'Accept': 'application/msgpack'})
+
+        assert response.headers['content-type'] == MSGPACK_MEDIA_TYPE
+        assert len(msgpack.unpackb(response.content)[0]['parking_spots']) == 50
+
+
+    def test_columnar_layout(self):
+        response = self._get_routes(params={'columnar': 'true'})
+
+        assert response.json()[0]['parking_spots']['id'] == list(range(50))
+
+
+    def test_large_responses_are_compressed(self):
+        response = self._get_routes(headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['content-encoding'] == 'gzip'
+        assert int(response.headers['content-length']) < len(json.dumps(response.json()))
+
+
+class TestCompressionMiddleware:
+    body = 'pitstop ' * 500
+
+    def _client(self):
+        test_app = FastAPI()
+        test_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+        @test_app.get('/large')
+        def large():
+            return PlainTextResponse(self.body)
+
+        @test_app.get('/small')
+        def small():
+            return PlainTextResponse('ok')
+
+        @test_app.get('/stream')
+        def stream():
+            return StreamingResponse(iter([self.body.encode()] * 3), media_type='text/plain')
+
+        @test_app.get('/encoded')
+        def encoded():
+            return PlainTextResponse(self.body, headers={'Content-Encoding': 'identity'})
+
+        @test_app.get('/events')
+        def events():
+            return StreamingResponse(iter([self.body.encode()]), media_type='text/event-stream')
+
+        return TestClient(test_app)
+
+
+    def test_accepts_encoding(self):
+        assert accepts_encoding('gzip, br', 'br')
+        assert accepts_encoding('gzip;q=1.0, br;q=0.5', 'br')
+        assert not accepts_encoding('gzip, br;q=0', 'br')
+        assert not accepts_encoding(None, 'gzip')
+
+
+    def test_gzip(self):
+        response = self._client().get('/large', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.text == self.body
+
+
+    def test_small_responses_are_not_compressed(self):
+        response = self._client().get('/small', headers={'Accept-Encoding': 'gzip'})
+
+        assert 'content-encoding' not in response.headers
+
+
+    def test_brotli_unavailable_falls_back_to_gzip(self):
+        with patch.object(compression, 'brotli', None):
+            response = self._client().get('/large', headers={'Accept-Encoding': 'br, gzip'})
+
+        assert response.headers['content-encoding'] == 'gzip'
+
+
+    def test_brotli(self):
+        brotli = pytest.importorskip('brotli')
+
+        with self._client().stream('GET', '/large', headers={'Accept-Encoding': 'br'}) as response:
+            raw = b''.join(response.iter_raw())
+
+        assert response.headers['content-encoding'] == 'br'
+        assert brotli.decompress(raw).decode() == self.body
+        assert len(raw) < len(gzip.compress(self.body.encode()))
+
+
+    def test_brotli_streamed_response(self):
+        brotli = pytest.importorskip('brotli')
+
+        with self._client().stream('GET', '/stream', headers={'Accept-Encoding': 'br'}) as response:
+            raw = b''.join(response.iter_raw())
+
+        assert response.headers['content-encoding'] == 'br'
+        assert response.headers['vary'] == 'Accept-Encoding'
+        assert 'content-length' not in response.headers
+        assert brotli.decompress(raw).decode() == self.body * 3
+
+
+    def test_brotli_passes_through_uncompressible_responses(self):
+        pytest.importorskip('brotli')
+        client = self._client()
+
+        for path in ['/small', '/encoded', '/events']:
+            with client.stream('GET', path, headers={'Accept-Encoding': 'br'}) as response:
+                raw = b''.join(response.iter_raw())
+
+            assert response.headers.get('content-encoding') in (None, 'identity'), path
+            assert raw.decode() in ('ok', self.body), path
@@ -0,0 +1,165 @@
+import heapq
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from fastapi import status
+import numpy as np
+import pytest
+
+from app.cache import MemoryCacheBackend
+from app.main import app
+from app.routing import (
+    InvalidCoordinatesError, LocalRoutingBackend, RoadGraph, RouteNotFoundError, RoutingBackend, parse_coordinates
+)
+from app.utils.geometry import decode_route_geometry
+
+GRAPH_PATH = Path(__file__).resolve().parents[2] / 'data' / 'cycling_network_sample.json'
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope='module')
+def graph():
+    return RoadGraph.load(GRAPH_PATH)
+
+
+def _dijkstra_distance(graph, source, target):
+    best = {source: 0.0}
+    queue = [(0.0, source)]
+    while queue:
+        distance, node = heapq.heappop(queue)
+        if node == target:
+            return distance
+        if distance > best[node]:
+            continue
+        for edge in range(graph.indptr[node], graph.indptr[node + 1]):
+            neighbour = int(graph.indices[edge])
+            candidate = distance + graph.lengths_m[edge]
+            if candidate < best.get(neighbour, np.inf):
+                best[neighbour] = candidate
+                heapq.heappush(queue, (candidate, neighbour))
+    return None
+
+
+def _path_length(graph, path):
+    return sum(graph.lengths_m[graph.edge_between(u, v)] for u, v in zip(path[:-1], path[1:]))
+
+
+def _as_param(graph, node):
+    lon, lat = graph.coords[node]
+    return f'{lat},{lon}'
+
+
+class TestRoadGraph:
+    def test_csr_layout(self, graph):
+        assert len(graph.indptr) == graph.node_count + 1
+        assert graph.indptr[-1] == len(graph.indices) == len(graph.lengths_m)
+        assert np.all(np.diff(graph.indptr) >= 0)
+
+
+    def test_edges_are_bidirectional(self, graph):
+        for node in range(graph.node_count):
+            for neighbour in graph.indices[graph.indptr[node]:graph.indptr[node + 1]]:
+                assert node in graph.indices[graph.indptr[neighbour]:graph.indptr[neighbour + 1]]
+
+
+    def test_oneway_edges(self):
+        graph = RoadGraph([[103.85, 1.28], [103.851, 1.28]], edges=[], oneway=[[0, 1]])
+
+        assert graph.shortest_path(0, 1) == [0, 1]
+        assert graph.shortest_path(1, 0) is None
+
+
+    def test_invalid_edge_raises_error(self):
+        with pytest.raises(ValueError):
+            RoadGraph([[103.85, 1.28]], edges=[[0, 1]])
+
+
+    def test_shortest_path_matches_dijkstra(self, graph):
+        rng = np.random.default_rng(0)
+        connected = [node for node in range(graph.node_count) if graph.names[graph.name_ids[graph.indptr[node]]] != 'ISOLATED PATH']
+
+        for source, target in rng.choice(connected, size=(20, 2)):
+            path = graph.shortest_path(int(source), int(target))
+
+            assert path[0] == source and path[-1] == target
+            assert _path_length(graph, path) == pytest.approx(_dijkstra_distance(graph, int(source), int(target)))
+
+
+    def test_nearest_node(self, graph):
+        lon, lat = graph.coords[7]
+        node, distance_m = graph.nearest_node(lon + 0.0001, lat)
+
+        assert node == 7
+        assert distance_m == pytest.approx(11.1, abs=0.5)
+
+
+class TestRoutingBackend:
+    def test_backend_without_route_cannot_be_created(self):
+        class NamedBackend(RoutingBackend):
+            name = 'named'
+
+        with pytest.raises(TypeError):
+            NamedBackend()
+
+
+class TestParseCoordinates:
+    def test_range_limits_accepted(self):
+        assert parse_coordinates('-90,180') == (-90.0, 180.0)
+        assert parse_coordinates('90,-180') == (90.0, -180.0)
+
+
+    def test_non_finite_and_out_of_range_rejected(self):
+        for value in ['nan,103.8', '1.3,nan', 'inf,103.8', '1.3,-inf', '90.1,103.8', '-91,103.8', '1.3,180.5', '1.3,-181']:
+            with pytest.raises(InvalidCoordinatesError):
+                parse_coordinates(value)
+
+
+class TestLocalRoutingBackend:
+    def test_route_matches_onemap_format(self, graph):
+        backend = LocalRoutingBackend(graph)
+        route = backend.route_sync(_as_param(graph, 0), _as_param(graph, 35))
+
+        coords, distances = decode_route_geometry(route['route_geometry'])
+        assert tuple(coords[0]) == pytest.approx(tuple(graph.coords[0]))
+        assert tuple(coords[-1]) == pytest.approx(tuple(graph.coords[35]))
+        assert route['route_summary']['total_distance'] == pytest.approx(distances[-1], abs=1)
+        assert route['route_summary']['total_time'] > 0
+        assert route['route_instructions'][0][-1].startswith('Head along')
+
+
+    def test_route_avoids_missing_edges(self, graph):
+        # The direct street between these nodes is absent from the network, forcing a detour
+        backend = LocalRoutingBackend(graph)
+        route = backend.route_sync(_as_param(graph, 13), _as_param(graph, 14))
+
+        assert route['route_summary']['total_distance'] > 300
+
+
+    def test_disconnected_points_raise_error(self, graph):
+        backend = LocalRoutingBackend(graph)
+
+        with pytest.raises(RouteNotFoundError):
+            backend.route_sync(_as_param(graph, 0), _as_param(graph, 36))
+
+
+    def test_point_far_from_network_raises_error(self, graph):
+        backend = LocalRoutingBackend(graph)
+
+        with pytest.raises(RouteNotFoundError):
+            backend.route_sync('1.35,103.9', _as_param(graph, 0))
+
+
+    def test_routes_endpoint_with_local_backend(self, graph):
+        with (
+            patch('app.versions.v1.get_routing_backend', return_value=LocalRoutingBackend(graph)),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', return_value=[])
+        ):
+            response = client.get('/api/v1/routes', params={'start': _as_param(graph, 0), 'end': _as_param(graph, 35)})
+            not_found_response = client.get('/api/v1/routes', params={'start': _as_param(graph, 0), 'end': _as_param(graph, 36)})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[0]['route_summary']['start_point'] != 'N/A'
+        assert not_found_response.status_code == status.HTTP_404_NOT_FOUND
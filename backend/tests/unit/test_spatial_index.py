@@ -0,0 +1,138 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.utils.parking import _query_nearest_parking_spots
+from app.utils.spatial_index import ParkingSpotIndex, _haversine_m
+
+
+def _make_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lons = rng.uniform(103.62, 104.0, n)
+    lats = rng.uniform(1.24, 1.46, n)
+    return [
+        (i, f"SPOT {i}", float(lon), float(lat), "Racks", 10, "Y")
+        for i, (lon, lat) in enumerate(zip(lons, lats), 1)
+    ]
+
+
+def _brute_force_nearest(rows, coord, radius_m):
+    spots_rad = np.radians([(row[2], row[3]) for row in rows])
+    query_rad = np.radians([coord] * len(rows))
+    dists = _haversine_m(query_rad, spots_rad)
+    idx = dists.argmin()
+    return (rows[idx][0], dists[idx]) if dists[idx] <= radius_m else None
+
+
+class TestParkingSpotIndex:
+    def test_matches_brute_force(self):
+        rows = _make_rows(2000)
+        index = ParkingSpotIndex()
+        index.build(rows)
+
+        rng = np.random.default_rng(1)
+        coords = [
+            (float(lon), float(lat))
+            for lon, lat in zip(rng.uniform(103.6, 104.02, 200), rng.uniform(1.22, 1.48, 200))
+        ]
+
+        for radius_m in (500, 1000):
+            results = index.query_nearest(coords, radius_m)
+            assert len(results) == len(coords)
+
+            for coord, result in zip(coords, results):
+                expected = _brute_force_nearest(rows, coord, radius_m)
+                if expected is None:
+                    assert result is None
+                else:
+                    assert result["id"] == expected[0]
+                    assert result["deviation"] == pytest.approx(expected[1])
+
+
+    def test_query_within_matches_brute_force(self):
+        rows = _make_rows(2000)
+        index = ParkingSpotIndex()
+        index.build(rows)
+
+        coords = [(103.7 + 0.002 * i, 1.3 + 0.001 * i) for i in range(50)]
+        results = index.query_within(coords, 700)
+
+        spots_rad = np.radians([(row[2], row[3]) for row in rows])
+        closest = np.min([_haversine_m(spots_rad, np.radians([coord])) for coord in coords], axis=0)
+        expected = {row[0]: distance for row, distance in zip(rows, closest) if distance <= 700}
+
+        assert {result["id"] for result in results} == set(expected)
+        for result in results:
+            assert result["deviation"] == pytest.approx(expected[result["id"]])
+
+
+    def test_result_shape(self):
+        index = ParkingSpotIndex()
+        index.build([(7, "BUS STOP 12345", 103.68437, 1.35489, "Yellow Box", 4, "N")])
+
+        result = index.query_nearest([(103.68437, 1.35589)], 500)[0]
+
+        assert result == {
+            "id": 7,
+            "description": "BUS STOP 12345",
+            "coord": (103.68437, 1.35489),
+            "rack_type": "Yellow Box",
+            "rack_count": 4,
+            "shelter_indicator": "N",
+            "deviation": pytest.approx(111.2, abs=0.5)
+        }
+
+
+    def test_no_spot_within_radius(self):
+        index = ParkingSpotIndex()
+        index.build([(1, "SPOT 1", 103.68437, 1.35489, "Racks", 10, "Y")])
+
+        assert index.query_nearest([(103.80437, 1.35489)], 1000) == [None]
+
+
+    def test_empty_index(self):
+        index = ParkingSpotIndex()
+        index.build([])
+
+        assert index.loaded
+        assert index.query_nearest([(103.68437, 1.35489)], 1000) == [None]
+
+
+    def test_unloaded_index_raises_error(self):
+        with pytest.raises(RuntimeError):
+            ParkingSpotIndex().query_nearest([(103.68437, 1.35489)], 1000)
+
+
+    def test_reload_only_when_version_changes(self):
+        index = ParkingSpotIndex()
+        index.build(_make_rows(10), version=1)
+
+        with (
+            patch('app.utils.spatial_index.fetch_parking_spots_version', return_value=1),
+            patch.object(index, 'load') as mock_load
+        ):
+            assert index.reload_if_stale() is False
+            mock_load.assert_not_called()
+
+        with (
+            patch('app.utils.spatial_index.fetch_parking_spots_version', return_value=2),
+            patch.object(index, 'load') as mock_load
+        ):
+            assert index.reload_if_stale() is True
+            mock_load.assert_called_once()
+
+
+    def test_parking_lookup_skips_database(self):
+        index = ParkingSpotIndex()
+        index.build([(1, "SPOT 1", 103.68437, 1.35489, "Racks", 10, "Y")])
+
+        with (
+            patch('app.utils.parking.get_parking_spot_index', return_value=index),
+            patch('app.utils.parking.execute_query') as mock_execute_query
+        ):
+            results = _query_nearest_parking_spots([(103.68437, 1.35589), (103.80437, 1.35489)])
+
+        mock_execute_query.assert_not_called()
+        assert results[0]["id"] == 1
+        assert results[1] is None
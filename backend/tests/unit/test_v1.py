@@ -1,14 +1,29 @@
-from unittest.mock import MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from fastapi.testclient import TestClient
 from fastapi import status
+import httpx
+from psycopg_pool import PoolTimeout
 
+from app.cache import MemoryCacheBackend, SearchCache
 from app.main import app
+from app.onemap import TokenUnavailableError
 
 client = TestClient(app)
 prefix = '/api/v1'
 
 
+def mock_http_client(json_data):
+    mock_response = MagicMock()
+    mock_response.json = MagicMock(return_value=json_data)
+    mock_response.status_code = 200
+
+    mock_client = MagicMock()
+    mock_client.get = AsyncMock(return_value=mock_response)
+    return mock_client
+
+
 class TestSearchEndpoint:
     def test_valid_search(self):
         mock_api_response = {
@@ -28,15 +43,79 @@ class TestSearchEndpoint:
             ]
         }
 
-        with patch('requests.get') as mock_get:
-            mock_get.return_value.json = MagicMock(return_value=mock_api_response)
-            mock_get.return_value.status_code = 200
+        mock_client = mock_http_client(mock_api_response)
 
+        with (
+            patch('app.versions.v1.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_search_cache', return_value=SearchCache(maxsize=8, ttl_s=60))
+        ):
             response = client.get(f'{prefix}/search', params={'searchVal': 'EAST COAST PARK OFFICE', 'pageNum': 1})
 
             assert response.status_code == status.HTTP_200_OK
             assert response.json() == mock_api_response['results']
-            mock_get.assert_called_once()
+            mock_client.get.assert_awaited_once()
+
+
+    def test_search_cache_hit(self):
+        mock_client = mock_http_client({'found': 0, 'totalNumPages': 0, 'pageNum': 1, 'results': []})
+
+        with (
+            patch('app.versions.v1.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_search_cache', return_value=SearchCache(maxsize=8, ttl_s=60))
+        ):
+            first_response = client.get(f'{prefix}/search', params={'searchVal': 'Bedok'})
+            second_response = client.get(f'{prefix}/search', params={'searchVal': 'bedok '})
+
+            assert first_response.headers['X-Cache'] == 'MISS'
+            assert second_response.headers['X-Cache'] == 'HIT'
+            mock_client.get.assert_awaited_once()
+
+
+    def test_identical_concurrent_searches_cached_once(self):
+        mock_client = mock_http_client({'found': 0, 'totalNumPages': 0, 'pageNum': 1, 'results': []})
+        onemap_response = mock_client.get.return_value
+        search_cache = SearchCache(maxsize=8, ttl_s=60)
+
+        async def slow_get(*args, **kwargs):
+            await asyncio.sleep(0.05)  # Keep the first call in flight while the others arrive
+            return onemap_response
+
+        mock_client.get = AsyncMock(side_effect=slow_get)
+
+        async def send_requests():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as async_client:
+                return await asyncio.gather(*(
+                    async_client.get(f'{prefix}/search', params={'searchVal': 'MARINA BAY', 'pageNum': 1})
+                    for _ in range(5)
+                ))
+
+        with (
+            patch('app.versions.v1.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_search_cache', return_value=search_cache),
+            patch.object(search_cache, 'set', wraps=search_cache.set) as mock_set
+        ):
+            responses = asyncio.run(send_requests())
+
+            assert all(response.status_code == status.HTTP_200_OK for response in responses)
+            mock_client.get.assert_awaited_once()
+            mock_set.assert_called_once()
+
+
+    def test_search_token_unavailable(self):
+        with (
+            patch('app.versions.v1.get_search_cache', return_value=SearchCache(maxsize=8, ttl_s=60)),
+            patch(
+                'app.versions.v1.ApiKeyManager.get_api_key_async',
+                side_effect=TokenUnavailableError('Failed to fetch OneMap token: unreachable')
+            )
+        ):
+            response = client.get(f'{prefix}/search', params={'searchVal': 'TOKEN OUTAGE', 'pageNum': 1})
+
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
 
 
     def test_search_missing_searchVal(self):
@@ -86,13 +165,14 @@ class TestRoutesEndpoint:
             'parking_spots': mock_parking_spots
         }
 
+        mock_client = mock_http_client(mock_onemap_response)
+
         with (
-            patch('requests.get') as mock_get,
-            patch('app.versions.v1.find_parking_spots_along_route') as mock_find_parking,
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.find_parking_spots_along_route_async') as mock_find_parking,
             patch('app.versions.v1.transform_route_data') as mock_transform_data
         ):
-            mock_get.return_value.json = MagicMock(return_value=mock_onemap_response)
-            mock_get.return_value.status_code = 200
             mock_find_parking.return_value = mock_parking_spots
             mock_transform_data.return_value = mock_transformed_data
 
@@ -102,6 +182,233 @@ class TestRoutesEndpoint:
             })
 
             assert response.status_code == status.HTTP_200_OK
-            mock_get.assert_called_once()
-            mock_find_parking.assert_called()  # To find the parking spots for a given route
+            mock_client.get.assert_awaited_once()
+            mock_find_parking.assert_awaited()  # To find the parking spots for a given route
             mock_transform_data.assert_called()  # To transform the route data into the expected format
+
+
+    def test_routes_cache_hit(self):
+        mock_onemap_response = {
+            'route_geometry': '_p~iF~ps|U_ulLnnqC',
+            'route_instructions': [],
+            'route_summary': {
+                'start_point': 'Start Point',
+                'end_point': 'End Point',
+                'total_time': 1800,
+                'total_distance': 5000
+            }
+        }
+        mock_client = mock_http_client(mock_onemap_response)
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', return_value=[])
+        ):
+            params = {'start': '1.29443,103.87253', 'end': '1.31344,103.95781', 'intervalMins': 20}
+            first_response = client.get(f'{prefix}/routes', params=params)
+            second_response = client.get(f'{prefix}/routes', params=params)
+
+            assert first_response.status_code == status.HTTP_200_OK
+            assert first_response.headers['X-Cache'] == 'MISS'
+            assert second_response.status_code == status.HTTP_200_OK
+            assert second_response.headers['X-Cache'] == 'HIT'
+            assert second_response.json() == first_response.json()
+            mock_client.get.assert_awaited_once()  # Second request is served without calling OneMap
+
+
+    def test_routes_processed_concurrently(self):
+        def make_route(total_time):
+            return {
+                'route_geometry': '_p~iF~ps|U_ulLnnqC',
+                'route_instructions': [],
+                'route_summary': {
+                    'start_point': 'Start Point',
+                    'end_point': 'End Point',
+                    'total_time': total_time,
+                    'total_distance': 5000
+                }
+            }
+
+        mock_onemap_response = {
+            **make_route(1800),
+            'alternativeroute': [make_route(1200), make_route(2400)]
+        }
+        mock_client = mock_http_client(mock_onemap_response)
+
+        # Every route's parking search waits until all three have started, which only succeeds if they overlap
+        started = 0
+        all_started = asyncio.Event()
+
+        async def find_parking(route, interval_mins, **kwargs):
+            nonlocal started
+            started += 1
+            if started == 3:
+                all_started.set()
+            await asyncio.wait_for(all_started.wait(), timeout=1)
+            return []
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', side_effect=find_parking)
+        ):
+            response = client.get(f'{prefix}/routes', params={'start': '1.3,103.8', 'end': '1.31,103.9'})
+
+            assert response.status_code == status.HTTP_200_OK
+            assert [route['route_summary']['total_time_s'] for route in response.json()] == [1200, 1800, 2400]
+
+
+    def test_identical_concurrent_routes_share_one_computation(self):
+        mock_onemap_response = {
+            'route_geometry': '_p~iF~ps|U_ulLnnqC',
+            'route_instructions': [],
+            'route_summary': {
+                'start_point': 'Start Point',
+                'end_point': 'End Point',
+                'total_time': 1800,
+                'total_distance': 5000
+            }
+        }
+        mock_client = mock_http_client(mock_onemap_response)
+        onemap_response = mock_client.get.return_value
+
+        async def slow_get(*args, **kwargs):
+            await asyncio.sleep(0.05)  # Keep the first call in flight while the others arrive
+            return onemap_response
+
+        mock_client.get = AsyncMock(side_effect=slow_get)
+
+        async def send_requests():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as async_client:
+                return await asyncio.gather(*(
+                    async_client.get(f'{prefix}/routes', params={'start': '1.3,103.8', 'end': '1.31,103.9'})
+                    for _ in range(5)
+                ))
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', return_value=[])
+        ):
+            responses = asyncio.run(send_requests())
+
+            assert all(response.status_code == status.HTTP_200_OK for response in responses)
+            assert len({response.text for response in responses}) == 1
+            mock_client.get.assert_awaited_once()
+
+
+    def test_nearby_concurrent_routes_computed_separately(self):
+        mock_client = mock_http_client({})
+
+        async def slow_get(url, *args, **kwargs):
+            await asyncio.sleep(0.05)  # Keep the first call in flight while the second arrives
+            start = url.split('start=')[1].split('&')[0]
+            response = MagicMock()
+            response.json = MagicMock(return_value={
+                'route_geometry': '_p~iF~ps|U_ulLnnqC',
+                'route_instructions': [],
+                'route_summary': {'start_point': start, 'end_point': 'End Point', 'total_time': 1800, 'total_distance': 5000}
+            })
+            return response
+
+        mock_client.get = AsyncMock(side_effect=slow_get)
+        starts = ['1.30001,103.80001', '1.30002,103.80002']  # Same ~55 m cache grid cell
+
+        async def send_requests():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as async_client:
+                return await asyncio.gather(*(
+                    async_client.get(f'{prefix}/routes', params={'start': start, 'end': '1.31,103.9'})
+                    for start in starts
+                ))
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_client),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', return_value=[])
+        ):
+            responses = asyncio.run(send_requests())
+
+            assert mock_client.get.await_count == 2
+            assert [response.json()[0]['route_summary']['start_point'] for response in responses] == starts
+
+
+    def test_routes_with_corridor(self):
+        mock_onemap_response = {
+            'route_geometry': '_p~iF~ps|U_ulLnnqC',
+            'route_instructions': [],
+            'route_summary': {'start_point': 'Start Point', 'end_point': 'End Point', 'total_time': 1800, 'total_distance': 5000}
+        }
+        corridor_spots = [
+            {'id': 1, 'coord': (103.8, 1.3), 'deviation': 20.0, 'along_route_m': 150.0},
+            {'id': 2, 'coord': (103.9, 1.31), 'deviation': 310.0, 'along_route_m': 4200.0}
+        ]
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_http_client(mock_onemap_response)),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch('app.versions.v1.find_parking_spots_along_route_async', return_value=[]),
+            patch('app.versions.v1.find_parking_spots_in_corridor_async', return_value=corridor_spots) as mock_corridor
+        ):
+            response = client.get(f'{prefix}/routes', params={'start': '1.3,103.8', 'end': '1.31,103.9', 'corridorM': 400})
+            too_wide_response = client.get(f'{prefix}/routes', params={'start': '1.3,103.8', 'end': '1.31,103.9', 'corridorM': 5000})
+
+            assert response.status_code == status.HTTP_200_OK
+            assert mock_corridor.await_args[0][1] == 400
+            route = response.json()[0]
+            assert route['parking_spots'] == []
+            assert [spot['along_route_m'] for spot in route['corridor_parking_spots']] == [150.0, 4200.0]
+            assert too_wide_response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+    def test_routes_pool_timeout_fails_fast(self):
+        mock_onemap_response = {
+            'route_geometry': '_p~iF~ps|U_ulLnnqC',
+            'route_instructions': [],
+            'route_summary': {'start_point': 'Start Point', 'end_point': 'End Point', 'total_time': 1800, 'total_distance': 5000}
+        }
+
+        with (
+            patch('app.routing.get_http_client', return_value=mock_http_client(mock_onemap_response)),
+            patch('app.versions.v1.ApiKeyManager.get_api_key_async', return_value='token'),
+            patch('app.versions.v1.get_route_cache', return_value=MemoryCacheBackend(maxsize=8, ttl_s=60)),
+            patch(
+                'app.versions.v1.find_parking_spots_along_route_async',
+                side_effect=PoolTimeout("couldn't get a connection after 5.00 sec")
+            )
+        ):
+            response = client.get(f'{prefix}/routes', params={'start': '1.3,103.8', 'end': '1.31,103.9'})
+
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response.headers['Retry-After'] == '1'
+            assert 'trace' not in response.json()
+
+
+    def test_routes_invalid_coordinates(self):
+        mock_client = mock_http_client({})
+
+        with patch('app.routing.get_http_client', return_value=mock_client):
+            response = client.get(f'{prefix}/routes', params={'start': '1.3;103.8', 'end': '1.31,103.9'})
+
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+            assert 'trace' not in response.json()
+            mock_client.get.assert_not_called()
+
+
+    def test_routes_out_of_range_coordinates(self):
+        mock_client = mock_http_client({})
+
+        with patch('app.routing.get_http_client', return_value=mock_client):
+            for start in ['nan,103.8', '1.3,inf', '-inf,103.8', '91,103.8', '1.3,-181']:
+                response = client.get(f'{prefix}/routes', params={'start': start, 'end': '1.31,103.9'})
+
+                assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT, start
+
+            mock_client.get.assert_not_called()
@@ -16,10 +16,40 @@ CREATE TABLE IF NOT EXISTS parking_spots (
     coordinates GEOMETRY(POINT, 4326) NOT NULL,
     rack_type VARCHAR(20),
     rack_count INT,
-    shelter_indicator VARCHAR(1)
+    shelter_indicator VARCHAR(1),
+    fingerprint CHAR(32),  -- Digest of the source record, see `scripts/parking_records.py`
+    geog GEOGRAPHY(POINT, 4326) GENERATED ALWAYS AS (coordinates::geography) STORED  -- For distances in meters
 );
 
 -- For quicker nearest-neighbor searches
 CREATE INDEX coordinates_idx
 ON parking_spots
 USING GIST (coordinates);
+
+-- Lets meter-based searches (`ST_DWithin`, `<->` ordering) use an index instead of casting every row
+CREATE INDEX IF NOT EXISTS parking_spots_geog_idx
+ON parking_spots
+USING GIST (geog);
+
+-- Single row tracking the loaded parking spots data, bumped by the loader whenever rows change
+CREATE TABLE IF NOT EXISTS parking_spots_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    snapshot_fingerprint TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO parking_spots_version (id)
+VALUES (TRUE)
+ON CONFLICT (id) DO NOTHING;
+
+-- Route responses shared by every API worker, see `ROUTE_CACHE_BACKEND`
+CREATE UNLOGGED TABLE IF NOT EXISTS route_cache (
+    key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    accessed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS route_cache_accessed_at_idx
+ON route_cache (accessed_at);